@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sqlalchemy import text
+
+from app import views
+from app.models import UploadedFile
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    """Stands in for ChatOpenAI with a fixed round-trip time, sync and async"""
+
+    def __init__(self, schema: str, latency: float):
+        self.answer = f"ACTION: QUERY\nSQL: SELECT region, sum(amount) FROM {schema}.sales GROUP BY region"
+        self.latency = latency
+        self.words = ("Sales", " are", " highest", " in", " the", " north.")
+
+    def invoke(self, prompt):
+        time.sleep(self.latency)
+        return FakeMessage(self.answer)
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self.answer)
+
+    def stream(self, prompt):
+        for word in self.words:
+            time.sleep(self.latency / len(self.words))
+            yield FakeMessage(word)
+
+    async def astream(self, prompt):
+        for word in self.words:
+            await asyncio.sleep(self.latency / len(self.words))
+            yield FakeMessage(word)
+
+
+class Command(BaseCommand):
+    help = (
+        "Answer many concurrent questions against a fake LLM, once on a pool "
+        "of threads like a WSGI worker and once on one event loop, and "
+        "compare throughput, latency and threads used"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=200)
+        parser.add_argument(
+            "--threads", type=int, default=16, help="threads of the sync worker"
+        )
+        parser.add_argument(
+            "--latency", type=float, default=1.0, help="seconds per LLM call"
+        )
+        parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+
+    def handle(self, *args, **options):
+        schema = f"bench_{uuid.uuid4().hex[:8]}"
+        dataset = UploadedFile(id=uuid.uuid4(), schema_name=schema)
+        engine = views.get_engine()
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE SCHEMA {schema}"))
+            conn.execute(text(f"CREATE TABLE {schema}.sales (region text, amount numeric)"))
+            conn.execute(
+                text(
+                    f"INSERT INTO {schema}.sales "
+                    "SELECT (ARRAY['north','south','east','west'])[1 + i % 4], i "
+                    "FROM generate_series(1, 1000) AS i"
+                )
+            )
+
+        # Measure the serving path, not the provider quota or cached SQL
+        settings.QUESTION_CACHE_ENABLED = False
+        scheduler = views.llm_scheduler
+        scheduler.limiter = views.TokenBucketLimiter(
+            "benchmark", 1e9, 1e9, views.MemoryBucketStore()
+        )
+        scheduler.max_active = scheduler.max_depth = options["questions"] * 3
+        llm = FakeLLM(schema, options["latency"])
+
+        def make_agent():
+            agent = views.ConversationalSQLAgent(
+                settings.DATABASE_URL, "benchmark", str(uuid.uuid4()), dataset
+            )
+            agent.llm = llm
+            return agent
+
+        agents = [make_agent() for _ in range(options["questions"])]
+        try:
+            if options["mode"] in ("sync", "both"):
+                self.report("sync", self.run_sync(agents, options["threads"]))
+            if options["mode"] in ("async", "both"):
+                self.report("async", asyncio.run(self.run_async(agents)))
+        finally:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+                conn.execute(
+                    text(
+                        "DELETE FROM chat_message_history WHERE session_id = ANY(CAST(:ids AS uuid[]))"
+                    ),
+                    {"ids": [agent.session_id for agent in agents]},
+                )
+            views.ChatHistory.objects.filter(
+                session_id__in=[agent.session_id for agent in agents]
+            ).delete()
+
+    def run_sync(self, agents, threads):
+        peak = PeakThreads()
+
+        def ask(agent):
+            started = time.monotonic()
+            events = list(agent.stream_query_with_conversation("total sales by region"))
+            return time.monotonic() - started, events[-1]["type"] == "complete"
+
+        started = time.monotonic()
+        with peak, ThreadPoolExecutor(max_workers=threads) as pool:
+            outcomes = list(pool.map(ask, agents))
+        return time.monotonic() - started, outcomes, peak.value
+
+    async def run_async(self, agents):
+        peak = PeakThreads()
+
+        async def ask(agent):
+            started = time.monotonic()
+            last = None
+            # Django's ASGI handler gives each request its own context like this
+            async with ThreadSensitiveContext():
+                async for event in agent.astream_query_with_conversation(
+                    "total sales by region"
+                ):
+                    last = event
+            return time.monotonic() - started, last["type"] == "complete"
+
+        started = time.monotonic()
+        try:
+            with peak:
+                outcomes = await asyncio.gather(*(ask(agent) for agent in agents))
+        finally:
+            await views.close_loop_resources()
+        return time.monotonic() - started, outcomes, peak.value
+
+    def report(self, mode, run):
+        elapsed, outcomes, peak_threads = run
+        latencies = sorted(latency for latency, _ in outcomes)
+        answered = sum(1 for _, ok in outcomes if ok)
+        self.stdout.write(
+            f"{mode:>5}: {answered}/{len(outcomes)} answered in {elapsed:.1f}s "
+            f"({len(outcomes) / elapsed:.1f} questions/s), "
+            f"latency p50 {latencies[len(latencies) // 2]:.2f}s "
+            f"p95 {latencies[int(len(latencies) * 0.95)]:.2f}s, "
+            f"peak threads {peak_threads}"
+        )
+
+
+class PeakThreads:
+    """Samples the live thread count while the block runs"""
+
+    def __enter__(self):
+        self.value = threading.active_count()
+        self.stop = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        return self
+
+    def sample(self):
+        while not self.stop.wait(0.05):
+            self.value = max(self.value, threading.active_count())
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.sampler.join()
@@ -0,0 +1,107 @@
+import threading
+import time
+import uuid
+
+import psycopg
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from langchain_core.messages import AIMessage, HumanMessage
+from sqlalchemy import make_url
+
+from app.views import CHAT_HISTORY_TABLE, PooledChatMessageHistory, chat_memory_pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive sustained chat-memory traffic and check that the number of "
+        "Postgres connections stays flat"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=32)
+        parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+        parser.add_argument("--sessions", type=int, default=50)
+        parser.add_argument(
+            "--sample-interval", type=float, default=0.5, help="seconds"
+        )
+
+    def handle(self, *args, **options):
+        conninfo = (
+            make_url(settings.DATABASE_URL)
+            .set(drivername="postgresql")
+            .render_as_string(hide_password=False)
+        )
+        session_ids = [str(uuid.uuid4()) for _ in range(options["sessions"])]
+        stop = threading.Event()
+        counters = {"requests": 0, "errors": 0}
+        counters_lock = threading.Lock()
+
+        def worker(worker_index):
+            i = worker_index
+            while not stop.is_set():
+                history = PooledChatMessageHistory(session_ids[i % len(session_ids)])
+                try:
+                    # Same pattern as one conversational question
+                    history.messages
+                    history.add_user_message(f"question {i}")
+                    history.add_ai_message(f"answer {i}")
+                    with counters_lock:
+                        counters["requests"] += 1
+                except Exception as e:
+                    with counters_lock:
+                        counters["errors"] += 1
+                    self.stderr.write(f"Request failed: {e}")
+                i += options["threads"]
+
+        with psycopg.connect(conninfo, autocommit=True) as observer:
+
+            def backend_count():
+                return observer.execute(
+                    """
+                    SELECT count(*) FROM pg_stat_activity
+                    WHERE datname = current_database() AND pid <> pg_backend_pid()
+                    """
+                ).fetchone()[0]
+
+            baseline = backend_count()
+            samples = []
+            threads = [
+                threading.Thread(target=worker, args=(n,), daemon=True)
+                for n in range(options["threads"])
+            ]
+            started = time.time()
+            for thread in threads:
+                thread.start()
+            try:
+                while time.time() - started < options["duration"]:
+                    time.sleep(options["sample_interval"])
+                    samples.append(backend_count())
+            finally:
+                stop.set()
+                for thread in threads:
+                    thread.join()
+            elapsed = time.time() - started
+
+            observer.execute(
+                f"DELETE FROM {CHAT_HISTORY_TABLE} WHERE session_id = ANY(%s::uuid[])",
+                (session_ids,),
+            )
+
+        peak = max(samples) if samples else baseline
+        half = len(samples) // 2
+        first_half = max(samples[:half], default=peak)
+        second_half = max(samples[half:], default=peak)
+        self.stdout.write(
+            f"{counters['requests']} requests ({counters['requests'] / elapsed:.0f}/s), "
+            f"{counters['errors']} errors, {options['threads']} threads"
+        )
+        self.stdout.write(
+            f"Connections: baseline {baseline}, peak {peak}, "
+            f"peak in first half {first_half}, peak in second half {second_half}"
+        )
+        self.stdout.write(f"Pool stats: {chat_memory_pool.stats()}")
+
+        max_size = getattr(settings, "CHAT_MEMORY_POOL_MAX_SIZE", 10)
+        if peak - baseline > max_size or second_half > first_half:
+            raise CommandError("Connection count grew under sustained load")
+        self.stdout.write(self.style.SUCCESS("Connection count stayed flat"))
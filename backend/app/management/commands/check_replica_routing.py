@@ -0,0 +1,93 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sqlalchemy import make_url, text
+
+from app.models import UploadedFile
+from app.views import (
+    create_dataset_schema,
+    current_wal_lsn,
+    dataset_schema_name,
+    drop_dataset_schema,
+    get_engine,
+    parse_lsn,
+    replica_router,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Report replica lag and check that reads of a freshly written dataset "
+        "stay on the primary until a replica has replayed it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=10.0,
+            help="seconds to wait for a replica to catch up",
+        )
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, "DATABASE_REPLICA_URLS", [])
+        if not replicas:
+            raise CommandError("DATABASE_REPLICA_URLS is not set")
+
+        primary = get_engine()
+        primary_lsn = parse_lsn(current_wal_lsn(primary))
+        for url in replicas:
+            name = make_url(url).render_as_string(hide_password=True)
+            with get_engine(url).connect() as conn:
+                in_recovery, replayed = conn.execute(
+                    text("SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text")
+                ).one()
+            lag = primary_lsn - parse_lsn(replayed) if replayed else None
+            self.stdout.write(
+                f"{name}: in recovery {in_recovery}, "
+                f"replay lag {lag if lag is not None else 'n/a'} bytes"
+            )
+
+        # Write a dataset on the primary, then read it the way a question
+        # asked right after the upload would
+        schema = dataset_schema_name(uuid.uuid4())
+        create_dataset_schema(primary, schema)
+        try:
+            with primary.begin() as conn:
+                conn.execute(text(f'CREATE TABLE "{schema}".probe AS SELECT 1 AS id'))
+            dataset = UploadedFile(schema_name=schema, written_lsn=current_wal_lsn(primary))
+
+            started = time.monotonic()
+            primary_reads = 0
+            while True:
+                url = replica_router.read_url(dataset)
+                with get_engine(url).connect() as conn:
+                    visible = conn.execute(
+                        text("SELECT to_regclass(:table) IS NOT NULL"),
+                        {"table": f'"{schema}".probe'},
+                    ).scalar()
+                if not visible:
+                    raise CommandError(
+                        f"Read routed to {make_url(url).render_as_string(hide_password=True)} "
+                        "before it had the new dataset"
+                    )
+                if url != settings.DATABASE_URL:
+                    break
+                primary_reads += 1
+                if time.monotonic() - started > options["timeout"]:
+                    raise CommandError(
+                        f"No replica caught up within {options['timeout']:g}s; "
+                        f"{primary_reads} read(s) stayed on the primary"
+                    )
+                time.sleep(0.05)
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Read-your-writes held: {primary_reads} read(s) on the primary, "
+                    f"then a replica after {(time.monotonic() - started) * 1000:.0f} ms"
+                )
+            )
+        finally:
+            drop_dataset_schema(primary, schema)
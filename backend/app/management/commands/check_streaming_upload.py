@@ -0,0 +1,57 @@
+import uuid
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from sqlalchemy import text
+
+from app.views import (
+    BulkTableLoader,
+    create_dataset_schema,
+    dataset_schema_name,
+    drop_dataset_schema,
+    get_engine,
+    stream_csv_to_database,
+)
+
+# Three blocks titled "Sales": two with rows around one with only a header
+REPEATED_TITLES_CSV = (
+    b"Sales,\nregion,amount\nN,1\nS,2\n,\n"
+    b"Sales,\nregion,amount\n,\n"
+    b"Sales,\nregion,amount\nE,3\n"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a CSV whose tables repeat a title into a scratch schema and "
+        "check that no table replaces an earlier one"
+    )
+
+    def handle(self, *args, **options):
+        engine = get_engine()
+        schema = dataset_schema_name(uuid.uuid4())
+        create_dataset_schema(engine, schema)
+        try:
+            tables = stream_csv_to_database(
+                ContentFile(REPEATED_TITLES_CSV, name="check.csv"),
+                BulkTableLoader(engine, schema=schema),
+            )
+            with engine.connect() as conn:
+                loaded = {
+                    table: conn.execute(
+                        text(f'SELECT count(*) FROM "{schema}"."{table}"')
+                    ).scalar()
+                    for table in tables
+                }
+        finally:
+            drop_dataset_schema(engine, schema)
+
+        expected = {"check_sales": 2, "check_sales_2": 1}
+        reported = {table: info["row_count"] for table, info in tables.items()}
+        if loaded != expected or reported != expected:
+            raise CommandError(
+                f"Expected tables {expected}, loaded {loaded} (reported {reported})"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Repeated table titles kept apart: {loaded}")
+        )
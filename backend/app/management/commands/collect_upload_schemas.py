@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from app.views import collect_abandoned_datasets, get_engine
+
+
+class Command(BaseCommand):
+    help = "Drop upload dataset schemas that no session has used recently"
+
+    def handle(self, *args, **options):
+        collected = collect_abandoned_datasets(get_engine())
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Dropped {collected['datasets']} abandoned dataset(s) and "
+                f"{collected['orphans']} orphaned schema(s)"
+            )
+        )
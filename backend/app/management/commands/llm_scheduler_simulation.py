@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from app.views import (
+    LLMOverloaded,
+    LLMScheduler,
+    MemoryBucketStore,
+    RateLimited,
+    TokenBucketLimiter,
+)
+
+
+class FakeChunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    """Stands in for ChatOpenAI: fixed latency, no network"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def invoke(self, prompt):
+        time.sleep(self.latency)
+        return FakeChunk("SELECT 1")
+
+    def stream(self, prompt):
+        for word in ("Here", " are", " the", " results."):
+            time.sleep(self.latency / 4)
+            yield FakeChunk(word)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the LLM call scheduler with a fake LLM: one heavy session "
+        "hammering planning next to light interactive sessions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--per-minute", type=float, default=600)
+        parser.add_argument("--burst", type=float, default=2)
+        parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+        parser.add_argument("--heavy-threads", type=int, default=8)
+        parser.add_argument("--light-sessions", type=int, default=8)
+        parser.add_argument("--think-time", type=float, default=0.5, help="seconds")
+        parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+        parser.add_argument("--max-active", type=int, default=4)
+        parser.add_argument("--queue-depth", type=int, default=16)
+        parser.add_argument("--per-session", type=int, default=4)
+        parser.add_argument("--wait", type=float, default=5.0, help="seconds")
+        parser.add_argument(
+            "--sync-wait",
+            type=float,
+            default=None,
+            help="seconds the client threads may queue; 0 admits them at once "
+            "or not at all, as WSGI requests are (default: --wait)",
+        )
+        parser.add_argument("--active-per-session", type=int, default=2)
+
+    def handle(self, *args, **options):
+        limiter = TokenBucketLimiter(
+            "simulation", options["per_minute"], options["burst"], MemoryBucketStore()
+        )
+        scheduler = LLMScheduler(
+            limiter,
+            max_active=options["max_active"],
+            max_depth=options["queue_depth"],
+            max_per_session=options["per_session"],
+            wait_seconds=options["wait"],
+            # The simulated clients are threads that are meant to queue
+            sync_wait_seconds=options["wait"]
+            if options["sync_wait"] is None
+            else options["sync_wait"],
+            max_active_per_session=options["active_per_session"],
+        )
+        llm = FakeLLM(options["latency"])
+        stop = threading.Event()
+        lock = threading.Lock()
+        waits = defaultdict(list)
+        outcomes = defaultdict(lambda: defaultdict(int))
+
+        def call(kind, session_id, priority):
+            started = time.monotonic()
+            try:
+                if priority == "explain":
+                    "".join(
+                        chunk.content
+                        for chunk in scheduler.stream(llm, "explain", session_id, priority)
+                    )
+                else:
+                    scheduler.invoke(llm, priority, session_id, priority)
+                outcome = "ok"
+            except LLMOverloaded as e:
+                outcome = "shed"
+                # A well-behaved client honours Retry-After
+                time.sleep(e.retry_after)
+            except RateLimited as e:
+                outcome = "timed_out"
+                time.sleep(e.retry_after)
+            with lock:
+                outcomes[(kind, priority)][outcome] += 1
+                if outcome == "ok":
+                    # Admission wait: total time less the fake call itself
+                    waits[(kind, priority)].append(
+                        time.monotonic() - started - options["latency"]
+                    )
+            return outcome == "ok"
+
+        def heavy():
+            while not stop.is_set():
+                call("heavy", "heavy", "plan")
+
+        def light(index):
+            session_id = f"light-{index}"
+            turn = 0
+            while not stop.is_set():
+                if call("light", session_id, "plan"):
+                    if turn % 3 == 0:
+                        call("light", session_id, "retry")
+                    call("light", session_id, "explain")
+                turn += 1
+                time.sleep(options["think_time"])
+
+        threads = [
+            threading.Thread(target=heavy, daemon=True)
+            for _ in range(options["heavy_threads"])
+        ] + [
+            threading.Thread(target=light, args=(n,), daemon=True)
+            for n in range(options["light_sessions"])
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(options["duration"])
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=options["wait"] + 5)
+
+        self.stdout.write(
+            f"{'session':<8} {'priority':<8} {'ok':>6} {'shed':>6} {'timeout':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8}"
+        )
+        for kind, priority in sorted(outcomes):
+            counts = outcomes[(kind, priority)]
+            samples = sorted(waits[(kind, priority)])
+            p50 = f"{samples[len(samples) // 2] * 1000:.0f}" if samples else "-"
+            p95 = f"{samples[int(len(samples) * 0.95)] * 1000:.0f}" if samples else "-"
+            self.stdout.write(
+                f"{kind:<8} {priority:<8} {counts['ok']:>6} {counts['shed']:>6} "
+                f"{counts['timed_out']:>8} {p50:>8} {p95:>8}"
+            )
+        self.stdout.write(f"Scheduler: {scheduler.stats()}")
@@ -0,0 +1,359 @@
+import random
+import uuid
+from datetime import date, timedelta
+
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sqlalchemy import text
+
+from app.views import (
+    BulkTableLoader,
+    OptimizedSQLReActAgent,
+    build_schema_index_from_catalog,
+    create_dataset_schema,
+    dataset_schema_name,
+    describe_column_profile,
+    drop_dataset_schema,
+    estimate_tokens,
+    get_api_key,
+    get_engine,
+    infer_column_types,
+    optimize_uploaded_tables,
+    profile_uploaded_tables,
+    quote_identifier,
+)
+
+# A wide "multi-sheet workbook": table -> column -> value generator
+TABLES = {
+    "sales_orders": {
+        "order_id": lambda i: 1000 + i,
+        "order_date": lambda i: date(2024, 1, 1) + timedelta(days=i % 200),
+        "region": lambda i: random.choice(["North", "South", "East", "West"]),
+        "product_name": lambda i: random.choice(["Desk", "Chair", "Lamp", "Monitor"]),
+        "quantity": lambda i: random.randint(1, 20),
+        "revenue": lambda i: round(random.uniform(50, 5000), 2),
+        "sales_rep": lambda i: random.choice(["Ana", "Ben", "Chen", "Dana"]),
+    },
+    "customers": {
+        "customer_id": lambda i: i,
+        "customer_name": lambda i: f"Customer {i}",
+        "city": lambda i: random.choice(["Austin", "Boston", "Denver", "Miami"]),
+        "segment": lambda i: random.choice(["Consumer", "Corporate", "Home Office"]),
+        "signup_date": lambda i: date(2022, 1, 1) + timedelta(days=i * 7),
+        "lifetime_value": lambda i: round(random.uniform(100, 20000), 2),
+    },
+    "products": {
+        "product_id": lambda i: i,
+        "product_name": lambda i: f"Product {i}",
+        "category": lambda i: random.choice(["Furniture", "Technology", "Office Supplies"]),
+        "unit_price": lambda i: round(random.uniform(5, 900), 2),
+        "supplier_name": lambda i: random.choice(["Acme", "Globex", "Initech"]),
+    },
+    "employees": {
+        "employee_id": lambda i: i,
+        "full_name": lambda i: f"Employee {i}",
+        "department": lambda i: random.choice(["Engineering", "Finance", "HR", "Marketing"]),
+        "hire_date": lambda i: date(2015, 1, 1) + timedelta(days=i * 40),
+        "salary": lambda i: random.randint(40000, 160000),
+        "manager": lambda i: random.choice(["Kim", "Lee", "Park"]),
+    },
+    "inventory_levels": {
+        "warehouse": lambda i: random.choice(["WH-Dallas", "WH-Reno", "WH-Akron"]),
+        "product_id": lambda i: i,
+        "stock_on_hand": lambda i: random.randint(0, 500),
+        "reorder_point": lambda i: random.randint(20, 100),
+        "last_counted": lambda i: date(2024, 6, 1) + timedelta(days=i % 30),
+    },
+    "suppliers": {
+        "supplier_id": lambda i: i,
+        "supplier_name": lambda i: f"Supplier {i}",
+        "country": lambda i: random.choice(["China", "Mexico", "Germany", "India"]),
+        "rating": lambda i: random.randint(1, 5),
+        "lead_time_days": lambda i: random.randint(3, 60),
+    },
+    "shipments": {
+        "shipment_id": lambda i: i,
+        "carrier": lambda i: random.choice(["UPS", "FedEx", "DHL"]),
+        "ship_date": lambda i: date(2024, 3, 1) + timedelta(days=i % 90),
+        "delivery_date": lambda i: date(2024, 3, 5) + timedelta(days=i % 90),
+        "freight_cost": lambda i: round(random.uniform(10, 400), 2),
+        "destination_city": lambda i: random.choice(["Austin", "Boston", "Denver"]),
+    },
+    "product_returns": {
+        "return_id": lambda i: i,
+        "order_id": lambda i: 1000 + i,
+        "return_reason": lambda i: random.choice(["Damaged", "Wrong item", "Late delivery"]),
+        "refund_amount": lambda i: round(random.uniform(5, 800), 2),
+        "return_date": lambda i: date(2024, 4, 1) + timedelta(days=i % 60),
+    },
+    "marketing_campaigns": {
+        "campaign_name": lambda i: f"Campaign {i}",
+        "channel": lambda i: random.choice(["Email", "Social", "Search"]),
+        "start_date": lambda i: date(2024, 1, 1) + timedelta(days=i * 5),
+        "budget": lambda i: random.randint(1000, 50000),
+        "clicks": lambda i: random.randint(100, 90000),
+        "conversions": lambda i: random.randint(0, 900),
+    },
+    "web_traffic": {
+        "visit_date": lambda i: date(2024, 1, 1) + timedelta(days=i),
+        "page": lambda i: random.choice(["/home", "/pricing", "/blog", "/signup"]),
+        "sessions": lambda i: random.randint(100, 9000),
+        "bounce_rate": lambda i: round(random.uniform(0.1, 0.9), 3),
+        "avg_session_seconds": lambda i: random.randint(10, 600),
+    },
+    "support_tickets": {
+        "ticket_id": lambda i: i,
+        "opened_at": lambda i: date(2024, 5, 1) + timedelta(days=i % 40),
+        "priority": lambda i: random.choice(["Low", "Medium", "High"]),
+        "status": lambda i: random.choice(["Open", "Closed"]),
+        "resolution_hours": lambda i: round(random.uniform(0.5, 96), 1),
+        "agent": lambda i: random.choice(["Sam", "Ria", "Tom"]),
+    },
+    "payroll": {
+        "employee_id": lambda i: i,
+        "pay_period": lambda i: f"2024-{(i % 12) + 1:02d}",
+        "gross_pay": lambda i: random.randint(3000, 12000),
+        "tax_withheld": lambda i: random.randint(500, 3000),
+        "net_pay": lambda i: random.randint(2500, 9000),
+    },
+    "expenses": {
+        "expense_date": lambda i: date(2024, 2, 1) + timedelta(days=i % 100),
+        "cost_center": lambda i: random.choice(["CC-100", "CC-200", "CC-300"]),
+        "expense_type": lambda i: random.choice(["Travel", "Software", "Meals"]),
+        "amount": lambda i: round(random.uniform(10, 3000), 2),
+        "approved_by": lambda i: random.choice(["Kim", "Lee"]),
+    },
+    "budgets": {
+        "fiscal_year": lambda i: 2020 + i % 5,
+        "department": lambda i: random.choice(["Engineering", "Finance", "HR", "Marketing"]),
+        "planned_spend": lambda i: random.randint(100000, 900000),
+        "actual_spend": lambda i: random.randint(100000, 900000),
+    },
+    "stores": {
+        "store_id": lambda i: i,
+        "store_name": lambda i: f"Store {i}",
+        "city": lambda i: random.choice(["Austin", "Boston", "Denver", "Miami"]),
+        "square_feet": lambda i: random.randint(2000, 40000),
+        "opened_year": lambda i: 1990 + i % 30,
+    },
+    "store_visits": {
+        "store_id": lambda i: i % 10,
+        "visit_date": lambda i: date(2024, 7, 1) + timedelta(days=i % 30),
+        "footfall": lambda i: random.randint(50, 5000),
+        "conversion_rate": lambda i: round(random.uniform(0.01, 0.4), 3),
+    },
+    "training_courses": {
+        "course_name": lambda i: f"Course {i}",
+        "trainer": lambda i: random.choice(["Ola", "Raj", "Uma"]),
+        "duration_hours": lambda i: random.randint(1, 40),
+        "participants": lambda i: random.randint(3, 60),
+        "satisfaction_score": lambda i: round(random.uniform(1, 5), 1),
+    },
+    "energy_usage": {
+        "facility": lambda i: random.choice(["Plant A", "Plant B", "HQ"]),
+        "month": lambda i: f"2024-{(i % 12) + 1:02d}",
+        "kwh": lambda i: random.randint(1000, 90000),
+        "cost": lambda i: round(random.uniform(100, 9000), 2),
+        "co2_tonnes": lambda i: round(random.uniform(1, 60), 2),
+    },
+    "fleet_vehicles": {
+        "vehicle_id": lambda i: f"V{i:03d}",
+        "model": lambda i: random.choice(["Transit", "Sprinter", "Model Y"]),
+        "mileage": lambda i: random.randint(1000, 200000),
+        "fuel_type": lambda i: random.choice(["Diesel", "Electric", "Petrol"]),
+        "last_service": lambda i: date(2024, 1, 1) + timedelta(days=i * 3),
+    },
+    "job_applicants": {
+        "applicant_id": lambda i: i,
+        "position": lambda i: random.choice(["Analyst", "Engineer", "Designer"]),
+        "source": lambda i: random.choice(["LinkedIn", "Referral", "Job board"]),
+        "stage": lambda i: random.choice(["Screen", "Interview", "Offer", "Rejected"]),
+        "applied_date": lambda i: date(2024, 2, 1) + timedelta(days=i % 80),
+    },
+    "survey_responses": {
+        "respondent_id": lambda i: i,
+        "nps_score": lambda i: random.randint(0, 10),
+        "comment_theme": lambda i: random.choice(["Price", "Quality", "Service"]),
+        "survey_date": lambda i: date(2024, 8, 1) + timedelta(days=i % 20),
+    },
+    "assets": {
+        "asset_tag": lambda i: f"A-{i:04d}",
+        "asset_type": lambda i: random.choice(["Laptop", "Monitor", "Phone"]),
+        "assigned_to": lambda i: f"Employee {i}",
+        "purchase_cost": lambda i: round(random.uniform(100, 3000), 2),
+        "purchase_date": lambda i: date(2021, 1, 1) + timedelta(days=i * 11),
+    },
+    "subscriptions": {
+        "subscription_id": lambda i: i,
+        "plan": lambda i: random.choice(["Basic", "Pro", "Enterprise"]),
+        "mrr": lambda i: random.choice([29, 99, 499]),
+        "start_date": lambda i: date(2023, 1, 1) + timedelta(days=i * 9),
+        "churned": lambda i: random.choice(["yes", "no"]),
+    },
+    "invoices": {
+        "invoice_number": lambda i: f"INV-{i:05d}",
+        "customer_id": lambda i: i,
+        "invoice_date": lambda i: date(2024, 1, 1) + timedelta(days=i * 2),
+        "due_date": lambda i: date(2024, 2, 1) + timedelta(days=i * 2),
+        "amount_due": lambda i: round(random.uniform(100, 9000), 2),
+        "paid": lambda i: random.choice(["yes", "no"]),
+    },
+}
+
+# question, tables the SQL needs, columns the SQL needs
+CASES = [
+    ("What is total revenue by region?", ["sales_orders"], ["revenue", "region"]),
+    ("Which carrier has the highest average freight cost?", ["shipments"], ["carrier", "freight_cost"]),
+    ("How many high priority tickets are still open?", ["support_tickets"], ["priority", "status"]),
+    ("Average salary per department", ["employees"], ["salary", "department"]),
+    ("Which campaign channel produced the most conversions?", ["marketing_campaigns"], ["channel", "conversions"]),
+    ("Total refund amount for damaged items", ["product_returns"], ["refund_amount", "return_reason"]),
+    ("Show kwh and co2 by facility", ["energy_usage"], ["facility", "kwh", "co2_tonnes"]),
+    ("Which plan has the highest MRR?", ["subscriptions"], ["plan", "mrr"]),
+    ("How many applicants came from referrals?", ["job_applicants"], ["source"]),
+    ("Warehouses where stock is below the reorder point", ["inventory_levels"], ["warehouse", "stock_on_hand", "reorder_point"]),
+    ("Average NPS score by comment theme", ["survey_responses"], ["nps_score", "comment_theme"]),
+    ("List unpaid invoices past their due date", ["invoices"], ["paid", "due_date"]),
+    ("How many electric vehicles do we have?", ["fleet_vehicles"], ["fuel_type"]),
+    ("Planned vs actual spend for Marketing", ["budgets"], ["planned_spend", "actual_spend", "department"]),
+    ("Total footfall per store", ["store_visits"], ["footfall", "store_id"]),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline benchmark of relevance-ranked schema pruning: prompt size and "
+        "whether the prompt contains what each question needs (with --llm, "
+        "also first-try SQL success)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=40)
+        parser.add_argument(
+            "--budget",
+            type=int,
+            default=getattr(settings, "PROMPT_SCHEMA_TOKEN_BUDGET", 2000),
+            help="schema token budget for the ranked prompt",
+        )
+        parser.add_argument(
+            "--llm",
+            action="store_true",
+            help="also generate SQL with the LLM and execute it once",
+        )
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        random.seed(options["seed"])
+        engine = get_engine()
+        schema = dataset_schema_name(uuid.uuid4())
+
+        try:
+            catalog = self._load_workbook(engine, schema, options["rows"])
+            index = build_schema_index_from_catalog(catalog, schema)
+            llm = self._llm() if options["llm"] else None
+
+            full_prompt = index.render("", token_budget=10**9, unmatched_tables=len(catalog))
+            self.stdout.write(
+                f"{len(catalog)} tables, full schema {estimate_tokens(full_prompt)} tokens, "
+                f"ranked budget {options['budget']} tokens"
+            )
+
+            totals = {
+                "fixed": {"tokens": 0, "recall": 0, "sql_ok": 0},
+                "ranked": {"tokens": 0, "recall": 0, "sql_ok": 0},
+            }
+            for question, gold_tables, gold_columns in CASES:
+                prompts = {
+                    "fixed": self._fixed_limit_prompt(catalog, schema),
+                    "ranked": index.render(question, token_budget=options["budget"]),
+                }
+                row = [question[:48].ljust(48)]
+                for variant, prompt in prompts.items():
+                    complete = all(
+                        f"{schema}.{table} " in prompt for table in gold_tables
+                    ) and all(f"  - {column} (" in prompt for column in gold_columns)
+                    totals[variant]["tokens"] += estimate_tokens(prompt)
+                    totals[variant]["recall"] += complete
+                    row.append(f"{variant} {estimate_tokens(prompt):>5} tok {'ok ' if complete else 'MISS'}")
+
+                    if llm is not None:
+                        sql_ok = self._first_try_sql(engine, llm, schema, prompt, question)
+                        totals[variant]["sql_ok"] += sql_ok
+                        row.append("sql ok " if sql_ok else "sql FAIL")
+                self.stdout.write("  ".join(row))
+
+            cases = len(CASES)
+            for variant, total in totals.items():
+                line = (
+                    f"{variant}: avg prompt {total['tokens'] / cases:.0f} tokens, "
+                    f"needed tables/columns present {total['recall']}/{cases}"
+                )
+                if llm is not None:
+                    line += f", first-try SQL success {total['sql_ok']}/{cases}"
+                self.stdout.write(self.style.SUCCESS(line))
+        finally:
+            drop_dataset_schema(engine, schema)
+
+    def _load_workbook(self, engine, schema, rows):
+        create_dataset_schema(engine, schema)
+        loader = BulkTableLoader(engine, schema=schema)
+        loaded_tables = {}
+        for table_name, generators in TABLES.items():
+            df = pd.DataFrame(
+                {
+                    column: [str(generate(i)) for i in range(rows)]
+                    for column, generate in generators.items()
+                }
+            )
+            typed_df, column_types = infer_column_types(df)
+            loader.load(
+                table_name, typed_df, {d["column"]: d["sql_type"] for d in column_types}
+            )
+            loaded_tables[table_name] = {
+                "row_count": len(typed_df),
+                "column_types": column_types,
+            }
+        optimize_uploaded_tables(engine, loaded_tables, schema)
+        profile_uploaded_tables(engine, loaded_tables, schema)
+        return {
+            table_name: {"row_count": info["row_count"], "columns": info["profile"]}
+            for table_name, info in loaded_tables.items()
+        }
+
+    @staticmethod
+    def _fixed_limit_prompt(catalog, schema):
+        """The previous prompt schema: the first 10 tables and 20 columns"""
+        schema_str = f"AVAILABLE TABLES ({schema} schema):\n\n"
+        for table_name, table in list(catalog.items())[:10]:
+            schema_str += f"\nTable: {schema}.{table_name} ({table['row_count']:,} rows)\n"
+            for column_profile in table["columns"][:20]:
+                schema_str += describe_column_profile(column_profile)
+        return schema_str
+
+    @staticmethod
+    def _llm():
+        from langchain_openai import ChatOpenAI
+
+        try:
+            api_key = get_api_key()
+        except Exception as e:
+            raise CommandError(f"--llm needs an OpenAI API key: {e}")
+        return ChatOpenAI(
+            model="gpt-5-mini", temperature=0, openai_api_key=api_key, timeout=30
+        )
+
+    @staticmethod
+    def _first_try_sql(engine, llm, schema, schema_info, question) -> bool:
+        response = llm.invoke(OptimizedSQLReActAgent.sql_prompt(schema, schema_info, question))
+        sql_query = response.content.replace("```sql", "").replace("```", "").strip()
+        try:
+            with engine.connect() as conn:
+                conn.execute(
+                    text("SELECT set_config('search_path', :schema, true)"),
+                    {"schema": quote_identifier(schema)},
+                )
+                conn.execute(text(sql_query)).fetchmany(1)
+            return True
+        except Exception:
+            return False
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.4 on 2026-10-17 04:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_uploadedfile_content_hash_uploadedfile_table_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='cancel_requested',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='phase',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='rows_loaded',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='completed', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='tables_done',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
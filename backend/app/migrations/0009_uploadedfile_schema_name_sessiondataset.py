@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-17 04:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_uploadedfile_cancel_requested_uploadedfile_error_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='schema_name',
+            field=models.CharField(blank=True, default='', max_length=63),
+        ),
+        migrations.CreateModel(
+            name='SessionDataset',
+            fields=[
+                ('session_id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('last_used_at', models.DateTimeField(auto_now=True)),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='app.uploadedfile')),
+            ],
+            options={
+                'db_table': 'session_datasets',
+            },
+        ),
+    ]
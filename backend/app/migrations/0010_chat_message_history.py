@@ -0,0 +1,32 @@
+# Creates the langchain_postgres chat memory table once, instead of on every
+# ConversationalSQLAgent construction. Mirrors
+# PostgresChatMessageHistory.create_tables, so existing tables are left as-is.
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_uploadedfile_schema_name_sessiondataset'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                """
+                CREATE TABLE IF NOT EXISTS chat_message_history (
+                    id SERIAL PRIMARY KEY,
+                    session_id UUID NOT NULL,
+                    message JSONB NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                );
+                """,
+                """
+                CREATE INDEX IF NOT EXISTS idx_chat_message_history_session_id
+                ON chat_message_history (session_id);
+                """,
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
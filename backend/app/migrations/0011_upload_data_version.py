@@ -0,0 +1,18 @@
+# Counter bumped whenever uploaded data changes; processes compare it with
+# the version their cached schema descriptions were built for.
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_chat_message_history'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE SEQUENCE IF NOT EXISTS upload_data_version;",
+            reverse_sql="DROP SEQUENCE IF EXISTS upload_data_version;",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_upload_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='written_lsn',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-17 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_uploadedfile_written_lsn'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedQuestionSQL',
+            fields=[
+                ('cache_key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('schema_name', models.CharField(max_length=63)),
+                ('data_version', models.BigIntegerField(db_index=True)),
+                ('question', models.TextField()),
+                ('sql_query', models.TextField()),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'question_sql_cache',
+            },
+        ),
+    ]
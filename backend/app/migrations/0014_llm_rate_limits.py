@@ -0,0 +1,23 @@
+# Shared token buckets for LLM calls, updated with raw SQL by every worker.
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_cachedquestionsql'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+            CREATE TABLE IF NOT EXISTS llm_rate_limits (
+                name TEXT PRIMARY KEY,
+                tokens DOUBLE PRECISION NOT NULL,
+                updated_at DOUBLE PRECISION NOT NULL
+            );
+            """,
+            reverse_sql="DROP TABLE IF EXISTS llm_rate_limits;",
+        ),
+    ]
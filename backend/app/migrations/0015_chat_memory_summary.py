@@ -0,0 +1,40 @@
+# Per-session rolling summaries for the chat memory window, and an index
+# that lets the window read only the newest messages of a session.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_llm_rate_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='memory_summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='memory_summarized_through',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            sql=[
+                """
+                CREATE INDEX IF NOT EXISTS idx_chat_message_history_session_id_id
+                ON chat_message_history (session_id, id);
+                """,
+                "DROP INDEX IF EXISTS idx_chat_message_history_session_id;",
+            ],
+            reverse_sql=[
+                """
+                CREATE INDEX IF NOT EXISTS idx_chat_message_history_session_id
+                ON chat_message_history (session_id);
+                """,
+                "DROP INDEX IF EXISTS idx_chat_message_history_session_id_id;",
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Question SQL is invalidated per dataset schema when the schema is dropped,
+# so the global data version and its sequence go. Rows keyed by the old
+# version can never be hit again.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_chat_memory_summary'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="DELETE FROM question_sql_cache;",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RemoveField(
+            model_name='cachedquestionsql',
+            name='data_version',
+        ),
+        migrations.AlterField(
+            model_name='cachedquestionsql',
+            name='schema_name',
+            field=models.CharField(db_index=True, max_length=63),
+        ),
+        migrations.RunSQL(
+            sql="DROP SEQUENCE IF EXISTS upload_data_version;",
+            reverse_sql="CREATE SEQUENCE IF NOT EXISTS upload_data_version;",
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Claim marker for chat memory folds, so only one fold per session calls the
+# summary LLM at a time.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_per_dataset_cache_invalidation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='memory_fold_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -10,6 +10,12 @@ class ChatSession(models.Model):
     session_id = models.CharField(max_length=255, primary_key=True)
     title = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Rolling summary of the turns older than the chat memory window, and
+    # the last chat_message_history id folded into it
+    memory_summary = models.TextField(blank=True, default="")
+    memory_summarized_through = models.BigIntegerField(default=0)
+    # Set while a fold is summarizing, so concurrent folds don't each pay for one
+    memory_fold_started_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = "chat_sessions"
@@ -39,7 +45,20 @@ class ChatHistory(models.Model):
 
 
 class UploadedFile(models.Model):
-    """Track all uploaded files"""
+    """Track all uploaded files and their ingestion jobs"""
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+    STATUS_CANCELLED = "cancelled"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_COMPLETED, "Completed"),
+        (STATUS_FAILED, "Failed"),
+        (STATUS_CANCELLED, "Cancelled"),
+    ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     filename = models.CharField(max_length=255)
@@ -50,6 +69,23 @@ class UploadedFile(models.Model):
     column_count = models.IntegerField(default=0)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    table_details = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=STATUS_COMPLETED
+    )
+    phase = models.CharField(max_length=50, blank=True, default="")
+    rows_loaded = models.BigIntegerField(default=0)
+    tables_done = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    cancel_requested = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Postgres schema holding this upload's tables; empty for uploads made
+    # before per-dataset schemas, which live in the shared "uploads" schema
+    schema_name = models.CharField(max_length=63, blank=True, default="")
+    # Primary WAL position after ingestion; a replica serves this dataset
+    # only once it has replayed past it
+    written_lsn = models.CharField(max_length=32, blank=True, default="")
 
     class Meta:
         db_table = "uploaded_files"
@@ -57,3 +93,40 @@ class UploadedFile(models.Model):
 
     def __str__(self):
         return f"{self.filename} - {self.uploaded_at}"
+
+    @property
+    def dataset_schema(self):
+        return self.schema_name or "uploads"
+
+
+class SessionDataset(models.Model):
+    """Which uploaded dataset a chat session is analyzing"""
+
+    session_id = models.CharField(max_length=255, primary_key=True)
+    upload = models.ForeignKey(
+        UploadedFile, on_delete=models.CASCADE, related_name="sessions"
+    )
+    last_used_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "session_datasets"
+
+    def __str__(self):
+        return f"{self.session_id} -> {self.upload_id}"
+
+
+class CachedQuestionSQL(models.Model):
+    """SQL generated for a normalized question, shared by every worker"""
+
+    cache_key = models.CharField(max_length=64, primary_key=True)
+    schema_name = models.CharField(max_length=63, db_index=True)
+    question = models.TextField()
+    sql_query = models.TextField()
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "question_sql_cache"
+
+    def __str__(self):
+        return f"{self.schema_name}: {self.question[:50]}"
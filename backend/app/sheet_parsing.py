@@ -0,0 +1,220 @@
+# backend/app/sheet_parsing.py
+"""Table detection and cleaning for raw spreadsheet sheets.
+
+Kept free of Django so the process pool that parses workbook sheets can
+start its workers with forkserver/spawn and import only this module.
+"""
+import io
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def clean_column_names(headers):
+    cleaned_headers = []
+    seen_headers = {}
+
+    for header in headers:
+        if pd.isna(header) or str(header).strip() == "":
+            header = "unnamed_column"
+        else:
+            header = str(header).strip().lower()
+            header = re.sub(r"[^\w\s]", "_", header)
+            header = re.sub(r"\s+", "_", header)
+
+        base_header = header
+        counter = 1
+        while header in seen_headers:
+            header = f"{base_header}_{counter}"
+            counter += 1
+
+        seen_headers[header] = True
+        cleaned_headers.append(header)
+
+    return cleaned_headers
+
+
+def extract_tables_from_sheet(df, sheet_name):
+    """Detect and clean every table in one raw sheet, in sheet order"""
+    clean_sheet_name = re.sub(r"[^\w\s]", "_", sheet_name)
+    clean_sheet_name = re.sub(r"\s+", "_", clean_sheet_name)
+
+    tables = []
+    for table_info in find_tables_in_dataframe(df, sheet_name=clean_sheet_name):
+        processed_df = process_single_table(df, table_info)
+        if processed_df is not None and not processed_df.empty:
+            tables.append((table_info["name"].lower(), processed_df))
+    return tables
+
+
+def parse_workbook_sheet(excel_file, sheet):
+    df = excel_file.parse(sheet_name=sheet, header=None)
+    if df.empty:
+        return []
+    return extract_tables_from_sheet(df, sheet)
+
+
+# Workbook opened once per pool worker by init_sheet_worker
+_worker_excel_file = None
+
+
+def init_sheet_worker(file_bytes):
+    global _worker_excel_file
+    _worker_excel_file = pd.ExcelFile(io.BytesIO(file_bytes))
+
+
+def parse_sheet_in_worker(sheet):
+    return parse_workbook_sheet(_worker_excel_file, sheet)
+
+
+def find_tables_in_dataframe(df, sheet_name="default"):
+    """Locate table blocks in a raw sheet.
+
+    Rows are classified once from their non-null counts: blank rows (0)
+    separate tables, single-value rows are candidate titles and rows with
+    more than one value are headers or data. A title only counts if the next
+    row that is not itself a single-value row is a header.
+    """
+    tables = []
+    row_count = len(df)
+    if row_count == 0:
+        return tables
+
+    counts = df.notna().sum(axis=1).to_numpy()
+    blank = counts == 0
+    multi = counts > 1
+
+    # For every title candidate, the first following row that is not another
+    # single-value row decides whether it really titles a table
+    title_rows = np.flatnonzero(counts == 1)
+    breaks = np.flatnonzero(counts != 1)
+    lookahead = np.searchsorted(breaks, title_rows + 1)
+    if len(breaks):
+        next_break = breaks[np.minimum(lookahead, len(breaks) - 1)]
+        titled = (lookahead < len(breaks)) & multi[next_break]
+    else:
+        next_break = title_rows
+        titled = np.zeros(len(title_rows), dtype=bool)
+    header_for_title = dict(zip(title_rows[titled], next_break[titled]))
+
+    is_title = np.zeros(row_count, dtype=bool)
+    is_title[title_rows[titled]] = True
+    table_starts = np.flatnonzero(multi | is_title)
+    table_ends = np.flatnonzero(blank | is_title)
+
+    # Blank-looking titles (e.g. a lone space) use up a table number even when
+    # they turn out not to title anything, so count them as rows are passed
+    first_values = df.iloc[title_rows].bfill(axis=1).iloc[:, 0]
+    blank_title = np.zeros(row_count, dtype=bool)
+    blank_title[title_rows] = (first_values.astype(str).str.strip() == "").to_numpy()
+    blank_titles_before = np.concatenate(([0], np.cumsum(blank_title)))
+
+    table_counter = 1
+    counted_to = 0
+
+    def count_blank_titles(upto):
+        nonlocal table_counter, counted_to
+        if upto > counted_to:
+            table_counter += int(
+                blank_titles_before[upto] - blank_titles_before[counted_to]
+            )
+            counted_to = upto
+
+    def make_table(name, header_idx):
+        name = re.sub(r"[^\w\s]", "_", name)
+        name = re.sub(r"\s+", "_", name)
+        return {
+            "name": name,
+            "start": header_idx,
+            "data_start": header_idx + 1,
+            "header_row": header_idx,
+            "end": None,
+        }
+
+    def titled_table(title_idx):
+        nonlocal table_counter, counted_to
+        count_blank_titles(title_idx)
+        title_row = df.iloc[title_idx]
+        original_table_name = str(title_row[title_row.notna()].iloc[0]).strip()
+        if original_table_name:
+            table_name = f"{sheet_name}_{original_table_name}"
+        else:
+            table_name = f"{sheet_name}_table_{table_counter}"
+            table_counter += 1
+        header_idx = int(header_for_title[title_idx])
+        # Rows between a title and its header are skipped, not scanned
+        counted_to = header_idx + 1
+        return make_table(table_name, header_idx)
+
+    i = 0
+    current_table = None
+    while i < row_count:
+        if current_table is None:
+            pos = np.searchsorted(table_starts, i)
+            if pos == len(table_starts):
+                break
+            start_idx = int(table_starts[pos])
+            if is_title[start_idx]:
+                current_table = titled_table(start_idx)
+            else:
+                count_blank_titles(start_idx)
+                current_table = make_table(
+                    f"{sheet_name}_table_{table_counter}", start_idx
+                )
+                table_counter += 1
+                counted_to = start_idx + 1
+            i = current_table["data_start"]
+            continue
+
+        # Every row up to the next blank or title row is a data row
+        pos = np.searchsorted(table_ends, i)
+        end_idx = int(table_ends[pos]) if pos < len(table_ends) else row_count
+        if end_idx > i:
+            current_table["end"] = end_idx
+        tables.append(current_table)
+        current_table = None
+
+        if end_idx < row_count and is_title[end_idx]:
+            current_table = titled_table(end_idx)
+            i = current_table["data_start"]
+        else:
+            i = end_idx + 1
+
+    if current_table is not None:
+        tables.append(current_table)
+
+    return tables
+
+
+def is_table_name_row(row):
+    non_empty_values = row.dropna()
+    return len(non_empty_values) == 1
+
+
+def is_header_row(row):
+    non_empty_values = row.dropna()
+    return len(non_empty_values) > 1
+
+
+def process_single_table(df, table_info):
+    try:
+        headers = df.iloc[table_info["header_row"]].tolist()
+        cleaned_headers = clean_column_names(headers)
+
+        start_idx = table_info["data_start"]
+        end_idx = table_info["end"]
+        # Relabel the slice in place; dropna below makes the only copy
+        data_df = df.iloc[start_idx:end_idx]
+        data_df.columns = cleaned_headers
+        data_df.index = pd.RangeIndex(len(data_df))
+
+        result_df = data_df.dropna(how="all").dropna(axis=1, how="all")
+
+        return result_df if not result_df.empty else None
+    except Exception as e:
+        logger.error(f"Error processing table: {str(e)}")
+        return None
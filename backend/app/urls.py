@@ -1,15 +1,62 @@
 from django.urls import path
 from .views import (
     DataAnalysisAPIView,
+    AsyncAnalysisQueryView,
     SaveResultsAPIView,
     DataVisualizationAPIView,
     ChatHistoryListAPIView,
     ChatHistoryDetailAPIView,
     ChatSessionListAPIView,
+    UploadStatusAPIView,
+    UploadCancelAPIView,
+    UploadProfileAPIView,
+    DatabasePoolStatsAPIView,
+    CacheStatsAPIView,
+    LLMSchedulerStatsAPIView,
+    ResultPageAPIView,
+    ResultExportAPIView,
 )
 
 urlpatterns = [
     path("api/analysis/", DataAnalysisAPIView.as_view(), name="data_analysis"),
+    path(
+        "api/analysis/query/",
+        AsyncAnalysisQueryView.as_view(),
+        name="data_analysis_query",
+    ),
+    path(
+        "api/uploads/<uuid:upload_id>/",
+        UploadStatusAPIView.as_view(),
+        name="upload_status",
+    ),
+    path(
+        "api/uploads/<uuid:upload_id>/cancel/",
+        UploadCancelAPIView.as_view(),
+        name="upload_cancel",
+    ),
+    path(
+        "api/uploads/<uuid:upload_id>/profile/",
+        UploadProfileAPIView.as_view(),
+        name="upload_profile",
+    ),
+    path(
+        "api/db-pool-stats/", DatabasePoolStatsAPIView.as_view(), name="db_pool_stats"
+    ),
+    path("api/cache-stats/", CacheStatsAPIView.as_view(), name="cache_stats"),
+    path("api/llm-stats/", LLMSchedulerStatsAPIView.as_view(), name="llm_stats"),
+    path(
+        "api/results/<uuid:result_id>/", ResultPageAPIView.as_view(), name="result_page"
+    ),
+    path(
+        "api/results/<uuid:result_id>/export/",
+        ResultExportAPIView.as_view(),
+        name="result_export",
+    ),
+    path(
+        "api/results/<uuid:result_id>/visualize/",
+        DataVisualizationAPIView.as_view(),
+        name="result_visualization",
+    ),
     path("api/save-results/", SaveResultsAPIView.as_view(), name="save_results"),
     path(
         "api/visualize/", DataVisualizationAPIView.as_view(), name="data_visualization"
@@ -3,8 +3,18 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAdminUser
 from django.conf import settings
-from django.http import HttpResponse, StreamingHttpResponse
+from django.core.files import File
+from django.db import close_old_connections, connection as db_connection
+from django.db.models import F, Q
+from django.utils import timezone
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 
 from langchain_openai import ChatOpenAI
 from langchain_community.utilities import SQLDatabase
@@ -12,843 +22,2462 @@ from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
 from langgraph.prebuilt import create_react_agent
 
 from langchain_postgres import PostgresChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    SystemMessage,
+    messages_from_dict,
+)
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from psycopg import sql as pg_sql
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 
 import os
+import asyncio
+import codecs
+import csv
+import hashlib
+import json
+import math
+import multiprocessing
+import pickle
+import tempfile
+import threading
+import uuid
+import weakref
 import pandas as pd
 import re
 import io
 from io import StringIO
 import time
-from collections import deque
+import unicodedata
+from datetime import timedelta
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from functools import cached_property, wraps
 import numpy as np
 from typing import Dict, Any, List
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from openpyxl import load_workbook
 import logging
 
+try:
+    import fcntl
+except ImportError:  # Windows: no file-backed rate limiter
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+from . import sheet_parsing
+from .sheet_parsing import (
+    clean_column_names,
+    extract_tables_from_sheet,
+    find_tables_in_dataframe,
+    parse_workbook_sheet,
+    process_single_table,
+)
+
 # Import models for chat history
-from .models import ChatHistory, UploadedFile, ChatSession
+from .models import (
+    ChatHistory,
+    UploadedFile,
+    ChatSession,
+    SessionDataset,
+    CachedQuestionSQL,
+)
 
 
 # --- Rate Limiter ---
-class RateLimiter:
-    """Rate limiter using sliding window"""
-
-    def __init__(self, max_requests=8, time_window=60):
-        self.max_requests = max_requests
-        self.time_window = time_window
-        self.requests = deque()
-
-    def can_proceed(self):
-        current_time = time.time()
-        while self.requests and self.requests[0] < current_time - self.time_window:
-            self.requests.popleft()
-        if len(self.requests) < self.max_requests:
-            self.requests.append(current_time)
-            return True
-        return False
-
-    def wait_time(self):
-        if not self.requests:
-            return 0
-        current_time = time.time()
-        oldest_request = self.requests[0]
-        time_passed = current_time - oldest_request
-        if time_passed >= self.time_window:
-            return 0
-        return self.time_window - time_passed
+class RateLimited(Exception):
+    """No LLM call slot is free; ``retry_after`` says when one will be"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(
+            "The AI service is busy. Please try again in "
+            f"{math.ceil(retry_after)} seconds."
+        )
 
-    def wait_if_needed(self):
-        if not self.can_proceed():
-            wait_seconds = self.wait_time()
-            logger.warning(f"Rate limit reached. Waiting {wait_seconds:.1f} seconds...")
-            time.sleep(wait_seconds + 0.1)
-            self.requests.append(time.time())
 
+def refill_bucket(tokens, updated_at, now, rate, burst, cost):
+    """One token-bucket step: (tokens left, seconds until ``cost`` is available)"""
+    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
 
-gemini_rate_limiter = RateLimiter(max_requests=8, time_window=60)
 
+class MemoryBucketStore:
+    """Buckets for one process"""
 
-class ConversationalSQLAgent:
-    """SQL Agent with conversational memory"""
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, name: str, rate: float, burst: float, cost: float) -> float:
+        with self.lock:
+            now = time.time()
+            tokens, updated_at = self.buckets.get(name, (burst, now))
+            tokens, wait = refill_bucket(tokens, updated_at, now, rate, burst, cost)
+            self.buckets[name] = (tokens, now)
+            return wait
+
+
+class FileBucketStore:
+    """Buckets in flock-guarded files, shared by the workers on one host"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def take(self, name: str, rate: float, burst: float, cost: float) -> float:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{name}.json"), "a+") as f:
+            # Exclusive across processes and threads; released on close
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            raw = f.read()
+            now = time.time()
+            state = json.loads(raw) if raw else {"tokens": burst, "updated_at": now}
+            tokens, wait = refill_bucket(
+                state["tokens"], state["updated_at"], now, rate, burst, cost
+            )
+            f.seek(0)
+            f.truncate()
+            json.dump({"tokens": tokens, "updated_at": now}, f)
+            return wait
+
+
+class PostgresBucketStore:
+    """Buckets in the llm_rate_limits table, shared by every worker on every host.
+
+    The row lock serializes takers and the database clock keeps hosts in
+    step.
+    """
+
+    TAKE_SQL = text(
+        """
+        WITH bucket AS (
+            SELECT
+                LEAST(
+                    :burst,
+                    tokens + GREATEST(0, extract(epoch FROM clock_timestamp()) - updated_at) * :rate
+                ) AS available,
+                extract(epoch FROM clock_timestamp()) AS now
+            FROM llm_rate_limits
+            WHERE name = :name
+            FOR UPDATE
+        )
+        UPDATE llm_rate_limits
+        SET tokens = CASE
+                WHEN bucket.available >= :cost THEN bucket.available - :cost
+                ELSE bucket.available
+            END,
+            updated_at = bucket.now
+        FROM bucket
+        WHERE llm_rate_limits.name = :name
+        RETURNING bucket.available
+        """
+    )
+
+    def take(self, name: str, rate: float, burst: float, cost: float) -> float:
+        params = {"name": name, "rate": rate, "burst": burst, "cost": cost}
+        with get_engine().begin() as conn:
+            available = conn.execute(self.TAKE_SQL, params).scalar()
+            if available is None:
+                conn.execute(
+                    text(
+                        "INSERT INTO llm_rate_limits (name, tokens, updated_at) "
+                        "VALUES (:name, :burst, extract(epoch FROM clock_timestamp())) "
+                        "ON CONFLICT (name) DO NOTHING"
+                    ),
+                    params,
+                )
+                available = conn.execute(self.TAKE_SQL, params).scalar()
+        return 0.0 if available >= cost else (cost - available) / rate
 
-    def __init__(self, db_uri: str, api_key: str, session_id: str):
-        self.db_uri = db_uri
-        self.session_id = session_id
 
-        # Initialize base SQL agent
-        self.db = SQLDatabase.from_uri(
-            db_uri, schema="uploads", include_tables=None, sample_rows_in_table_info=3
-        )
+class TokenBucketLimiter:
+    """Token-bucket limit on LLM calls, kept in a store shared by workers.
 
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0,
-            openai_api_key=api_key,
-            timeout=15,
-            max_retries=1,
-        )
+    ``try_acquire`` never blocks. ``acquire`` and ``acquire_async`` wait up
+    to a timeout (LLM_RATE_LIMIT_WAIT_SECONDS by default) and then raise
+    RateLimited carrying the retry-after, so a request is answered instead
+    of parked.
+    """
 
-        # Initialize memory with PostgreSQL
-        import psycopg
+    def __init__(self, name: str, per_minute: float, burst: float, store):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.store = store
 
-        self.connection = psycopg.connect(db_uri)
-        self.message_history = PostgresChatMessageHistory(
-            "chat_message_history", session_id, sync_connection=self.connection
-        )
-        self.message_history.create_tables(self.connection, "chat_message_history")
+    def try_acquire(self, cost: float = 1.0) -> float:
+        """Take a slot if one is free; otherwise return seconds until one is"""
+        try:
+            return self.store.take(self.name, self.rate, self.burst, cost)
+        except Exception as e:
+            # Fail open: a broken limiter store must not take answers down
+            logger.warning(f"Rate limiter unavailable: {str(e)}")
+            return 0.0
+
+    def acquire(self, timeout: float = None, cost: float = 1.0):
+        deadline = time.monotonic() + self._timeout(timeout)
+        while True:
+            wait = self.try_acquire(cost)
+            if not wait:
+                return
+            if wait > deadline - time.monotonic():
+                raise RateLimited(wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout: float = None, cost: float = 1.0):
+        deadline = time.monotonic() + self._timeout(timeout)
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, cost)
+            if not wait:
+                return
+            if wait > deadline - time.monotonic():
+                raise RateLimited(wait)
+            await asyncio.sleep(wait)
 
-        # Create conversational prompt
-        self.prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    """You are a helpful SQL assistant with access to a database. You help users query their data.
+    @staticmethod
+    def _timeout(timeout: float = None) -> float:
+        if timeout is not None:
+            return timeout
+        return getattr(settings, "LLM_RATE_LIMIT_WAIT_SECONDS", 0)
+
+
+def build_llm_rate_limiter() -> TokenBucketLimiter:
+    backend = getattr(settings, "LLM_RATE_LIMIT_BACKEND", "postgres")
+    if backend == "file" and fcntl is None:
+        logger.warning("File rate limiter needs fcntl; limiting per process instead")
+        backend = "memory"
+    if backend == "file":
+        store = FileBucketStore(settings.LLM_RATE_LIMIT_DIR)
+    elif backend == "memory":
+        store = MemoryBucketStore()
+    else:
+        store = PostgresBucketStore()
+    return TokenBucketLimiter(
+        "llm",
+        getattr(settings, "LLM_RATE_LIMIT_PER_MINUTE", 8),
+        getattr(settings, "LLM_RATE_LIMIT_BURST", 8),
+        store,
+    )
+
+
+llm_rate_limiter = build_llm_rate_limiter()
+
+
+def rate_limited_response(error: RateLimited, response_class=Response):
+    response = response_class(
+        {"error": str(error), "retry_after": round(error.retry_after, 1)},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+    )
+    response["Retry-After"] = str(math.ceil(error.retry_after))
+    return response
+
+
+# --- LLM Scheduler ---
+# Most urgent first: interactive planning, then query repairs, then
+# explanations, then background chat memory summaries
+LLM_PRIORITIES = ("plan", "retry", "explain", "summary")
+# Slots a call admitted without queueing leaves free for more urgent kinds
+LLM_RESERVED_SLOTS = {"plan": 0, "retry": 1, "explain": 1, "summary": 2}
+
+
+class LLMOverloaded(RateLimited):
+    """The LLM queue was full and this call was shed"""
+
+
+class LLMTicket:
+    __slots__ = ("session_key", "priority", "enqueued_at", "granted", "shed")
+
+    def __init__(self, session_key: str, priority: str):
+        self.session_key = session_key
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.shed = False
+
+
+class LLMScheduler:
+    """Admits outbound LLM calls fairly across sessions, then by priority.
+
+    Start-time fair queuing: each grant advances its session's tag by one, and
+    the waiting session with the lowest tag goes next, so a session that has
+    had many calls waits behind those that have had few and cannot starve
+    them. Sessions level on tags are served most urgent call first. Only the
+    waiter at the head takes a token from the rate limiter, and the slot it
+    wins goes to whoever is first in line at that moment. When the queue is
+    full the newest call of a lower priority is shed; if there is none the
+    new call is. Coroutines wait on an asyncio event that is set from
+    whichever thread or loop frees their slot. Threads hold a WSGI worker,
+    so by default they never wait: they get a free slot and token at once or
+    RateLimited (sync_wait_seconds > 0 lets them queue on a condition).
+
+    With no queue to order them, those immediate calls are kept fair by caps:
+    a session holds at most max_active_per_session slots, and lower
+    priorities leave LLM_RESERVED_SLOTS free, so summaries and explanations
+    never take the last slots from planning.
+    Retry-after hints use the average time a slot has been held.
+    """
+
+    def __init__(
+        self,
+        limiter,
+        max_active,
+        max_depth,
+        max_per_session,
+        wait_seconds,
+        sync_wait_seconds=0,
+        max_active_per_session=2,
+    ):
+        self.limiter = limiter
+        self.max_active = max_active
+        self.max_depth = max_depth
+        self.max_per_session = max_per_session
+        self.wait_seconds = wait_seconds
+        self.sync_wait_seconds = sync_wait_seconds
+        self.max_active_per_session = max_active_per_session
+        # session -> its waiting tickets, and session -> its finish tag
+        self.sessions = {}
+        self.finish_tags = {}
+        self.virtual_time = 0.0
+        self.cond = threading.Condition()
+        # ticket -> (loop, event) for coroutines parked in the queue
+        self.async_waiters = {}
+        self.depth = 0
+        self.active = 0
+        self.session_active = {}
+        # Moving average of how long a granted slot is held
+        self.hold_seconds = None
+        self.dispatching = False
+        self.metrics = {
+            priority: {"granted": 0, "shed": 0, "timed_out": 0, "waits": deque(maxlen=1000)}
+            for priority in LLM_PRIORITIES
+        }
 
-IMPORTANT RULES:
-1. If the question is unclear or lacks necessary details, ASK the user for clarification before generating SQL
-2. If you need to know which columns exist, which table to query, or what specific data they want, ASK first
-3. Be conversational and remember previous context from the chat history
-4. Only generate SQL queries when you have enough information
-5. All tables are in the 'uploads' schema - always use 'uploads.table_name' format
+    def invoke(self, llm, prompt, session_id: str = None, priority: str = "plan", timeout=None):
+        with self.slot(session_id, priority, timeout):
+            return llm.invoke(prompt)
+
+    def stream(self, llm, prompt, session_id: str = None, priority: str = "explain", timeout=None):
+        with self.slot(session_id, priority, timeout):
+            yield from llm.stream(prompt)
+
+    async def ainvoke(
+        self, llm, prompt, session_id: str = None, priority: str = "plan", timeout=None
+    ):
+        async with self.aslot(session_id, priority, timeout):
+            return await llm.ainvoke(prompt)
+
+    async def astream(
+        self, llm, prompt, session_id: str = None, priority: str = "explain", timeout=None
+    ):
+        async with self.aslot(session_id, priority, timeout):
+            async for chunk in llm.astream(prompt):
+                yield chunk
+
+    @contextmanager
+    def slot(self, session_id: str = None, priority: str = "plan", timeout=None):
+        """Hold one LLM call slot; raises RateLimited or LLMOverloaded"""
+        ticket = LLMTicket(session_id or "", priority)
+        self._admit(ticket, timeout)
+        held_from = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.cond:
+                self._release(ticket.session_key, held_from)
+
+    @asynccontextmanager
+    async def aslot(self, session_id: str = None, priority: str = "plan", timeout=None):
+        """slot for coroutines: waits on the event loop, not in a thread"""
+        ticket = LLMTicket(session_id or "", priority)
+        await self._aadmit(ticket, timeout)
+        held_from = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.cond:
+                self._release(ticket.session_key, held_from)
+
+    def _admit(self, ticket: LLMTicket, timeout):
+        wait_seconds = self.sync_wait_seconds if timeout is None else timeout
+        if wait_seconds <= 0:
+            return self._admit_now(ticket)
+        deadline = ticket.enqueued_at + wait_seconds
+        metrics = self.metrics[ticket.priority]
+        with self.cond:
+            self._enqueue(ticket)
+            while not ticket.granted:
+                if ticket.shed:
+                    metrics["shed"] += 1
+                    raise LLMOverloaded(self._retry_after())
+                remaining = deadline - time.monotonic()
+                if not self.dispatching and self.active < self.max_active:
+                    self._dispatch(ticket, remaining)
+                elif remaining <= 0:
+                    self._remove(ticket)
+                    metrics["timed_out"] += 1
+                    raise RateLimited(self._retry_after())
+                else:
+                    self.cond.wait(remaining)
+            metrics["granted"] += 1
+            metrics["waits"].append(time.monotonic() - ticket.enqueued_at)
+
+    def _admit_now(self, ticket: LLMTicket):
+        """A slot and a token right now, or RateLimited with a retry-after.
+
+        Callers already in line keep their turn: with anyone queued or
+        dispatching, the answer is to come back later. So is it for a session
+        at its own cap, or when the free slots are held back for more urgent
+        calls.
+        """
+        metrics = self.metrics[ticket.priority]
+        limit = max(1, self.max_active - LLM_RESERVED_SLOTS[ticket.priority])
+        with self.cond:
+            if self.session_active.get(ticket.session_key, 0) >= self.max_active_per_session:
+                metrics["shed"] += 1
+                raise LLMOverloaded(self._retry_after(slot_bound=True))
+            if (
+                self.depth
+                or self.dispatching
+                or self.active >= limit
+            ):
+                metrics["shed"] += 1
+                raise LLMOverloaded(self._retry_after(slot_bound=True))
+            self._take(ticket.session_key)
+        wait = self.limiter.try_acquire()
+        if wait:
+            with self.cond:
+                self._release(ticket.session_key)
+                metrics["timed_out"] += 1
+            raise RateLimited(wait)
+        with self.cond:
+            metrics["granted"] += 1
+            metrics["waits"].append(0.0)
+
+    def _dispatch(self, ticket: LLMTicket, remaining: float):
+        # Wait for a token without the lock, then grant it to the head of the line
+        self.dispatching = True
+        self.cond.release()
+        try:
+            self.limiter.acquire(timeout=max(0.0, remaining))
+        except RateLimited:
+            self.cond.acquire()
+            self.dispatching = False
+            if not ticket.shed:
+                self._remove(ticket)
+                self.metrics[ticket.priority]["timed_out"] += 1
+            self._notify()
+            raise
+        self.cond.acquire()
+        self._grant_next()
+
+    async def _aadmit(self, ticket: LLMTicket, timeout):
+        deadline = ticket.enqueued_at + (self.wait_seconds if timeout is None else timeout)
+        metrics = self.metrics[ticket.priority]
+        loop = asyncio.get_running_loop()
+        with self.cond:
+            self._enqueue(ticket)
+        try:
+            while True:
+                event = asyncio.Event()
+                with self.cond:
+                    if ticket.granted:
+                        metrics["granted"] += 1
+                        metrics["waits"].append(time.monotonic() - ticket.enqueued_at)
+                        return
+                    if ticket.shed:
+                        metrics["shed"] += 1
+                        raise LLMOverloaded(self._retry_after())
+                    remaining = deadline - time.monotonic()
+                    dispatch = not self.dispatching and self.active < self.max_active
+                    if dispatch:
+                        self.dispatching = True
+                    elif remaining <= 0:
+                        self._remove(ticket)
+                        metrics["timed_out"] += 1
+                        raise RateLimited(self._retry_after())
+                    else:
+                        self.async_waiters[ticket] = (loop, event)
+                if dispatch:
+                    await self._adispatch(ticket, remaining)
+                    continue
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self.cond:
+                        self.async_waiters.pop(ticket, None)
+        except asyncio.CancelledError:
+            # The client went away: give back the slot or the place in line
+            with self.cond:
+                if ticket.granted:
+                    self._release(ticket.session_key)
+                else:
+                    if not ticket.shed:
+                        self._remove(ticket)
+                    self._notify()
+            raise
 
-Available database schema:
-{schema_info}
+    async def _adispatch(self, ticket: LLMTicket, remaining: float):
+        try:
+            await self.limiter.acquire_async(timeout=max(0.0, remaining))
+        except RateLimited:
+            with self.cond:
+                self.dispatching = False
+                if not ticket.shed:
+                    self._remove(ticket)
+                    self.metrics[ticket.priority]["timed_out"] += 1
+                self._notify()
+            raise
+        except asyncio.CancelledError:
+            with self.cond:
+                self.dispatching = False
+                self._notify()
+            raise
+        with self.cond:
+            self._grant_next()
+
+    def _grant_next(self):
+        self.dispatching = False
+        winner = self._pop_next()
+        if winner is not None:
+            winner.granted = True
+            self._take(winner.session_key)
+        self._notify()
+
+    def _take(self, session_key: str):
+        self.active += 1
+        self.session_active[session_key] = self.session_active.get(session_key, 0) + 1
+
+    def _release(self, session_key: str, held_from: float = None):
+        self.active -= 1
+        if self.session_active[session_key] > 1:
+            self.session_active[session_key] -= 1
+        else:
+            del self.session_active[session_key]
+        if held_from is not None:
+            held = time.monotonic() - held_from
+            self.hold_seconds = (
+                held if self.hold_seconds is None else 0.8 * self.hold_seconds + 0.2 * held
+            )
+        self._notify()
 
-When you have enough information, respond with:
-ACTION: QUERY
-SQL: [your sql query here]
+    def _notify(self):
+        self.cond.notify_all()
+        for loop, event in list(self.async_waiters.values()):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # That loop has closed; its waiter is gone with it
+                pass
 
-When you need clarification, respond with:
-ACTION: CLARIFY
-QUESTION: [your clarifying question here]""",
-                ),
-                MessagesPlaceholder(variable_name="chat_history"),
-                ("human", "{input}"),
-            ]
+    def _enqueue(self, ticket: LLMTicket):
+        if len(self.sessions.get(ticket.session_key, ())) >= self.max_per_session or (
+            self.depth >= self.max_depth and not self._shed_below(ticket.priority)
+        ):
+            self.metrics[ticket.priority]["shed"] += 1
+            raise LLMOverloaded(self._retry_after())
+        self.sessions.setdefault(ticket.session_key, []).append(ticket)
+        self.depth += 1
+
+    def _shed_below(self, priority: str) -> bool:
+        rank = LLM_PRIORITIES.index(priority)
+        lower = [
+            waiting
+            for tickets in self.sessions.values()
+            for waiting in tickets
+            if LLM_PRIORITIES.index(waiting.priority) > rank
+        ]
+        if not lower:
+            return False
+        victim = max(
+            lower, key=lambda waiting: (LLM_PRIORITIES.index(waiting.priority), waiting.enqueued_at)
         )
+        self._remove(victim)
+        victim.shed = True
+        self._notify()
+        return True
+
+    def _pop_next(self):
+        best, best_key = None, None
+        for session_key, tickets in self.sessions.items():
+            start = max(self.finish_tags.get(session_key, 0.0), self.virtual_time)
+            for waiting in tickets:
+                key = (start, LLM_PRIORITIES.index(waiting.priority), waiting.enqueued_at)
+                if best_key is None or key < best_key:
+                    best, best_key = waiting, key
+        if best is None:
+            return None
+        self._remove(best)
+        self.virtual_time = best_key[0]
+        self.finish_tags[best.session_key] = self.virtual_time + 1
+        # Idle sessions at or behind the clock would restart from it anyway
+        for session_key in [
+            key
+            for key, tag in self.finish_tags.items()
+            if tag <= self.virtual_time and key not in self.sessions
+        ]:
+            del self.finish_tags[session_key]
+        return best
+
+    def _remove(self, ticket: LLMTicket):
+        tickets = self.sessions[ticket.session_key]
+        tickets.remove(ticket)
+        if not tickets:
+            del self.sessions[ticket.session_key]
+        self.depth -= 1
+
+    def _retry_after(self, slot_bound: bool = False) -> float:
+        # Everyone in line needs a token, and when all slots are taken, for
+        # their share of the slots to come free
+        token_wait = (self.depth + 1) / self.limiter.rate
+        ahead = self.depth + self.active + 1 - self.max_active
+        if slot_bound:
+            ahead = max(ahead, 1)
+        if ahead <= 0 or self.hold_seconds is None:
+            return token_wait
+        return max(token_wait, ahead / self.max_active * self.hold_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.cond:
+            queued = {priority: 0 for priority in LLM_PRIORITIES}
+            for tickets in self.sessions.values():
+                for waiting in tickets:
+                    queued[waiting.priority] += 1
+            priorities = {}
+            for priority, metrics in self.metrics.items():
+                waits = sorted(metrics["waits"])
+                priorities[priority] = {
+                    "queued": queued[priority],
+                    "granted": metrics["granted"],
+                    "shed": metrics["shed"],
+                    "timed_out": metrics["timed_out"],
+                    "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+                    "wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1)
+                    if waits
+                    else None,
+                    "wait_max_ms": round(waits[-1] * 1000, 1) if waits else None,
+                }
+            return {
+                "active": self.active,
+                "hold_seconds": round(self.hold_seconds, 3)
+                if self.hold_seconds is not None
+                else None,
+                "queued": self.depth,
+                "sessions": len(self.sessions),
+                "priorities": priorities,
+            }
 
-        self.toolkit = SQLDatabaseToolkit(db=self.db, llm=self.llm)
 
-    def query_with_conversation(self, user_input: str) -> dict:
-        """Process query with conversational context"""
-        try:
-            gemini_rate_limiter.wait_if_needed()
+llm_scheduler = LLMScheduler(
+    llm_rate_limiter,
+    max_active=getattr(settings, "LLM_MAX_CONCURRENT_CALLS", 4),
+    max_depth=getattr(settings, "LLM_QUEUE_MAX_DEPTH", 32),
+    max_per_session=getattr(settings, "LLM_QUEUE_MAX_PER_SESSION", 4),
+    wait_seconds=getattr(settings, "LLM_QUEUE_WAIT_SECONDS", 20),
+    sync_wait_seconds=getattr(settings, "LLM_QUEUE_SYNC_WAIT_SECONDS", 0),
+    max_active_per_session=getattr(settings, "LLM_MAX_ACTIVE_PER_SESSION", 2),
+)
 
-            # Get schema info
-            schema_info = self._get_schema_fast()
 
-            # Get chat history - FIXED: Use message_history directly
-            messages = self.message_history.messages
+# --- Database Engines ---
+class EngineRegistry:
+    """Process-wide SQLAlchemy engines, created lazily and shared by all requests.
 
-            # Format prompt
-            formatted_prompt = self.prompt.format_messages(
-                schema_info=schema_info, chat_history=messages, input=user_input
+    Each database URL gets one engine with a bounded, pre-pinged and
+    recycled connection pool, so a question no longer pays for a fresh
+    connection handshake per statement. Async engines (psycopg 3) are kept
+    per event loop, since their connections cannot cross loops.
+    """
+
+    def __init__(self):
+        self.engines = {}
+        self.async_engines = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+
+    def get(self, url: str = None):
+        url = url or settings.DATABASE_URL
+        engine = self.engines.get(url)
+        if engine is None:
+            with self.lock:
+                engine = self.engines.get(url)
+                if engine is None:
+                    engine = create_engine(
+                        url,
+                        pool_size=getattr(settings, "DB_POOL_SIZE", 5),
+                        max_overflow=getattr(settings, "DB_POOL_MAX_OVERFLOW", 10),
+                        pool_timeout=getattr(settings, "DB_POOL_TIMEOUT", 30),
+                        pool_recycle=getattr(settings, "DB_POOL_RECYCLE", 1800),
+                        pool_pre_ping=True,
+                    )
+                    self.engines[url] = engine
+        return engine
+
+    def get_async(self, url: str = None):
+        url = url or settings.DATABASE_URL
+        engines = self.async_engines.setdefault(asyncio.get_running_loop(), {})
+        engine = engines.get(url)
+        if engine is None:
+            engine = create_async_engine(
+                make_url(url).set(drivername="postgresql+psycopg"),
+                pool_size=getattr(settings, "DB_POOL_SIZE", 5),
+                max_overflow=getattr(settings, "DB_POOL_MAX_OVERFLOW", 10),
+                pool_timeout=getattr(settings, "DB_POOL_TIMEOUT", 30),
+                pool_recycle=getattr(settings, "DB_POOL_RECYCLE", 1800),
+                pool_pre_ping=True,
             )
+            engines[url] = engine
+        return engine
+
+    async def dispose_async(self):
+        """Close this event loop's async engines"""
+        for engine in self.async_engines.pop(asyncio.get_running_loop(), {}).values():
+            await engine.dispose()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        engines = list(self.engines.values()) + [
+            engine
+            for loop_engines in list(self.async_engines.values())
+            for engine in loop_engines.values()
+        ]
+        return [
+            {
+                "url": engine.url.render_as_string(hide_password=True),
+                "pool_size": engine.pool.size(),
+                "checked_in": engine.pool.checkedin(),
+                "checked_out": engine.pool.checkedout(),
+                "overflow": engine.pool.overflow(),
+            }
+            for engine in engines
+        ]
 
-            # Get LLM response
-            response = self.llm.invoke(formatted_prompt)
-            response_text = response.content.strip()
+    def reset_after_fork(self):
+        # Pooled sockets belong to the parent process; never reuse them
+        for engine in self.engines.values():
+            engine.dispose(close=False)
+        self.engines = {}
+        self.async_engines = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
 
-            # Check if LLM needs clarification
-            if "ACTION: CLARIFY" in response_text:
-                # Extract question
-                question_match = re.search(
-                    r"QUESTION:\s*(.+)", response_text, re.DOTALL
-                )
-                clarifying_question = (
-                    question_match.group(1).strip() if question_match else response_text
-                )
 
-                # Save to memory - FIXED: Use message_history directly
-                self.message_history.add_user_message(user_input)
-                self.message_history.add_ai_message(clarifying_question)
+engine_registry = EngineRegistry()
+os.register_at_fork(after_in_child=engine_registry.reset_after_fork)
 
-                return {
-                    "success": True,
-                    "needs_clarification": True,
-                    "question": clarifying_question,
-                    "query": "",
-                    "results": pd.DataFrame(),
-                    "explanation": clarifying_question,
-                }
 
-            # Extract SQL query
-            sql_match = re.search(r"SQL:\s*(.+)", response_text, re.DOTALL)
-            if sql_match:
-                sql_query = sql_match.group(1).strip()
-                sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-            else:
-                # Try to find SELECT statement
-                sql_match = re.search(
-                    r"(SELECT\s+.+)", response_text, re.IGNORECASE | re.DOTALL
-                )
-                if sql_match:
-                    sql_query = sql_match.group(1).strip()
-                else:
-                    # No query found, treat as clarification - FIXED
-                    self.message_history.add_user_message(user_input)
-                    self.message_history.add_ai_message(response_text)
-                    return {
-                        "success": True,
-                        "needs_clarification": True,
-                        "question": response_text,
-                        "query": "",
-                        "results": pd.DataFrame(),
-                        "explanation": response_text,
-                    }
+def get_engine(url: str = None):
+    return engine_registry.get(url)
 
-            # Security check
-            if self._is_query_unsafe(sql_query):
-                error_msg = (
-                    "Cannot query system tables. Only uploaded data can be queried."
-                )
-                # FIXED: Use message_history directly
-                self.message_history.add_user_message(user_input)
-                self.message_history.add_ai_message(error_msg)
-                return {
-                    "success": False,
-                    "error": error_msg,
-                    "results": pd.DataFrame(),
-                    "query": sql_query,
-                    "explanation": "",
-                }
 
-            # Execute query
-            results = self._execute_query(sql_query)
+def get_async_engine(url: str = None):
+    return engine_registry.get_async(url)
 
-            if results is None:
-                # Try to fix query
-                gemini_rate_limiter.wait_if_needed()
-                corrected_query = self._fix_query_fast(
-                    sql_query, user_input, schema_info
-                )
-                if corrected_query and not self._is_query_unsafe(corrected_query):
-                    results = self._execute_query(corrected_query)
-                    if results is not None:
-                        sql_query = corrected_query
 
-                if results is None:
-                    error_msg = (
-                        "Query execution failed. Could you rephrase your question?"
-                    )
-                    # FIXED: Use message_history directly
-                    self.message_history.add_user_message(user_input)
-                    self.message_history.add_ai_message(error_msg)
-                    return {
-                        "success": False,
-                        "error": error_msg,
-                        "results": pd.DataFrame(),
-                        "query": sql_query,
-                        "explanation": "",
-                    }
+def parse_lsn(lsn: str) -> int:
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
 
-            # Generate explanation
-            explanation = self._generate_explanation(results, user_input)
 
-            # Save to memory - FIXED: Use message_history directly
-            self.message_history.add_user_message(user_input)
-            self.message_history.add_ai_message(explanation)
+def current_wal_lsn(engine) -> str:
+    """The primary's WAL position, covering everything committed so far"""
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
 
-            return {
-                "success": True,
-                "results": results,
-                "query": sql_query,
-                "explanation": explanation,
-                "needs_clarification": False,
-            }
 
+def upload_written_lsn(engine) -> str:
+    """written_lsn for a finished upload; blank when there are no replicas.
+
+    The data is loaded by now, so a failed read only costs replica routing
+    its catch-up check for this dataset, not the upload.
+    """
+    if not getattr(settings, "DATABASE_REPLICA_URLS", []):
+        return ""
+    try:
+        return current_wal_lsn(engine)
+    except Exception as e:
+        logger.warning(f"Could not read the WAL position for replica routing: {str(e)}")
+        return ""
+
+
+class ReplicaRouter:
+    """Routes read-only analysis to DATABASE_REPLICA_URLS, primary otherwise.
+
+    Replicas take turns. One serves a dataset only once it has replayed the
+    WAL position its upload wrote (``written_lsn``), so a question asked
+    right after an upload never lands on a replica that lacks the tables.
+    A replica's replay position is re-read at most every
+    REPLICA_CHECK_INTERVAL_SECONDS, or sooner when a dataset needs a later
+    one. A replica that fails is skipped for REPLICA_RETRY_SECONDS. Writes
+    and chat memory never come through here.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.turn = 0
+        self.replayed = {}
+        self.down_until = {}
+        self.routed = {}
+        self.primary_reads = 0
+
+    def read_url(self, dataset: UploadedFile = None, primary_url: str = None) -> str:
+        primary_url = primary_url or settings.DATABASE_URL
+        replicas = getattr(settings, "DATABASE_REPLICA_URLS", [])
+        if not replicas:
+            return primary_url
+
+        required = (
+            parse_lsn(dataset.written_lsn)
+            if dataset is not None and dataset.written_lsn
+            else 0
+        )
+        with self.lock:
+            start = self.turn
+            self.turn += 1
+        for offset in range(len(replicas)):
+            url = replicas[(start + offset) % len(replicas)]
+            if self._caught_up(url, required):
+                with self.lock:
+                    self.routed[url] = self.routed.get(url, 0) + 1
+                return url
+
+        with self.lock:
+            self.primary_reads += 1
+        return primary_url
+
+    def _caught_up(self, url: str, required: int) -> bool:
+        now = time.time()
+        with self.lock:
+            if self.down_until.get(url, 0) > now:
+                return False
+            replayed, checked_at = self.replayed.get(url, (-1, 0.0))
+        fresh = now - checked_at < getattr(settings, "REPLICA_CHECK_INTERVAL_SECONDS", 5)
+        if fresh and replayed >= required:
+            return True
+
+        try:
+            with get_engine(url).connect() as conn:
+                lsn = conn.execute(
+                    text("SELECT pg_last_wal_replay_lsn()::text")
+                ).scalar()
         except Exception as e:
-            logger.error(f"Error in conversational query: {str(e)}")
+            self.mark_down(url, e)
+            return False
+        if lsn is None:
+            logger.warning(
+                f"{make_url(url).render_as_string(hide_password=True)} is not "
+                "in recovery; it serves only reads that need no recent upload"
+            )
+            replayed = 0
+        else:
+            replayed = parse_lsn(lsn)
+        with self.lock:
+            self.replayed[url] = (replayed, now)
+        return replayed >= required
+
+    def mark_down(self, url: str, error: Exception):
+        logger.warning(
+            f"Replica {make_url(url).render_as_string(hide_password=True)} "
+            f"unavailable: {error}"
+        )
+        with self.lock:
+            self.down_until[url] = time.time() + getattr(
+                settings, "REPLICA_RETRY_SECONDS", 30
+            )
+            self.replayed.pop(url, None)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self.lock:
             return {
-                "success": False,
-                "error": f"Error: {str(e)}",
-                "results": pd.DataFrame(),
-                "query": "",
-                "explanation": "",
+                "replicas": [
+                    {
+                        "url": make_url(url).render_as_string(hide_password=True),
+                        "reads": self.routed.get(url, 0),
+                        "down": self.down_until.get(url, 0) > now,
+                    }
+                    for url in getattr(settings, "DATABASE_REPLICA_URLS", [])
+                ],
+                "primary_reads": self.primary_reads,
             }
 
-    def _is_query_unsafe(self, query: str) -> bool:
-        """Check if query tries to access forbidden tables/schemas"""
-        query_lower = query.lower()
-        forbidden = [
-            "public.",
-            "information_schema.",
-            "chat_history",
-            "uploaded_files",
-            "chat_message_history",
-        ]
-        return any(forbidden_item in query_lower for forbidden_item in forbidden)
 
-    def _execute_query(self, query: str) -> pd.DataFrame:
-        try:
-            engine = create_engine(self.db_uri)
-            with engine.connect() as conn:
-                result = conn.execute(text(query))
-                df = pd.DataFrame(result.fetchall(), columns=result.keys())
-                return df
-        except Exception as e:
-            logger.error(f"Error executing query: {str(e)}")
-            return None
-        finally:
-            if "engine" in locals():
-                engine.dispose()
-
-    def _get_schema_fast(self) -> str:
-        try:
-            engine = create_engine(self.db_uri)
-            with engine.connect() as conn:
-                tables_query = """
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'uploads'
-                    LIMIT 10
-                """
-                tables_result = conn.execute(text(tables_query))
-                tables = [row[0] for row in tables_result]
-
-                if not tables:
-                    return "No uploaded data available. Please upload a file first."
-
-                schema_str = "AVAILABLE TABLES (uploads schema):\n\n"
-                for table in tables:
-                    columns_query = f"""
-                        SELECT column_name, data_type 
-                        FROM information_schema.columns 
-                        WHERE table_schema = 'uploads'
-                        AND table_name = '{table}'
-                        LIMIT 20
-                    """
-                    columns_result = conn.execute(text(columns_query))
-                    columns = [(row[0], row[1]) for row in columns_result]
-
-                    schema_str += f"\nTable: uploads.{table}\n"
-                    for col_name, col_type in columns:
-                        schema_str += f"  - {col_name} ({col_type})\n"
-
-                return schema_str
-        except Exception as e:
-            logger.error(f"Schema fetch error: {str(e)}")
-            return "Schema unavailable"
-        finally:
-            if "engine" in locals():
-                engine.dispose()
+replica_router = ReplicaRouter()
 
-    def _fix_query_fast(self, failed_query: str, question: str, schema: str) -> str:
-        try:
-            prompt = f"""Fix this failed query. Make it SIMPLER.
 
-SCHEMA (uploads schema):
-{schema}
+# --- Bounded Query Execution ---
+class QueryRejected(Exception):
+    """A generated query refused by the guard; the message is shown to the user"""
 
-FAILED QUERY:
-{failed_query}
 
-QUESTION: {question}
+# SQLSTATEs turned into user-facing rejections
+QUERY_CANCELED = "57014"
+READ_ONLY_SQL_TRANSACTION = "25006"
 
-RULES:
-1. ALL tables MUST use 'uploads.' prefix
-2. Keep it SIMPLE
-3. Add LIMIT 100
 
-Return ONLY the fixed query:"""
+def explain_plan(conn, query: str) -> Dict[str, Any]:
+    return conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()[0]["Plan"]
 
-            response = self.llm.invoke(prompt)
-            fixed_query = response.content.strip()
-            fixed_query = fixed_query.replace("```sql", "").replace("```", "").strip()
-            return fixed_query if "SELECT" in fixed_query.upper() else None
-        except Exception as e:
-            logger.error(f"Query fix error: {str(e)}")
-            return None
 
-    def stream_query_with_conversation(self, user_input: str):
-        """Generator that streams the analysis process"""
-        try:
-            gemini_rate_limiter.wait_if_needed()
-            yield {"type": "status", "content": "Analyzing request..."}
+def guard_query_cost(conn, query: str, max_rows: int) -> str:
+    """Return the statement to run for a generated query, or raise QueryRejected.
+
+    Plans over QUERY_MAX_PLAN_COST are refused. Plans over
+    QUERY_MAX_PLAN_ROWS run with a LIMIT just past the row cap, which is
+    all the cursor would fetch anyway. The limited plan's own cost is not
+    trusted, because Postgres prorates it optimistically.
+    """
+    max_cost = getattr(settings, "QUERY_MAX_PLAN_COST", 10_000_000)
+    max_plan_rows = getattr(settings, "QUERY_MAX_PLAN_ROWS", 1_000_000)
+
+    plan = explain_plan(conn, query)
+    if plan["Total Cost"] > max_cost:
+        raise QueryRejected(
+            f"This query is estimated to be too expensive to run "
+            f"(cost {plan['Total Cost']:,.0f}, limit {max_cost:,.0f}). "
+            "Please narrow it down with filters or aggregations."
+        )
+    if plan["Plan Rows"] > max_plan_rows:
+        logger.info(
+            f"Auto-limited query estimated at {plan['Plan Rows']} rows "
+            f"to {max_rows + 1}"
+        )
+        return f"SELECT * FROM ({query.strip().rstrip(';')}\n) AS limited LIMIT {max_rows + 1}"
+    return query
+
+
+def execute_bounded_query(
+    engine, schema: str, query: str, max_rows: int = None, max_bytes: int = None
+) -> pd.DataFrame:
+    """Run a generated query through a server-side cursor with row and byte caps.
+
+    The statement runs in a read-only transaction under
+    QUERY_STATEMENT_TIMEOUT_MS, after guard_query_cost has checked its plan.
+    Rows are fetched in batches and fetching stops at whichever cap is hit
+    first, so one ``SELECT *`` cannot pull a whole table into the worker.
+    ``df.attrs`` carries ``truncated`` and ``total_rows``; the latter is
+    None when a truncated result could not be counted within
+    QUERY_COUNT_TIMEOUT_MS.
+    """
+    max_rows = max_rows or getattr(settings, "QUERY_MAX_ROWS", 5000)
+    max_bytes = max_bytes or getattr(settings, "QUERY_MAX_BYTES", 32 * 1024 * 1024)
+    batch_rows = min(getattr(settings, "QUERY_FETCH_BATCH_ROWS", 1000), max_rows)
+    timeout_ms = getattr(settings, "QUERY_STATEMENT_TIMEOUT_MS", 30000)
+
+    try:
+        with engine.connect() as conn:
+            return _fetch_bounded(conn, schema, query, max_rows, max_bytes, batch_rows, timeout_ms)
+    except DBAPIError as e:
+        rejection = query_rejection(e, timeout_ms)
+        if rejection is not None:
+            raise rejection from e
+        raise
 
-            # Get schema info
-            schema_info = self._get_schema_fast()
 
-            # Get chat history
-            messages = self.message_history.messages
+async def aexecute_bounded_query(
+    engine, schema: str, query: str, max_rows: int = None, max_bytes: int = None
+) -> pd.DataFrame:
+    """execute_bounded_query on an async engine, without blocking the event loop"""
+    max_rows = max_rows or getattr(settings, "QUERY_MAX_ROWS", 5000)
+    max_bytes = max_bytes or getattr(settings, "QUERY_MAX_BYTES", 32 * 1024 * 1024)
+    batch_rows = min(getattr(settings, "QUERY_FETCH_BATCH_ROWS", 1000), max_rows)
+    timeout_ms = getattr(settings, "QUERY_STATEMENT_TIMEOUT_MS", 30000)
 
-            # Format prompt
-            formatted_prompt = self.prompt.format_messages(
-                schema_info=schema_info, chat_history=messages, input=user_input
+    try:
+        async with engine.connect() as conn:
+            # Same fetch as the sync path; its I/O awaits on the loop
+            return await conn.run_sync(
+                _fetch_bounded, schema, query, max_rows, max_bytes, batch_rows, timeout_ms
             )
+    except DBAPIError as e:
+        rejection = query_rejection(e, timeout_ms)
+        if rejection is not None:
+            raise rejection from e
+        raise
 
-            # 1. Initial Planning (Generate SQL or Clarify)
-            # We don't stream this part to user yet as it contains raw SQL/Actions
-            response = self.llm.invoke(formatted_prompt)
-            response_text = response.content.strip()
 
-            # Check if LLM needs clarification
-            if "ACTION: CLARIFY" in response_text:
-                question_match = re.search(
-                    r"QUESTION:\s*(.+)", response_text, re.DOTALL
-                )
-                clarifying_question = (
-                    question_match.group(1).strip() if question_match else response_text
-                )
+def query_rejection(error: DBAPIError, timeout_ms: int):
+    """The QueryRejected a guard-triggered database error stands for, if any"""
+    pgcode = getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+    if pgcode == QUERY_CANCELED:
+        return QueryRejected(
+            f"The query ran longer than {timeout_ms / 1000:g} seconds and was "
+            "cancelled. Please narrow it down with filters or aggregations."
+        )
+    if pgcode == READ_ONLY_SQL_TRANSACTION:
+        return QueryRejected("Only read-only queries can be run against uploaded data.")
+    return None
 
-                self.message_history.add_user_message(user_input)
-                self.message_history.add_ai_message(clarifying_question)
 
-                # Save to ChatHistory
-                try:
-                    ChatHistory.objects.create(
-                        session_id=self.session_id,
-                        query=user_input,
-                        response=clarifying_question,
-                        sql_query="",
-                        results_count=0,
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to save stream history (clarify): {e}")
+def execute_analysis_query(
+    dataset: UploadedFile, primary_url: str, schema: str, query: str
+) -> pd.DataFrame:
+    """execute_bounded_query on a replica that has this dataset, else the primary"""
+    url = replica_router.read_url(dataset, primary_url)
+    try:
+        return execute_bounded_query(get_engine(url), schema, query)
+    except OperationalError as e:
+        # Lost connection or a recovery conflict; the primary can still answer
+        if url == primary_url:
+            raise
+        replica_router.mark_down(url, e)
+        return execute_bounded_query(get_engine(primary_url), schema, query)
 
-                # Stream the clarification as answer
-                yield {"type": "token", "content": clarifying_question}
-                yield {
-                    "type": "complete",
-                    "data": {
-                        "success": True,
-                        "needs_clarification": True,
-                        "question": clarifying_question,
-                        "explanation": clarifying_question,
-                    },
-                }
-                return
 
-            # Extract SQL query
-            sql_match = re.search(r"SQL:\s*(.+)", response_text, re.DOTALL)
-            if sql_match:
-                sql_query = sql_match.group(1).strip()
-                sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-            else:
-                sql_match = re.search(
-                    r"(SELECT\s+.+)", response_text, re.IGNORECASE | re.DOTALL
-                )
-                if sql_match:
-                    sql_query = sql_match.group(1).strip()
-                else:
-                    # Treat as clarification
-                    self.message_history.add_user_message(user_input)
-                    self.message_history.add_ai_message(response_text)
+class RoutedSQLDatabase(SQLDatabase):
+    """SQLDatabase whose statements go through replica_router on every call.
 
-                    # Save to ChatHistory
-                    try:
-                        ChatHistory.objects.create(
-                            session_id=self.session_id,
-                            query=user_input,
-                            response=response_text,
-                            sql_query="",
-                            results_count=0,
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to save stream history (no-sql): {e}")
-
-                    yield {"type": "token", "content": response_text}
-                    yield {
-                        "type": "complete",
-                        "data": {
-                            "success": True,
-                            "needs_clarification": True,
-                            "question": response_text,
-                            "explanation": response_text,
-                        },
-                    }
-                    return
+    Tables are reflected once, on the primary. Each statement then runs on
+    whichever replica read_url picks, and on the primary if that replica
+    fails, as in execute_analysis_query.
+    """
 
-            # Security check
-            if self._is_query_unsafe(sql_query):
-                error_msg = (
-                    "Cannot query system tables. Only uploaded data can be queried."
-                )
-                self.message_history.add_user_message(user_input)
-                self.message_history.add_ai_message(error_msg)
+    # The engine of the statement in flight; per thread and per coroutine,
+    # since cached agents are shared across requests
+    _call_engine = ContextVar("routed_sql_engine", default=None)
 
-                # Save to ChatHistory
-                try:
-                    ChatHistory.objects.create(
-                        session_id=self.session_id,
-                        query=user_input,
-                        response=error_msg,
-                        sql_query=sql_query,
-                        results_count=0,
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to save stream history (security): {e}")
+    def __init__(self, dataset: UploadedFile, primary_url: str, **kwargs):
+        self.dataset = dataset
+        self.primary_url = primary_url
+        super().__init__(get_engine(primary_url), **kwargs)
 
-                yield {"type": "token", "content": error_msg}
-                yield {"type": "error", "error": error_msg}
-                return
+    @property
+    def _engine(self):
+        return self._call_engine.get() or self._primary_engine
 
-            # Execute query
-            yield {"type": "status", "content": "Executing SQL..."}
-            results = self._execute_query(sql_query)
+    @_engine.setter
+    def _engine(self, engine):
+        self._primary_engine = engine
 
-            if results is None:
-                # Retry logic
-                corrected_query = self._fix_query_fast(
-                    sql_query, user_input, schema_info
-                )
-                if corrected_query and not self._is_query_unsafe(corrected_query):
-                    results = self._execute_query(corrected_query)
-                    if results is not None:
-                        sql_query = corrected_query
+    def _execute(self, command, fetch="all", **kwargs):
+        url = replica_router.read_url(self.dataset, self.primary_url)
+        try:
+            return self._execute_on(url, command, fetch, **kwargs)
+        except OperationalError as e:
+            if url == self.primary_url:
+                raise
+            replica_router.mark_down(url, e)
+            return self._execute_on(self.primary_url, command, fetch, **kwargs)
+
+    def _execute_on(self, url, command, fetch, **kwargs):
+        token = self._call_engine.set(get_engine(url))
+        try:
+            return super()._execute(command, fetch, **kwargs)
+        finally:
+            self._call_engine.reset(token)
 
-            if results is None:
-                error_msg = "Query execution failed. Could you rephrase your question?"
-                self.message_history.add_user_message(user_input)
-                self.message_history.add_ai_message(error_msg)
 
-                # Save to ChatHistory
-                try:
-                    ChatHistory.objects.create(
-                        session_id=self.session_id,
-                        query=user_input,
-                        response=error_msg,
-                        sql_query=sql_query,
-                        results_count=0,
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to save stream history (exec-fail): {e}")
+async def aexecute_analysis_query(
+    dataset: UploadedFile, primary_url: str, schema: str, query: str
+) -> pd.DataFrame:
+    """execute_analysis_query for the async analysis path"""
+    # Replica checks are cached and rare; keep their sync probe off the loop
+    url = await asyncio.to_thread(replica_router.read_url, dataset, primary_url)
+    try:
+        return await aexecute_bounded_query(get_async_engine(url), schema, query)
+    except OperationalError as e:
+        if url == primary_url:
+            raise
+        replica_router.mark_down(url, e)
+        return await aexecute_bounded_query(get_async_engine(primary_url), schema, query)
+
+
+def _fetch_bounded(conn, schema, query, max_rows, max_bytes, batch_rows, timeout_ms):
+    # Must come first in the transaction; nothing below can write
+    conn.execute(text("SET TRANSACTION READ ONLY"))
+    # Unqualified table names resolve to this dataset only; both settings
+    # are transaction-local so they never leak into the pool
+    conn.execute(
+        text(
+            "SELECT set_config('search_path', :schema, true), "
+            "set_config('statement_timeout', :timeout, true)"
+        ),
+        {"schema": quote_identifier(schema), "timeout": str(timeout_ms)},
+    )
+    statement = guard_query_cost(conn, query, max_rows)
+    result = conn.execute(
+        text(statement).execution_options(
+            stream_results=True, max_row_buffer=batch_rows
+        )
+    )
+    columns = list(result.keys())
+
+    chunks, fetched, fetched_bytes, truncated = [], 0, 0, False
+    while True:
+        rows = result.fetchmany(min(batch_rows, max_rows - fetched))
+        if not rows:
+            break
+        chunk = pd.DataFrame(rows, columns=columns)
+        chunks.append(chunk)
+        fetched += len(chunk)
+        fetched_bytes += int(chunk.memory_usage(index=False, deep=True).sum())
+        if fetched >= max_rows or fetched_bytes >= max_bytes:
+            # One more row tells a result that exactly fills the cap apart
+            # from a cut-off one
+            truncated = result.fetchone() is not None
+            break
+    result.close()
+
+    total_rows = fetched
+    if truncated:
+        total_rows = count_query_rows(conn, query)
+
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+    df.attrs.update({"truncated": truncated, "total_rows": total_rows})
+    return df
 
-                yield {"type": "token", "content": error_msg}
-                yield {"type": "error", "error": error_msg}
-                return
 
-            # Generate Explanation (Streamed)
-            yield {"type": "status", "content": "Generating explanation..."}
+def count_query_rows(conn, query: str):
+    """Count a query's full result, or None if that is not cheap"""
+    try:
+        with conn.begin_nested():
+            conn.execute(
+                text("SELECT set_config('statement_timeout', :timeout, true)"),
+                {"timeout": str(getattr(settings, "QUERY_COUNT_TIMEOUT_MS", 2000))},
+            )
+            query = query.strip().rstrip(";")
+            return conn.execute(
+                text(f"SELECT count(*) FROM ({query}\n) AS counted")
+            ).scalar()
+    except Exception as e:
+        logger.warning(f"Could not count truncated query result: {e}")
+        return None
 
-            # Use LLM to explain results
-            full_explanation = ""
-            for token in self._generate_explanation_stream(results, user_input):
-                full_explanation += token
-                yield {"type": "token", "content": token}
 
-            # Save to memory
-            self.message_history.add_user_message(user_input)
-            self.message_history.add_ai_message(full_explanation)
+def result_limits(df: pd.DataFrame) -> Dict[str, Any]:
+    """Truncation details of a bounded query result for API responses"""
+    truncated = bool(df.attrs.get("truncated", False))
+    return {
+        "truncated": truncated,
+        "total_rows": df.attrs.get("total_rows", len(df)),
+        "row_limit": getattr(settings, "QUERY_MAX_ROWS", 5000) if truncated else None,
+    }
 
-            # Sanitize results for JSON
-            sanitized_results = (
-                sanitize_dataframe_for_json(results)
-                if not results.empty
-                else pd.DataFrame()
-            )
-            results_dict = (
-                sanitized_results.to_dict(orient="records") if not results.empty else []
-            )
 
-            # Save to Django ChatHistory (Critical for History Persistence)
-            try:
-                ChatHistory.objects.create(
-                    session_id=self.session_id,
-                    query=user_input,
-                    response=full_explanation,
-                    sql_query=sql_query,
-                    results_count=len(results_dict),
-                )
-            except Exception as e:
-                logger.error(f"Failed to save stream history: {e}")
-                # Don't fail the stream, just log
+# --- Chat Memory ---
+CHAT_HISTORY_TABLE = "chat_message_history"
 
-            yield {
-                "type": "complete",
-                "data": {
-                    "success": True,
-                    "results": results_dict,  # Send full results at end
-                    "query": sql_query,
-                    "explanation": full_explanation,
-                    "needs_clarification": False,
-                },
-            }
 
-        except Exception as e:
-            logger.error(f"Error in streaming: {str(e)}")
-            yield {"type": "error", "error": str(e)}
+class ChatMemoryPool:
+    """Process-wide psycopg pool for chat memory.
 
-    def _generate_explanation_stream(self, results_df: pd.DataFrame, question: str):
-        """Streams explanation of results using LLM"""
-        try:
-            if results_df.empty:
-                yield "No results found for your query."
-                return
+    The chat_message_history table is created by migration, never per request.
+    """
 
-            # Summarize data for prompt
-            row_count = len(results_df)
-            preview = results_df.head(5).to_string()
+    def __init__(self):
+        self.pool = None
+        self.async_pools = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
 
-            prompt = f"""
-            Question: {question}
-            Data Results ({row_count} rows total):
-            {preview}
-            
-            Please provide a concise, natural language answer to the question based on the data results. 
-            Do not mention "DataFrame" or "technical code". Just answer the user.
-            """
+    @staticmethod
+    def conninfo() -> str:
+        # psycopg wants a plain libpq URL, without a SQLAlchemy driver
+        return (
+            make_url(settings.DATABASE_URL)
+            .set(drivername="postgresql")
+            .render_as_string(hide_password=False)
+        )
 
-            # Stream response
-            for chunk in self.llm.stream(prompt):
-                if hasattr(chunk, "content"):
-                    yield chunk.content
-                else:
-                    yield str(chunk)
+    def get(self) -> ConnectionPool:
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = ConnectionPool(
+                        self.conninfo(),
+                        min_size=getattr(settings, "CHAT_MEMORY_POOL_MIN_SIZE", 1),
+                        max_size=getattr(settings, "CHAT_MEMORY_POOL_MAX_SIZE", 10),
+                        timeout=getattr(settings, "CHAT_MEMORY_POOL_TIMEOUT", 10),
+                        name="chat-memory",
+                        open=True,
+                    )
+        return self.pool
+
+    async def aget(self) -> AsyncConnectionPool:
+        """This event loop's pool, for the async analysis path"""
+        loop = asyncio.get_running_loop()
+        pool = self.async_pools.get(loop)
+        if pool is None:
+            pool = AsyncConnectionPool(
+                self.conninfo(),
+                min_size=getattr(settings, "CHAT_MEMORY_POOL_MIN_SIZE", 1),
+                max_size=getattr(settings, "CHAT_MEMORY_POOL_MAX_SIZE", 10),
+                timeout=getattr(settings, "CHAT_MEMORY_POOL_TIMEOUT", 10),
+                name="chat-memory-async",
+                open=False,
+            )
+            self.async_pools[loop] = pool
+            await pool.open()
+        return pool
 
-        except Exception as e:
-            logger.error(f"Error generating explanation stream: {str(e)}")
-            yield "Here are the results."
+    async def aclose(self):
+        """Close this event loop's pool"""
+        pool = self.async_pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool.close()
 
-    def _generate_explanation(self, results_df: pd.DataFrame, question: str) -> str:
-        # Fallback for non-streaming
-        return "".join(self._generate_explanation_stream(results_df, question))
+    def stats(self) -> Dict[str, int]:
+        return self.pool.get_stats() if self.pool is not None else {}
 
+    def reset_after_fork(self):
+        # The pool's sockets and worker threads belong to the parent process
+        self.pool = None
+        self.async_pools = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
 
-# --- Chart Generator ---
-class ChartDataGenerator:
-    """Generate chart-ready data from DataFrame"""
 
-    @staticmethod
-    def prepare_chart_data(
-        df: pd.DataFrame, chart_config: Dict[str, Any]
-    ) -> Dict[str, Any]:
+chat_memory_pool = ChatMemoryPool()
+os.register_at_fork(after_in_child=chat_memory_pool.reset_after_fork)
+
+
+class PooledChatMessageHistory(BaseChatMessageHistory):
+    """PostgresChatMessageHistory that borrows a pooled connection per call.
+
+    Connections go back to the pool as soon as each read or write finishes,
+    so an agent that is never cleaned up cannot leak one.
+    """
+
+    def __init__(self, session_id: str, table_name: str = CHAT_HISTORY_TABLE):
         try:
-            chart_type = chart_config["type"]
-            if chart_type == "bar":
-                return ChartDataGenerator._prepare_bar_data(df, chart_config)
-            elif chart_type == "line":
-                return ChartDataGenerator._prepare_line_data(df, chart_config)
-            elif chart_type == "pie":
-                return ChartDataGenerator._prepare_pie_data(df, chart_config)
-            elif chart_type == "scatter":
-                return ChartDataGenerator._prepare_scatter_data(df, chart_config)
-            else:
-                return ChartDataGenerator._prepare_bar_data(df, chart_config)
-        except Exception as e:
-            logger.error(f"Error preparing chart data: {str(e)}")
-            return {"labels": [], "datasets": [], "error": str(e)}
+            uuid.UUID(session_id)
+        except ValueError:
+            raise ValueError(
+                f"Invalid session id. Session id must be a valid UUID. Got {session_id}"
+            )
+        self.session_id = session_id
+        self.table_name = table_name
 
-    @staticmethod
-    def _prepare_bar_data(df: pd.DataFrame, config: Dict) -> Dict:
-        x_col = config.get("x_column")
-        y_col = config.get("y_column")
-        aggregation = config.get("aggregation", "sum")
-        limit = config.get("data_config", {}).get("limit", 20)
+    def _history(self, conn) -> PostgresChatMessageHistory:
+        return PostgresChatMessageHistory(
+            self.table_name, self.session_id, sync_connection=conn
+        )
 
-        if not x_col or not y_col:
-            return {"labels": [], "datasets": []}
+    @property
+    def messages(self):
+        with chat_memory_pool.get().connection() as conn:
+            return self._history(conn).get_messages()
 
-        if aggregation == "count":
-            grouped = df.groupby(x_col).size().reset_index(name=y_col)
-        elif aggregation == "sum":
-            grouped = df.groupby(x_col)[y_col].sum().reset_index()
-        elif aggregation == "avg":
-            grouped = df.groupby(x_col)[y_col].mean().reset_index()
-        else:
-            grouped = df[[x_col, y_col]].copy()
+    def add_messages(self, messages) -> None:
+        with chat_memory_pool.get().connection() as conn:
+            self._history(conn).add_messages(messages)
 
-        grouped = grouped.nlargest(limit, y_col)
-        grouped = grouped.replace([np.inf, -np.inf], np.nan).dropna()
-        colors = ChartDataGenerator._generate_colors(len(grouped))
+    def clear(self) -> None:
+        with chat_memory_pool.get().connection() as conn:
+            self._history(conn).clear()
 
-        return {
-            "labels": grouped[x_col].astype(str).tolist(),
-            "datasets": [
-                {
-                    "label": y_col,
-                    "data": grouped[y_col].tolist(),
-                    "backgroundColor": colors,
-                    "borderColor": [c.replace("0.8", "1") for c in colors],
-                    "borderWidth": 2,
-                }
-            ],
-        }
+    def _async_history(self, conn) -> PostgresChatMessageHistory:
+        return PostgresChatMessageHistory(
+            self.table_name, self.session_id, async_connection=conn
+        )
+
+    async def aget_messages(self):
+        async with (await chat_memory_pool.aget()).connection() as conn:
+            return await self._async_history(conn).aget_messages()
+
+    async def aadd_messages(self, messages) -> None:
+        async with (await chat_memory_pool.aget()).connection() as conn:
+            await self._async_history(conn).aadd_messages(messages)
+
+    async def aclear(self) -> None:
+        async with (await chat_memory_pool.aget()).connection() as conn:
+            await self._async_history(conn).aclear()
+
+    def messages_after(self, after_id: int, limit: int, newest: bool = True) -> List:
+        """Up to ``limit`` (id, message) pairs stored after ``after_id``, oldest first.
+
+        ``newest`` picks the latest such messages, otherwise the earliest.
+        """
+        with chat_memory_pool.get().connection() as conn:
+            rows = conn.execute(
+                self._window_query(newest), (self.session_id, after_id, limit)
+            ).fetchall()
+        return self._window_rows(rows, newest)
+
+    async def amessages_after(
+        self, after_id: int, limit: int, newest: bool = True
+    ) -> List:
+        async with (await chat_memory_pool.aget()).connection() as conn:
+            cursor = await conn.execute(
+                self._window_query(newest), (self.session_id, after_id, limit)
+            )
+            rows = await cursor.fetchall()
+        return self._window_rows(rows, newest)
+
+    def _window_query(self, newest: bool):
+        # Served by the (session_id, id) index without reading the whole session
+        return pg_sql.SQL(
+            "SELECT id, message FROM {} WHERE session_id = %s AND id > %s "
+            "ORDER BY id {} LIMIT %s"
+        ).format(
+            pg_sql.Identifier(self.table_name),
+            pg_sql.SQL("DESC" if newest else "ASC"),
+        )
 
     @staticmethod
-    def _prepare_line_data(df: pd.DataFrame, config: Dict) -> Dict:
-        x_col = config.get("x_column")
-        y_col = config.get("y_column")
-        limit = config.get("data_config", {}).get("limit", 50)
+    def _window_rows(rows, newest: bool) -> List:
+        if newest:
+            rows = rows[::-1]
+        messages = messages_from_dict([row[1] for row in rows])
+        return [(row[0], message) for row, message in zip(rows, messages)]
 
-        if not x_col or not y_col:
-            return {"labels": [], "datasets": []}
 
-        sorted_df = df[[x_col, y_col]].sort_values(x_col).head(limit)
-        sorted_df = sorted_df.replace([np.inf, -np.inf], np.nan).dropna()
+def run_blocking(func):
+    """sync_to_async on the shared executor instead of a thread per request.
 
-        return {
-            "labels": sorted_df[x_col].astype(str).tolist(),
-            "datasets": [
-                {
-                    "label": y_col,
-                    "data": sorted_df[y_col].tolist(),
-                    "borderColor": "rgba(16, 185, 129, 1)",
-                    "backgroundColor": "rgba(16, 185, 129, 0.1)",
-                    "tension": 0.4,
-                    "fill": False,
-                    "borderWidth": 3,
-                }
-            ],
-        }
+    What the async path hands over (ORM writes, caches, the result store) is
+    thread-safe, so a question in flight does not need a thread of its own.
+    Django connections opened on executor threads get the request-cycle
+    treatment around each call: past CONN_MAX_AGE or unusable, they close.
+    """
 
-    @staticmethod
-    def _prepare_pie_data(df: pd.DataFrame, config: Dict) -> Dict:
-        x_col = config.get("x_column")
-        y_col = config.get("y_column")
-        limit = config.get("data_config", {}).get("limit", 10)
+    @wraps(func)
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
 
-        if not x_col or not y_col:
-            return {"labels": [], "datasets": []}
+    return sync_to_async(call, thread_sensitive=False)
 
-        grouped = df.groupby(x_col)[y_col].sum().reset_index()
-        grouped = grouped.nlargest(limit, y_col)
-        grouped = grouped.replace([np.inf, -np.inf], np.nan).dropna()
-        colors = ChartDataGenerator._generate_colors(len(grouped))
 
-        return {
-            "labels": grouped[x_col].astype(str).tolist(),
-            "datasets": [
-                {
-                    "data": grouped[y_col].tolist(),
-                    "backgroundColor": colors,
-                    "borderWidth": 2,
-                    "borderColor": "#1a1a1a",
-                }
-            ],
-        }
+class ConversationMemory:
+    """Chat history for the prompt: a rolling summary plus the recent turns.
+
+    Only the messages after the summarized point are read, capped at the
+    window plus one summary batch, so prompt size stays flat however long
+    a session runs. When a read hits the cap, the oldest batch outside the
+    window is folded into the session's summary in the background.
+    """
+
+    def __init__(self):
+        self.executor = None
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.llm = None
 
     @staticmethod
-    def _prepare_scatter_data(df: pd.DataFrame, config: Dict) -> Dict:
-        x_col = config.get("x_column")
-        y_col = config.get("y_column")
-        limit = config.get("data_config", {}).get("limit", 100)
+    def window_messages() -> int:
+        return 2 * getattr(settings, "CHAT_MEMORY_WINDOW_TURNS", 6)
 
-        if not x_col or not y_col:
-            return {"datasets": []}
+    @staticmethod
+    def batch_messages() -> int:
+        return 2 * max(1, getattr(settings, "CHAT_MEMORY_SUMMARY_BATCH_TURNS", 4))
 
-        sample_df = df[[x_col, y_col]].head(limit)
-        sample_df = sample_df.replace([np.inf, -np.inf], np.nan).dropna()
-        scatter_data = [
-            {"x": float(row[x_col]), "y": float(row[y_col])}
-            for _, row in sample_df.iterrows()
-        ]
-
-        return {
-            "datasets": [
-                {
-                    "label": f"{y_col} vs {x_col}",
-                    "data": scatter_data,
-                    "backgroundColor": "rgba(236, 72, 153, 0.6)",
-                    "borderColor": "rgba(236, 72, 153, 1)",
-                    "pointRadius": 6,
-                }
-            ]
-        }
+    def read_limit(self) -> int:
+        return self.window_messages() + self.batch_messages()
 
     @staticmethod
-    def _generate_colors(count: int) -> List[str]:
-        base_colors = [
-            "rgba(239, 68, 68, 0.8)",
-            "rgba(251, 146, 60, 0.8)",
-            "rgba(245, 158, 11, 0.8)",
-            "rgba(234, 179, 8, 0.8)",
-            "rgba(132, 204, 22, 0.8)",
-            "rgba(34, 197, 94, 0.8)",
-            "rgba(16, 185, 129, 0.8)",
-            "rgba(20, 184, 166, 0.8)",
-            "rgba(6, 182, 212, 0.8)",
-            "rgba(14, 165, 233, 0.8)",
-            "rgba(59, 130, 246, 0.8)",
-            "rgba(99, 102, 241, 0.8)",
-            "rgba(139, 92, 246, 0.8)",
-            "rgba(168, 85, 247, 0.8)",
-            "rgba(217, 70, 239, 0.8)",
-            "rgba(236, 72, 153, 0.8)",
-            "rgba(244, 63, 94, 0.8)",
-        ]
-        return [base_colors[i % len(base_colors)] for i in range(count)]
+    def _summary(session_id: str):
+        state = (
+            ChatSession.objects.filter(session_id=session_id)
+            .values_list("memory_summary", "memory_summarized_through")
+            .first()
+        )
+        return state or ("", 0)
 
+    def load(self, session_id: str) -> List:
+        summary, through = self._summary(session_id)
+        rows = PooledChatMessageHistory(session_id).messages_after(
+            through, self.read_limit()
+        )
+        return self._window(session_id, summary, rows)
 
-# --- Visualization Agent ---
-class OptimizedVisualizationAgent:
-    """Rule-based visualization agent"""
+    async def aload(self, session_id: str) -> List:
+        summary, through = await run_blocking(self._summary)(session_id)
+        rows = await PooledChatMessageHistory(session_id).amessages_after(
+            through, self.read_limit()
+        )
+        return self._window(session_id, summary, rows)
+
+    def _window(self, session_id: str, summary: str, rows) -> List:
+        if len(rows) >= self.read_limit():
+            self.schedule_fold(session_id)
+        messages = [message for _, message in rows]
+        if summary:
+            messages.insert(
+                0, SystemMessage(content=f"Summary of the earlier conversation: {summary}")
+            )
+        return messages
 
-    def __init__(self, api_key: str = None):
-        self.api_key = api_key
+    def schedule_fold(self, session_id: str):
+        with self.lock:
+            if session_id in self.pending:
+                return
+            self.pending.add(session_id)
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="chat-memory-summary"
+                )
+        self.executor.submit(self._fold_job, session_id)
 
-    def analyze(self, df: pd.DataFrame, question: str = "") -> Dict[str, Any]:
+    def _fold_job(self, session_id: str):
         try:
-            summary = self._analyze_data(df)
-            charts = self._recommend_charts_rule_based(df, summary, question)
-            insights = self._generate_insights_rule_based(df, summary, question)
+            while self.fold(session_id):
+                pass
+        except Exception as e:
+            # The window stays capped meanwhile; the next full read retries
+            logger.warning(f"Chat memory summary failed for {session_id}: {str(e)}")
+        finally:
+            with self.lock:
+                self.pending.discard(session_id)
+
+    def fold(self, session_id: str) -> bool:
+        """Fold the oldest batch outside the window into the summary.
+
+        The fold is claimed on the session row before the summary call, so
+        of concurrent folds (in any process) only one pays for it. A claim
+        left by a crashed fold lapses after CHAT_MEMORY_FOLD_LEASE_SECONDS.
+        """
+        summary, through = self._summary(session_id)
+        rows = PooledChatMessageHistory(session_id).messages_after(
+            through, self.read_limit(), newest=False
+        )
+        if len(rows) < self.read_limit():
+            return False
+        batch = rows[: self.batch_messages()]
+        messages = [message for _, message in batch]
+
+        # The summary needs a row to land on
+        ChatSession.objects.get_or_create(
+            session_id=session_id,
+            defaults={
+                "title": next(
+                    (m.content for m in messages if m.type == "human"), session_id
+                )[:100]
+            },
+        )
+        claimed_at = timezone.now()
+        lease = timedelta(seconds=getattr(settings, "CHAT_MEMORY_FOLD_LEASE_SECONDS", 300))
+        claimed = (
+            ChatSession.objects.filter(
+                session_id=session_id, memory_summarized_through=through
+            )
+            .filter(
+                Q(memory_fold_started_at__isnull=True)
+                | Q(memory_fold_started_at__lt=claimed_at - lease)
+            )
+            .update(memory_fold_started_at=claimed_at)
+        )
+        if not claimed:
+            return False
+
+        claim = ChatSession.objects.filter(
+            session_id=session_id, memory_fold_started_at=claimed_at
+        )
+        try:
+            updated_summary = self._summarize(session_id, summary, messages)
+        except Exception:
+            claim.update(memory_fold_started_at=None)
+            raise
+        return bool(
+            claim.update(
+                memory_summary=updated_summary,
+                memory_summarized_through=batch[-1][0],
+                memory_fold_started_at=None,
+            )
+        )
+
+    def _summarize(self, session_id: str, summary: str, messages) -> str:
+        max_words = getattr(settings, "CHAT_MEMORY_SUMMARY_MAX_WORDS", 200)
+        transcript = "\n".join(
+            f"{'User' if message.type == 'human' else 'Assistant'}: {message.content}"
+            for message in messages
+        )
+        prompt = f"""Update the running summary of a conversation between a user and a SQL data analysis assistant.
+
+CURRENT SUMMARY:
+{summary or "(none)"}
+
+NEW TURNS:
+{transcript}
+
+Keep the tables, columns, filters and preferences the user referred to and what the answers found. Use at most {max_words} words.
+Return ONLY the updated summary:"""
+        # A background thread, so it may queue like a coroutine would
+        response = llm_scheduler.invoke(
+            self._get_llm(), prompt, session_id, "summary", llm_scheduler.wait_seconds
+        )
+        # Hard cap in case the model ignores the limit
+        return " ".join(response.content.split()[: max_words * 2])
+
+    def _get_llm(self):
+        if self.llm is None:
+            self.llm = ChatOpenAI(
+                model="gpt-4o-mini",
+                temperature=0,
+                openai_api_key=get_api_key(),
+                timeout=30,
+                max_retries=1,
+            )
+        return self.llm
+
+    def reset_after_fork(self):
+        self.executor = None
+        self.pending = set()
+        self.lock = threading.Lock()
+
+
+conversation_memory = ConversationMemory()
+os.register_at_fork(after_in_child=conversation_memory.reset_after_fork)
+
+
+async def close_loop_resources():
+    """Close the async engines and pools bound to the running event loop.
+
+    Under ASGI there is one long-lived loop and they are kept. Async views
+    served by WSGI get a fresh loop per call, so those calls clean up here.
+    """
+    await engine_registry.dispose_async()
+    await chat_memory_pool.aclose()
+
+
+class ConversationalSQLAgent:
+    """SQL Agent with conversational memory"""
+
+    def __init__(
+        self, db_uri: str, api_key: str, session_id: str, dataset: UploadedFile = None
+    ):
+        self.db_uri = db_uri
+        self.session_id = session_id
+        self.dataset = dataset
+        self.schema = dataset.dataset_schema if dataset is not None else "uploads"
+
+        self.llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0,
+            openai_api_key=api_key,
+            timeout=15,
+            max_retries=1,
+        )
+
+        # Initialize memory with PostgreSQL (pooled connections)
+        self.message_history = PooledChatMessageHistory(session_id)
+
+        # Create conversational prompt
+        self.prompt = ChatPromptTemplate.from_messages(
+            [
+                (
+                    "system",
+                    """You are a helpful SQL assistant with access to a database. You help users query their data.
+
+IMPORTANT RULES:
+1. If the question is unclear or lacks necessary details, ASK the user for clarification before generating SQL
+2. If you need to know which columns exist, which table to query, or what specific data they want, ASK first
+3. Be conversational and remember previous context from the chat history
+4. Only generate SQL queries when you have enough information
+5. All tables are in the '{dataset_schema}' schema - always use '{dataset_schema}.table_name' format
+
+Available database schema:
+{schema_info}
+
+When you have enough information, respond with:
+ACTION: QUERY
+SQL: [your sql query here]
+
+When you need clarification, respond with:
+ACTION: CLARIFY
+QUESTION: [your clarifying question here]""",
+                ),
+                MessagesPlaceholder(variable_name="chat_history"),
+                ("human", "{input}"),
+            ]
+        ).partial(dataset_schema=self.schema)
+
+    # The question path never uses these: build them (and reflect the
+    # schema) only if something asks for them
+    @cached_property
+    def db(self) -> SQLDatabase:
+        # Sample values come from the upload's column profile catalog
+        return RoutedSQLDatabase(
+            self.dataset,
+            self.db_uri,
+            schema=self.schema,
+            include_tables=None,
+            sample_rows_in_table_info=0,
+        )
+
+    @cached_property
+    def toolkit(self) -> SQLDatabaseToolkit:
+        return SQLDatabaseToolkit(db=self.db, llm=self.llm)
+
+    def query_with_conversation(self, user_input: str) -> dict:
+        """Process query with conversational context"""
+        try:
+            # Summary plus recent turns, not the whole history
+            messages = conversation_memory.load(self.session_id)
+
+            # Generate SQL, or reuse SQL generated for this question before
+            plan = self._plan_query(user_input, messages)
+            if "clarification" in plan:
+                # Save to memory - FIXED: Use message_history directly
+                self.message_history.add_user_message(user_input)
+                self.message_history.add_ai_message(plan["clarification"])
+
+                return {
+                    "success": True,
+                    "needs_clarification": True,
+                    "question": plan["clarification"],
+                    "query": "",
+                    "results": pd.DataFrame(),
+                    "explanation": plan["clarification"],
+                }
+            sql_query = plan["sql"]
+
+            # Security check
+            if self._is_query_unsafe(sql_query):
+                error_msg = (
+                    "Cannot query system tables. Only uploaded data can be queried."
+                )
+                # FIXED: Use message_history directly
+                self.message_history.add_user_message(user_input)
+                self.message_history.add_ai_message(error_msg)
+                return {
+                    "success": False,
+                    "error": error_msg,
+                    "results": pd.DataFrame(),
+                    "query": sql_query,
+                    "explanation": "",
+                }
+
+            # Execute query
+            results, rejection = self._execute_query(sql_query)
+
+            if results is None:
+                if plan["cached"]:
+                    question_sql_cache.discard(plan["ticket"])
+                # Try to fix query
+                corrected_query = self._fix_query_fast(
+                    sql_query, user_input, self._plan_schema_info(plan, messages, user_input)
+                )
+                if corrected_query and not self._is_query_unsafe(corrected_query):
+                    results, rejection = self._execute_query(corrected_query)
+                    if results is not None:
+                        sql_query = corrected_query
+
+                if results is None:
+                    error_msg = (
+                        rejection
+                        or "Query execution failed. Could you rephrase your question?"
+                    )
+                    # FIXED: Use message_history directly
+                    self.message_history.add_user_message(user_input)
+                    self.message_history.add_ai_message(error_msg)
+                    return {
+                        "success": False,
+                        "error": error_msg,
+                        "results": pd.DataFrame(),
+                        "query": sql_query,
+                        "explanation": "",
+                    }
+
+            self._remember_plan(plan, sql_query)
+
+            # Generate explanation
+            explanation = self._generate_explanation(results, user_input)
+
+            # Save to memory - FIXED: Use message_history directly
+            self.message_history.add_user_message(user_input)
+            self.message_history.add_ai_message(explanation)
 
             return {
                 "success": True,
-                "summary": summary,
-                "charts": charts,
-                "insights": insights,
-                "error": "",
+                "results": results,
+                "query": sql_query,
+                "explanation": explanation,
+                "needs_clarification": False,
             }
+
+        except RateLimited:
+            raise
         except Exception as e:
-            logger.error(f"Error in visualization analysis: {str(e)}")
+            logger.error(f"Error in conversational query: {str(e)}")
             return {
                 "success": False,
-                "error": str(e),
-                "summary": {},
-                "charts": [],
-                "insights": "",
+                "error": f"Error: {str(e)}",
+                "results": pd.DataFrame(),
+                "query": "",
+                "explanation": "",
             }
 
-    def _analyze_data(self, df: pd.DataFrame) -> Dict[str, Any]:
-        summary = {
-            "row_count": len(df),
-            "column_count": len(df.columns),
-            "columns": {},
-            "numeric_columns": [],
-            "categorical_columns": [],
-        }
+    def _plan_query(self, user_input: str, messages) -> dict:
+        """SQL for this turn, or a clarifying question.
 
-        for col in df.columns:
-            col_data = df[col]
-            col_info = {
-                "name": col,
-                "dtype": str(col_data.dtype),
-                "unique_count": int(col_data.nunique()),
-            }
+        SQL generated earlier for the same question on the same data is
+        reused without an LLM call or a rate limiter slot.
+        """
+        ticket, cached_sql = question_sql_cache.lookup(self.schema, user_input, messages)
+        if cached_sql:
+            return {"sql": cached_sql, "ticket": ticket, "cached": True, "schema_info": None}
 
-            if pd.api.types.is_numeric_dtype(col_data):
-                summary["numeric_columns"].append(col)
-                if not col_data.isna().all():
-                    col_info.update(
-                        {"min": float(col_data.min()), "max": float(col_data.max())}
-                    )
-            else:
-                summary["categorical_columns"].append(col)
+        # Get schema info relevant to this turn of the conversation
+        schema_info = self._get_schema_fast(self._relevance_text(messages, user_input))
 
-            summary["columns"][col] = col_info
+        # Format prompt
+        formatted_prompt = self.prompt.format_messages(
+            schema_info=schema_info, chat_history=messages, input=user_input
+        )
 
-        return summary
+        # Get LLM response; raises RateLimited when no slot frees up in time
+        response = llm_scheduler.invoke(self.llm, formatted_prompt, self.session_id, "plan")
+        return self._parse_plan(response.content.strip(), ticket, schema_info)
 
-    def _recommend_charts_rule_based(
-        self, df: pd.DataFrame, summary: Dict, question: str
-    ) -> List[Dict]:
-        charts = []
-        numeric_cols = summary["numeric_columns"]
-        categorical_cols = summary["categorical_columns"]
-        question_lower = question.lower()
+    async def _aplan_query(self, user_input: str, messages) -> dict:
+        """_plan_query for the async path"""
+        ticket, cached_sql = await run_blocking(question_sql_cache.lookup)(
+            self.schema, user_input, messages
+        )
+        if cached_sql:
+            return {"sql": cached_sql, "ticket": ticket, "cached": True, "schema_info": None}
 
-        # Only generate 1 most relevant chart
-        if categorical_cols and numeric_cols:
-            cat_col = categorical_cols[0]
-            num_col = numeric_cols[0]
-            unique_count = summary["columns"][cat_col]["unique_count"]
+        schema_info = await run_blocking(self._get_schema_fast)(
+            self._relevance_text(messages, user_input)
+        )
+        formatted_prompt = self.prompt.format_messages(
+            schema_info=schema_info, chat_history=messages, input=user_input
+        )
+        response = await llm_scheduler.ainvoke(
+            self.llm, formatted_prompt, self.session_id, "plan"
+        )
+        return self._parse_plan(response.content.strip(), ticket, schema_info)
 
-            if unique_count <= 15:
-                charts.append(
+    @staticmethod
+    def _parse_plan(response_text: str, ticket, schema_info: str) -> dict:
+        # Check if LLM needs clarification
+        if "ACTION: CLARIFY" in response_text:
+            question_match = re.search(r"QUESTION:\s*(.+)", response_text, re.DOTALL)
+            return {
+                "clarification": question_match.group(1).strip()
+                if question_match
+                else response_text
+            }
+
+        # Extract SQL query
+        sql_match = re.search(r"SQL:\s*(.+)", response_text, re.DOTALL)
+        if sql_match:
+            sql_query = sql_match.group(1).strip()
+            sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
+        else:
+            # Try to find SELECT statement
+            sql_match = re.search(
+                r"(SELECT\s+.+)", response_text, re.IGNORECASE | re.DOTALL
+            )
+            if not sql_match:
+                # No query found, treat as clarification
+                return {"clarification": response_text}
+            sql_query = sql_match.group(1).strip()
+
+        return {"sql": sql_query, "ticket": ticket, "cached": False, "schema_info": schema_info}
+
+    def _plan_schema_info(self, plan: dict, messages, user_input: str) -> str:
+        # A cached plan skipped the schema lookup; query fixes still need it
+        return plan["schema_info"] or self._get_schema_fast(
+            self._relevance_text(messages, user_input)
+        )
+
+    async def _aplan_schema_info(self, plan: dict, messages, user_input: str) -> str:
+        if plan["schema_info"]:
+            return plan["schema_info"]
+        return await run_blocking(self._get_schema_fast)(
+            self._relevance_text(messages, user_input)
+        )
+
+    @staticmethod
+    def _remember_plan(plan: dict, sql_query: str):
+        """Cache SQL that ran, unless it is exactly what the cache served"""
+        if not plan["cached"] or sql_query != plan["sql"]:
+            question_sql_cache.store(plan["ticket"], sql_query)
+
+    def _is_query_unsafe(self, query: str) -> bool:
+        """Check if query tries to access forbidden tables/schemas"""
+        query_lower = query.lower()
+        forbidden = [
+            "public.",
+            "information_schema.",
+            "pg_catalog.",
+            "chat_history",
+            "uploaded_files",
+            "session_datasets",
+            "chat_message_history",
+        ]
+        if any(forbidden_item in query_lower for forbidden_item in forbidden):
+            return True
+        return references_other_dataset(query_lower, self.schema)
+
+    def _execute_query(self, query: str):
+        """Return ``(df, rejection)``: the results, or None and why it was refused.
+
+        The rejection is returned rather than kept on the agent, which is
+        shared by concurrent requests of one session.
+        """
+        try:
+            return (
+                execute_analysis_query(self.dataset, self.db_uri, self.schema, query),
+                None,
+            )
+        except QueryRejected as e:
+            logger.warning(f"Query rejected: {str(e)}")
+            return None, str(e)
+        except Exception as e:
+            logger.error(f"Error executing query: {str(e)}")
+            return None, None
+
+    async def _aexecute_query(self, query: str):
+        try:
+            return (
+                await aexecute_analysis_query(
+                    self.dataset, self.db_uri, self.schema, query
+                ),
+                None,
+            )
+        except QueryRejected as e:
+            logger.warning(f"Query rejected: {str(e)}")
+            return None, str(e)
+        except Exception as e:
+            logger.error(f"Error executing query: {str(e)}")
+            return None, None
+
+    @staticmethod
+    def _relevance_text(messages, user_input: str) -> str:
+        """The question plus the user's last two turns, so follow-ups keep their tables"""
+        previous = [
+            message.content for message in messages if message.type == "human"
+        ][-2:]
+        return " ".join(previous + [user_input])
+
+    def _get_schema_fast(self, question: str = "") -> str:
+        try:
+            return describe_dataset_schema(
+                self.db_uri, self.schema, self.dataset, question
+            )
+        except Exception as e:
+            logger.error(f"Schema fetch error: {str(e)}")
+            return "Schema unavailable"
+
+    def _fix_prompt(self, failed_query: str, question: str, schema: str) -> str:
+        return f"""Fix this failed query. Make it SIMPLER.
+
+SCHEMA ({self.schema} schema):
+{schema}
+
+FAILED QUERY:
+{failed_query}
+
+QUESTION: {question}
+
+RULES:
+1. ALL tables MUST use '{self.schema}.' prefix
+2. Keep it SIMPLE
+3. Add LIMIT 100
+
+Return ONLY the fixed query:"""
+
+    @staticmethod
+    def _parse_fixed_query(response_text: str) -> str:
+        fixed_query = response_text.strip()
+        fixed_query = fixed_query.replace("```sql", "").replace("```", "").strip()
+        return fixed_query if "SELECT" in fixed_query.upper() else None
+
+    def _fix_query_fast(self, failed_query: str, question: str, schema: str) -> str:
+        try:
+            prompt = self._fix_prompt(failed_query, question, schema)
+            response = llm_scheduler.invoke(self.llm, prompt, self.session_id, "retry")
+            return self._parse_fixed_query(response.content)
+        except Exception as e:
+            logger.error(f"Query fix error: {str(e)}")
+            return None
+
+    async def _afix_query_fast(self, failed_query: str, question: str, schema: str) -> str:
+        try:
+            prompt = self._fix_prompt(failed_query, question, schema)
+            response = await llm_scheduler.ainvoke(self.llm, prompt, self.session_id, "retry")
+            return self._parse_fixed_query(response.content)
+        except Exception as e:
+            logger.error(f"Query fix error: {str(e)}")
+            return None
+
+    def stream_query_with_conversation(self, user_input: str):
+        """Generator that streams the analysis process"""
+        try:
+            yield {"type": "status", "content": "Analyzing request..."}
+
+            # Summary plus recent turns, not the whole history
+            messages = conversation_memory.load(self.session_id)
+
+            # 1. Initial Planning (Generate SQL or Clarify)
+            # We don't stream this part to user yet as it contains raw SQL/Actions
+            plan = self._plan_query(user_input, messages)
+            if "clarification" in plan:
+                clarifying_question = plan["clarification"]
+                self.message_history.add_user_message(user_input)
+                self.message_history.add_ai_message(clarifying_question)
+
+                # Save to ChatHistory
+                try:
+                    ChatHistory.objects.create(
+                        session_id=self.session_id,
+                        query=user_input,
+                        response=clarifying_question,
+                        sql_query="",
+                        results_count=0,
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to save stream history (clarify): {e}")
+
+                # Stream the clarification as answer
+                yield {"type": "token", "content": clarifying_question}
+                yield {
+                    "type": "complete",
+                    "data": {
+                        "success": True,
+                        "needs_clarification": True,
+                        "question": clarifying_question,
+                        "explanation": clarifying_question,
+                    },
+                }
+                return
+            sql_query = plan["sql"]
+
+            # Security check
+            if self._is_query_unsafe(sql_query):
+                error_msg = (
+                    "Cannot query system tables. Only uploaded data can be queried."
+                )
+                self.message_history.add_user_message(user_input)
+                self.message_history.add_ai_message(error_msg)
+
+                # Save to ChatHistory
+                try:
+                    ChatHistory.objects.create(
+                        session_id=self.session_id,
+                        query=user_input,
+                        response=error_msg,
+                        sql_query=sql_query,
+                        results_count=0,
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to save stream history (security): {e}")
+
+                yield {"type": "token", "content": error_msg}
+                yield {"type": "error", "error": error_msg}
+                return
+
+            # Execute query
+            yield {"type": "status", "content": "Executing SQL..."}
+            results, rejection = self._execute_query(sql_query)
+
+            if results is None:
+                if plan["cached"]:
+                    question_sql_cache.discard(plan["ticket"])
+                # Retry logic
+                corrected_query = self._fix_query_fast(
+                    sql_query, user_input, self._plan_schema_info(plan, messages, user_input)
+                )
+                if corrected_query and not self._is_query_unsafe(corrected_query):
+                    results, rejection = self._execute_query(corrected_query)
+                    if results is not None:
+                        sql_query = corrected_query
+
+            if results is None:
+                error_msg = (
+                    rejection
+                    or "Query execution failed. Could you rephrase your question?"
+                )
+                self.message_history.add_user_message(user_input)
+                self.message_history.add_ai_message(error_msg)
+
+                # Save to ChatHistory
+                try:
+                    ChatHistory.objects.create(
+                        session_id=self.session_id,
+                        query=user_input,
+                        response=error_msg,
+                        sql_query=sql_query,
+                        results_count=0,
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to save stream history (exec-fail): {e}")
+
+                yield {"type": "token", "content": error_msg}
+                yield {"type": "error", "error": error_msg}
+                return
+
+            self._remember_plan(plan, sql_query)
+
+            # Generate Explanation (Streamed)
+            yield {"type": "status", "content": "Generating explanation..."}
+
+            # Use LLM to explain results
+            full_explanation = ""
+            for token in self._generate_explanation_stream(results, user_input):
+                full_explanation += token
+                yield {"type": "token", "content": token}
+
+            # Save to memory
+            self.message_history.add_user_message(user_input)
+            self.message_history.add_ai_message(full_explanation)
+
+            # Keep the result server-side and send its first page
+            published = publish_result(results, self.session_id, sql_query)
+
+            # Save to Django ChatHistory (Critical for History Persistence)
+            try:
+                ChatHistory.objects.create(
+                    session_id=self.session_id,
+                    query=user_input,
+                    response=full_explanation,
+                    sql_query=sql_query,
+                    results_count=len(results),
+                )
+            except Exception as e:
+                logger.error(f"Failed to save stream history: {e}")
+                # Don't fail the stream, just log
+
+            yield {
+                "type": "complete",
+                "data": {
+                    "success": True,
+                    "query": sql_query,
+                    "explanation": full_explanation,
+                    "needs_clarification": False,
+                    **published,
+                },
+            }
+
+        except RateLimited as e:
+            yield {"type": "error", "error": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            logger.error(f"Error in streaming: {str(e)}")
+            yield {"type": "error", "error": str(e)}
+
+    async def astream_query_with_conversation(self, user_input: str):
+        """stream_query_with_conversation on the event loop.
+
+        LLM calls, the query and chat memory are awaited, so a waiting
+        question holds no thread; ORM writes and the result store run
+        through run_blocking.
+        """
+        try:
+            yield {"type": "status", "content": "Analyzing request..."}
+
+            messages = await conversation_memory.aload(self.session_id)
+
+            plan = await self._aplan_query(user_input, messages)
+            if "clarification" in plan:
+                clarifying_question = plan["clarification"]
+                await self._aremember_turn(user_input, clarifying_question, "", 0)
+                yield {"type": "token", "content": clarifying_question}
+                yield {
+                    "type": "complete",
+                    "data": {
+                        "success": True,
+                        "needs_clarification": True,
+                        "question": clarifying_question,
+                        "explanation": clarifying_question,
+                    },
+                }
+                return
+            sql_query = plan["sql"]
+
+            if self._is_query_unsafe(sql_query):
+                error_msg = (
+                    "Cannot query system tables. Only uploaded data can be queried."
+                )
+                await self._aremember_turn(user_input, error_msg, sql_query, 0)
+                yield {"type": "token", "content": error_msg}
+                yield {"type": "error", "error": error_msg}
+                return
+
+            yield {"type": "status", "content": "Executing SQL..."}
+            results, rejection = await self._aexecute_query(sql_query)
+
+            if results is None:
+                if plan["cached"]:
+                    await run_blocking(question_sql_cache.discard)(plan["ticket"])
+                corrected_query = await self._afix_query_fast(
+                    sql_query,
+                    user_input,
+                    await self._aplan_schema_info(plan, messages, user_input),
+                )
+                if corrected_query and not self._is_query_unsafe(corrected_query):
+                    results, rejection = await self._aexecute_query(corrected_query)
+                    if results is not None:
+                        sql_query = corrected_query
+
+            if results is None:
+                error_msg = (
+                    rejection
+                    or "Query execution failed. Could you rephrase your question?"
+                )
+                await self._aremember_turn(user_input, error_msg, sql_query, 0)
+                yield {"type": "token", "content": error_msg}
+                yield {"type": "error", "error": error_msg}
+                return
+
+            await run_blocking(self._remember_plan)(plan, sql_query)
+
+            yield {"type": "status", "content": "Generating explanation..."}
+            full_explanation = ""
+            async for token in self._agenerate_explanation_stream(results, user_input):
+                full_explanation += token
+                yield {"type": "token", "content": token}
+
+            published = await run_blocking(publish_result)(
+                results, self.session_id, sql_query
+            )
+            await self._aremember_turn(user_input, full_explanation, sql_query, len(results))
+
+            yield {
+                "type": "complete",
+                "data": {
+                    "success": True,
+                    "query": sql_query,
+                    "explanation": full_explanation,
+                    "needs_clarification": False,
+                    **published,
+                },
+            }
+
+        except RateLimited as e:
+            yield {"type": "error", "error": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            logger.error(f"Error in async streaming: {str(e)}")
+            yield {"type": "error", "error": str(e)}
+
+    async def _aremember_turn(
+        self, user_input: str, answer: str, sql_query: str, results_count: int
+    ):
+        """Chat memory for the agent and ChatHistory for the sidebar"""
+        await self.message_history.aadd_messages(
+            [HumanMessage(content=user_input), AIMessage(content=answer)]
+        )
+        try:
+            await run_blocking(ChatHistory.objects.create)(
+                session_id=self.session_id,
+                query=user_input,
+                response=answer,
+                sql_query=sql_query,
+                results_count=results_count,
+            )
+        except Exception as e:
+            logger.error(f"Failed to save async stream history: {e}")
+
+    @staticmethod
+    def _explanation_prompt(results_df: pd.DataFrame, question: str) -> str:
+        # Summarize data for prompt
+        limits = result_limits(results_df)
+        if limits["truncated"]:
+            total = limits["total_rows"]
+            row_count = f"first {len(results_df)} of {total if total is not None else 'more'}"
+        else:
+            row_count = len(results_df)
+        preview = results_df.head(5).to_string()
+
+        return f"""
+            Question: {question}
+            Data Results ({row_count} rows total):
+            {preview}
+            
+            Please provide a concise, natural language answer to the question based on the data results. 
+            Do not mention "DataFrame" or "technical code". Just answer the user.
+            """
+
+    def _generate_explanation_stream(self, results_df: pd.DataFrame, question: str):
+        """Streams explanation of results using LLM"""
+        try:
+            if results_df.empty:
+                yield "No results found for your query."
+                return
+
+            prompt = self._explanation_prompt(results_df, question)
+
+            # Stream response
+            for chunk in llm_scheduler.stream(self.llm, prompt, self.session_id, "explain"):
+                if hasattr(chunk, "content"):
+                    yield chunk.content
+                else:
+                    yield str(chunk)
+
+        except RateLimited:
+            # Shed to leave the quota for planning; the rows still answer
+            yield "Here are the results."
+        except Exception as e:
+            logger.error(f"Error generating explanation stream: {str(e)}")
+            yield "Here are the results."
+
+    def _generate_explanation(self, results_df: pd.DataFrame, question: str) -> str:
+        # Fallback for non-streaming
+        return "".join(self._generate_explanation_stream(results_df, question))
+
+    async def _agenerate_explanation_stream(self, results_df: pd.DataFrame, question: str):
+        """_generate_explanation_stream for the async path"""
+        try:
+            if results_df.empty:
+                yield "No results found for your query."
+                return
+
+            prompt = self._explanation_prompt(results_df, question)
+            async for chunk in llm_scheduler.astream(
+                self.llm, prompt, self.session_id, "explain"
+            ):
+                yield chunk.content if hasattr(chunk, "content") else str(chunk)
+
+        except RateLimited:
+            yield "Here are the results."
+        except Exception as e:
+            logger.error(f"Error generating explanation stream: {str(e)}")
+            yield "Here are the results."
+
+
+# --- Chart Generator ---
+class ChartDataGenerator:
+    """Generate chart-ready data from DataFrame"""
+
+    @staticmethod
+    def prepare_chart_data(
+        df: pd.DataFrame, chart_config: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        try:
+            chart_type = chart_config["type"]
+            if chart_type == "bar":
+                return ChartDataGenerator._prepare_bar_data(df, chart_config)
+            elif chart_type == "line":
+                return ChartDataGenerator._prepare_line_data(df, chart_config)
+            elif chart_type == "pie":
+                return ChartDataGenerator._prepare_pie_data(df, chart_config)
+            elif chart_type == "scatter":
+                return ChartDataGenerator._prepare_scatter_data(df, chart_config)
+            else:
+                return ChartDataGenerator._prepare_bar_data(df, chart_config)
+        except Exception as e:
+            logger.error(f"Error preparing chart data: {str(e)}")
+            return {"labels": [], "datasets": [], "error": str(e)}
+
+    @staticmethod
+    def _prepare_bar_data(df: pd.DataFrame, config: Dict) -> Dict:
+        x_col = config.get("x_column")
+        y_col = config.get("y_column")
+        aggregation = config.get("aggregation", "sum")
+        limit = config.get("data_config", {}).get("limit", 20)
+
+        if not x_col or not y_col:
+            return {"labels": [], "datasets": []}
+
+        if aggregation == "count":
+            grouped = df.groupby(x_col).size().reset_index(name=y_col)
+        elif aggregation == "sum":
+            grouped = df.groupby(x_col)[y_col].sum().reset_index()
+        elif aggregation == "avg":
+            grouped = df.groupby(x_col)[y_col].mean().reset_index()
+        else:
+            grouped = df[[x_col, y_col]].copy()
+
+        grouped = grouped.nlargest(limit, y_col)
+        grouped = grouped.replace([np.inf, -np.inf], np.nan).dropna()
+        colors = ChartDataGenerator._generate_colors(len(grouped))
+
+        return {
+            "labels": grouped[x_col].astype(str).tolist(),
+            "datasets": [
+                {
+                    "label": y_col,
+                    "data": grouped[y_col].tolist(),
+                    "backgroundColor": colors,
+                    "borderColor": [c.replace("0.8", "1") for c in colors],
+                    "borderWidth": 2,
+                }
+            ],
+        }
+
+    @staticmethod
+    def _prepare_line_data(df: pd.DataFrame, config: Dict) -> Dict:
+        x_col = config.get("x_column")
+        y_col = config.get("y_column")
+        limit = config.get("data_config", {}).get("limit", 50)
+
+        if not x_col or not y_col:
+            return {"labels": [], "datasets": []}
+
+        sorted_df = df[[x_col, y_col]].sort_values(x_col).head(limit)
+        sorted_df = sorted_df.replace([np.inf, -np.inf], np.nan).dropna()
+
+        return {
+            "labels": sorted_df[x_col].astype(str).tolist(),
+            "datasets": [
+                {
+                    "label": y_col,
+                    "data": sorted_df[y_col].tolist(),
+                    "borderColor": "rgba(16, 185, 129, 1)",
+                    "backgroundColor": "rgba(16, 185, 129, 0.1)",
+                    "tension": 0.4,
+                    "fill": False,
+                    "borderWidth": 3,
+                }
+            ],
+        }
+
+    @staticmethod
+    def _prepare_pie_data(df: pd.DataFrame, config: Dict) -> Dict:
+        x_col = config.get("x_column")
+        y_col = config.get("y_column")
+        limit = config.get("data_config", {}).get("limit", 10)
+
+        if not x_col or not y_col:
+            return {"labels": [], "datasets": []}
+
+        grouped = df.groupby(x_col)[y_col].sum().reset_index()
+        grouped = grouped.nlargest(limit, y_col)
+        grouped = grouped.replace([np.inf, -np.inf], np.nan).dropna()
+        colors = ChartDataGenerator._generate_colors(len(grouped))
+
+        return {
+            "labels": grouped[x_col].astype(str).tolist(),
+            "datasets": [
+                {
+                    "data": grouped[y_col].tolist(),
+                    "backgroundColor": colors,
+                    "borderWidth": 2,
+                    "borderColor": "#1a1a1a",
+                }
+            ],
+        }
+
+    @staticmethod
+    def _prepare_scatter_data(df: pd.DataFrame, config: Dict) -> Dict:
+        x_col = config.get("x_column")
+        y_col = config.get("y_column")
+        limit = config.get("data_config", {}).get("limit", 100)
+
+        if not x_col or not y_col:
+            return {"datasets": []}
+
+        sample_df = df[[x_col, y_col]].head(limit)
+        sample_df = sample_df.replace([np.inf, -np.inf], np.nan).dropna()
+        scatter_data = [
+            {"x": float(row[x_col]), "y": float(row[y_col])}
+            for _, row in sample_df.iterrows()
+        ]
+
+        return {
+            "datasets": [
+                {
+                    "label": f"{y_col} vs {x_col}",
+                    "data": scatter_data,
+                    "backgroundColor": "rgba(236, 72, 153, 0.6)",
+                    "borderColor": "rgba(236, 72, 153, 1)",
+                    "pointRadius": 6,
+                }
+            ]
+        }
+
+    @staticmethod
+    def _generate_colors(count: int) -> List[str]:
+        base_colors = [
+            "rgba(239, 68, 68, 0.8)",
+            "rgba(251, 146, 60, 0.8)",
+            "rgba(245, 158, 11, 0.8)",
+            "rgba(234, 179, 8, 0.8)",
+            "rgba(132, 204, 22, 0.8)",
+            "rgba(34, 197, 94, 0.8)",
+            "rgba(16, 185, 129, 0.8)",
+            "rgba(20, 184, 166, 0.8)",
+            "rgba(6, 182, 212, 0.8)",
+            "rgba(14, 165, 233, 0.8)",
+            "rgba(59, 130, 246, 0.8)",
+            "rgba(99, 102, 241, 0.8)",
+            "rgba(139, 92, 246, 0.8)",
+            "rgba(168, 85, 247, 0.8)",
+            "rgba(217, 70, 239, 0.8)",
+            "rgba(236, 72, 153, 0.8)",
+            "rgba(244, 63, 94, 0.8)",
+        ]
+        return [base_colors[i % len(base_colors)] for i in range(count)]
+
+
+# --- Visualization Agent ---
+class OptimizedVisualizationAgent:
+    """Rule-based visualization agent"""
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key
+
+    def analyze(self, df: pd.DataFrame, question: str = "") -> Dict[str, Any]:
+        try:
+            summary = self._analyze_data(df)
+            charts = self._recommend_charts_rule_based(df, summary, question)
+            insights = self._generate_insights_rule_based(df, summary, question)
+
+            return {
+                "success": True,
+                "summary": summary,
+                "charts": charts,
+                "insights": insights,
+                "error": "",
+            }
+        except Exception as e:
+            logger.error(f"Error in visualization analysis: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "summary": {},
+                "charts": [],
+                "insights": "",
+            }
+
+    def _analyze_data(self, df: pd.DataFrame) -> Dict[str, Any]:
+        summary = {
+            "row_count": len(df),
+            "column_count": len(df.columns),
+            "columns": {},
+            "numeric_columns": [],
+            "categorical_columns": [],
+        }
+
+        for col in df.columns:
+            col_data = df[col]
+            col_info = {
+                "name": col,
+                "dtype": str(col_data.dtype),
+                "unique_count": int(col_data.nunique()),
+            }
+
+            if pd.api.types.is_numeric_dtype(col_data):
+                summary["numeric_columns"].append(col)
+                if not col_data.isna().all():
+                    col_info.update(
+                        {"min": float(col_data.min()), "max": float(col_data.max())}
+                    )
+            else:
+                summary["categorical_columns"].append(col)
+
+            summary["columns"][col] = col_info
+
+        return summary
+
+    def _recommend_charts_rule_based(
+        self, df: pd.DataFrame, summary: Dict, question: str
+    ) -> List[Dict]:
+        charts = []
+        numeric_cols = summary["numeric_columns"]
+        categorical_cols = summary["categorical_columns"]
+        question_lower = question.lower()
+
+        # Only generate 1 most relevant chart
+        if categorical_cols and numeric_cols:
+            cat_col = categorical_cols[0]
+            num_col = numeric_cols[0]
+            unique_count = summary["columns"][cat_col]["unique_count"]
+
+            if unique_count <= 15:
+                charts.append(
                     {
                         "type": "bar",
                         "x_column": cat_col,
@@ -861,528 +2490,2580 @@ class OptimizedVisualizationAgent:
                     }
                 )
 
-        return charts[:1]
+        return charts[:1]
+
+    def _generate_insights_rule_based(
+        self, df: pd.DataFrame, summary: Dict, question: str
+    ) -> str:
+        insights = []
+        insights.append(
+            f"Dataset contains {summary['row_count']:,} records across {summary['column_count']} columns"
+        )
+
+        if summary["numeric_columns"] and summary["categorical_columns"]:
+            insights.append(
+                f"Mix of {len(summary['numeric_columns'])} numeric and {len(summary['categorical_columns'])} categorical fields"
+            )
+
+        if summary["categorical_columns"]:
+            cat_col = summary["categorical_columns"][0]
+            unique_count = summary["columns"][cat_col]["unique_count"]
+            insights.append(f"{cat_col} has {unique_count} distinct categories")
+
+        return "\n".join(
+            [f"{i + 1}. {insight}" for i, insight in enumerate(insights[:3])]
+        )
+
+
+VisualizationAgent = OptimizedVisualizationAgent
+
+
+# --- SQL ReAct Agent ---
+class OptimizedSQLReActAgent:
+    """SQL ReAct Agent with per-dataset schema isolation"""
+
+    def __init__(self, db_uri: str, api_key: str, dataset: UploadedFile = None):
+        try:
+            self.db_uri = db_uri
+            self.dataset = dataset
+            self.schema = dataset.dataset_schema if dataset is not None else "uploads"
+
+            # CRITICAL: Only see this dataset's schema
+            self.db = RoutedSQLDatabase(
+                dataset,
+                db_uri,
+                schema=self.schema,
+                include_tables=None,
+                sample_rows_in_table_info=0,
+            )
+
+            self.llm = ChatOpenAI(
+                model="gpt-5-mini",
+                temperature=0,
+                openai_api_key=api_key,
+                timeout=15,
+                max_retries=1,
+            )
+
+            self.toolkit = SQLDatabaseToolkit(db=self.db, llm=self.llm)
+            tools = self.toolkit.get_tools()
+            self.agent = create_react_agent(self.llm, tools)
+
+            logger.info(f"SQL ReAct Agent initialized ({self.schema} schema only)")
+        except Exception as e:
+            logger.error(f"Error initializing SQL ReAct Agent: {str(e)}")
+            raise
+
+    @staticmethod
+    def sql_prompt(schema: str, schema_info: str, question: str) -> str:
+        return f"""Generate a SIMPLE PostgreSQL query to answer this question.
+
+DATABASE SCHEMA ({schema} schema only):
+{schema_info}
+
+CRITICAL RULES:
+1. Return ONLY the SQL query, no explanations
+2. ALL table names MUST use '{schema}.' prefix (e.g., {schema}.sales_data)
+3. Use double quotes for column names with spaces
+4. ALWAYS add LIMIT 100
+5. Keep it SIMPLE
+
+QUESTION: {question}
+
+Generate query:"""
+
+    def query(self, question: str) -> dict:
+        try:
+            schema_info = self._get_schema_fast(question)
+            prompt = self.sql_prompt(self.schema, schema_info, question)
+
+            response = llm_scheduler.invoke(self.llm, prompt, priority="plan")
+            sql_query = response.content.strip()
+            sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
+
+            if not sql_query or "SELECT" not in sql_query.upper():
+                return {
+                    "success": False,
+                    "error": "Could not generate a valid SQL query.",
+                    "results": pd.DataFrame(),
+                    "query": "",
+                    "explanation": "",
+                }
+
+            # Security check
+            if self._is_query_unsafe(sql_query):
+                return {
+                    "success": False,
+                    "error": "Cannot query system tables. Only uploaded data can be queried.",
+                    "results": pd.DataFrame(),
+                    "query": sql_query,
+                    "explanation": "",
+                }
+
+            results, rejection = self._execute_query(sql_query)
+
+            if results is None:
+                corrected_query = self._fix_query_fast(sql_query, question, schema_info)
+                if corrected_query and not self._is_query_unsafe(corrected_query):
+                    results, rejection = self._execute_query(corrected_query)
+                    if results is not None:
+                        sql_query = corrected_query
+
+                if results is None:
+                    return {
+                        "success": False,
+                        "error": rejection
+                        or "Query execution failed. Please rephrase your question.",
+                        "results": pd.DataFrame(),
+                        "query": sql_query,
+                        "explanation": "",
+                    }
+
+            if results.empty:
+                return {
+                    "success": True,
+                    "results": pd.DataFrame(),
+                    "query": sql_query,
+                    "explanation": "No results found for your query.",
+                    "message": "No data matches your criteria.",
+                }
+
+            limits = result_limits(results)
+            explanation = f"Query returned {len(results)} records."
+            if limits["truncated"]:
+                explanation = (
+                    f"Showing the first {len(results)} of "
+                    f"{limits['total_rows'] if limits['total_rows'] is not None else 'more'} records."
+                )
+            return {
+                "success": True,
+                "results": results,
+                "query": sql_query,
+                "explanation": explanation,
+                **limits,
+            }
+        except Exception as e:
+            logger.error(f"Error in SQL query: {str(e)}")
+            return {
+                "success": False,
+                "error": f"Error: {str(e)}",
+                "results": pd.DataFrame(),
+                "query": "",
+                "explanation": "",
+            }
+
+    def _is_query_unsafe(self, query: str) -> bool:
+        """Check if query tries to access forbidden tables/schemas"""
+        query_lower = query.lower()
+        forbidden = [
+            "public.",
+            "information_schema.",
+            "pg_catalog.",
+            "chat_history",
+            "uploaded_files",
+            "session_datasets",
+            "user_preferences",
+        ]
+        if any(forbidden_item in query_lower for forbidden_item in forbidden):
+            return True
+        return references_other_dataset(query_lower, self.schema)
+
+    def _execute_query(self, query: str):
+        """Return ``(df, rejection)``: the results, or None and why it was refused.
+
+        The rejection is returned rather than kept on the agent, which is
+        shared by concurrent requests of one session.
+        """
+        try:
+            return (
+                execute_analysis_query(self.dataset, self.db_uri, self.schema, query),
+                None,
+            )
+        except QueryRejected as e:
+            logger.warning(f"Query rejected: {str(e)}")
+            return None, str(e)
+        except Exception as e:
+            logger.error(f"Error executing query: {str(e)}")
+            return None, None
+
+    def _get_schema_fast(self, question: str = "") -> str:
+        try:
+            return describe_dataset_schema(
+                self.db_uri, self.schema, self.dataset, question
+            )
+        except Exception as e:
+            logger.error(f"Schema fetch error: {str(e)}")
+            return "Schema unavailable"
+
+    def _fix_query_fast(self, failed_query: str, question: str, schema: str) -> str:
+        try:
+            prompt = f"""Fix this failed query. Make it SIMPLER.
+
+SCHEMA ({self.schema} schema):
+{schema}
+
+FAILED QUERY:
+{failed_query}
+
+QUESTION: {question}
+
+RULES:
+1. ALL tables MUST use '{self.schema}.' prefix
+2. Keep it SIMPLE
+3. Add LIMIT 100
+
+Return ONLY the fixed query:"""
+
+            response = llm_scheduler.invoke(self.llm, prompt, priority="retry")
+            fixed_query = response.content.strip()
+            fixed_query = fixed_query.replace("```sql", "").replace("```", "").strip()
+            return fixed_query if "SELECT" in fixed_query.upper() else None
+        except Exception as e:
+            logger.error(f"Query fix error: {str(e)}")
+            return None
+
+
+# --- Utility Functions ---
+def get_api_key():
+    try:
+        return settings.OPENAI_API_KEY  # Changed from GOOGLE_API_KEY
+    except AttributeError:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        api_key = os.getenv("OPENAI_API_KEY")  # Changed from GOOGLE_API_KEY
+        if not api_key:
+            raise Exception("OpenAI API key not found")  # Updated message
+        return api_key
+
+
+def generate_result_explanation(results_df, user_question, llm, session_id=None):
+    try:
+        row_count = len(results_df)
+        if row_count == 0:
+            return "No results found. The query returned no data."
+
+        data_summary = f"Query returned {row_count} records with {len(results_df.columns)} columns.\n\n"
+        data_summary += "Columns:\n"
+        for column in results_df.columns:
+            col_data = results_df[column]
+            if pd.api.types.is_numeric_dtype(col_data) and not col_data.isna().all():
+                data_summary += f"- {column}: numeric, range {col_data.min():.2f} to {col_data.max():.2f}\n"
+
+        data_summary += f"\nSample data:\n{results_df.head(3).to_string()}\n"
+
+        if llm:
+            try:
+                prompt = f"""Analyze these query results and provide a clear explanation in 2-3 sentences.
+
+USER QUESTION: {user_question}
+
+DATA SUMMARY:
+{data_summary}
+
+Provide natural language explanation:"""
+
+                # Falls back to the rule-based text when the call is shed
+                response = llm_scheduler.invoke(llm, prompt, session_id, "explain")
+                explanation = response.content.strip().replace("```", "").strip()
+                return explanation
+            except Exception:
+                pass
+
+        return f"Query returned {row_count} record{'s' if row_count > 1 else ''}."
+    except Exception as e:
+        logger.error(f"Error generating explanation: {str(e)}")
+        return f"Query returned {len(results_df)} records."
+
+
+def restructure_excel_sheet(uploaded_file, progress=None):
+    try:
+        file_bytes = uploaded_file.read()
+        cleaned_dfs = {}
+
+        if uploaded_file.name.endswith((".xlsx", ".xls")):
+            # Sheets come back in workbook order, so later duplicates win as before
+            for sheet_tables in process_workbook_sheets(file_bytes, progress):
+                for table_name, processed_df in sheet_tables:
+                    cleaned_dfs[table_name] = processed_df
+
+        elif uploaded_file.name.endswith(".csv"):
+            df = pd.read_csv(io.StringIO(file_bytes.decode("utf-8")), header=None)
+            if not df.empty:
+                csv_name = os.path.splitext(uploaded_file.name)[0]
+                for table_name, processed_df in extract_tables_from_sheet(
+                    df, csv_name
+                ):
+                    cleaned_dfs[table_name] = processed_df
+
+        return cleaned_dfs if cleaned_dfs else None
+    except UploadCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing file: {str(e)}")
+        return None
+    finally:
+        uploaded_file.seek(0)
+
+
+def sheet_worker_context():
+    """Start method for sheet parsing workers.
+
+    Never fork: this process runs upload, pool and event loop threads, and
+    a forked child can inherit a lock one of them held. Workers start from
+    a clean fork server (or spawn) and import only sheet_parsing.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["app.sheet_parsing"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def process_workbook_sheets(file_bytes, progress=None):
+    """Parse every sheet of a workbook, in parallel when worthwhile.
+
+    Returns one list of (table_name, DataFrame) per sheet, in workbook order.
+    A cancelled upload stops between sheets.
+    """
+    progress = progress or UploadProgress()
+    excel_file = pd.ExcelFile(io.BytesIO(file_bytes))
+    sheets = excel_file.sheet_names
+
+    workers = min(getattr(settings, "UPLOAD_SHEET_WORKERS", 1), len(sheets))
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=sheet_worker_context(),
+                initializer=sheet_parsing.init_sheet_worker,
+                initargs=(file_bytes,),
+            ) as pool:
+                futures = [
+                    pool.submit(sheet_parsing.parse_sheet_in_worker, sheet)
+                    for sheet in sheets
+                ]
+                parsed = []
+                try:
+                    for future in futures:
+                        parsed.append(future.result())
+                        progress.check_cancelled()
+                except UploadCancelled:
+                    for future in futures:
+                        future.cancel()
+                    raise
+                return parsed
+        except UploadCancelled:
+            raise
+        except Exception as e:
+            logger.warning(f"Parallel sheet parsing failed, retrying serially: {e}")
+
+    parsed = []
+    for sheet in sheets:
+        progress.check_cancelled()
+        parsed.append(parse_workbook_sheet(excel_file, sheet))
+    return parsed
+
+
+def sanitize_dataframe_for_json(df):
+    if df is None or df.empty:
+        return df
+    df = df.replace([np.nan, np.inf, -np.inf], None)
+    for col in df.columns:
+        if df[col].dtype in ["float64", "float32", "float16"]:
+            df[col] = df[col].apply(
+                lambda x: None
+                if (x is not None and (np.isnan(x) or np.isinf(x)))
+                else x
+            )
+    return df
+
+
+# --- Column Type Inference ---
+INTEGER_PATTERN = r"[+-]?\d+"
+FLOAT_PATTERN = r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?"
+LEADING_ZERO_PATTERN = r"[+-]?0\d"
+DATE_PATTERN = r"\d{4}-\d{2}-\d{2}(?:[ T]00:00(?::00(?:\.0+)?)?)?"
+TIMESTAMP_PATTERN = r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?"
+BOOLEAN_TRUE_VALUES = {"true", "yes"}
+BOOLEAN_VALUES = BOOLEAN_TRUE_VALUES | {"false", "no"}
+
+INTEGER_TYPES = [
+    ("SMALLINT", "Int16", -(2**15), 2**15 - 1),
+    ("INTEGER", "Int32", -(2**31), 2**31 - 1),
+    ("BIGINT", "Int64", -(2**63), 2**63 - 1),
+]
+
+
+class ColumnTypeInference:
+    """Narrow down what one column can be stored as, one block at a time.
+
+    Every candidate type starts possible and is ruled out by the first value
+    that does not fit it. Text columns with few distinct values are reported
+    as low-cardinality so they can be stored as categoricals.
+    """
+
+    CANDIDATES = ["boolean", "integer", "float", "date", "timestamp"]
+    LOW_CARDINALITY_MAX_DISTINCT = 1000
+    LOW_CARDINALITY_MAX_RATIO = 0.5
+
+    def __init__(self, column: str):
+        self.column = column
+        self.possible = set(self.CANDIDATES)
+        self.non_null_count = 0
+        self.min_value = None
+        self.max_value = None
+        self.distinct = set()
+        self.too_many_distinct = False
+
+    def update(self, values: pd.Series):
+        non_null = values.dropna()
+        if non_null.empty:
+            return
+        self.non_null_count += len(non_null)
+
+        if pd.api.types.is_bool_dtype(non_null):
+            self.possible &= {"boolean"}
+        elif pd.api.types.is_numeric_dtype(non_null):
+            self._update_numeric(non_null)
+        elif pd.api.types.is_datetime64_any_dtype(non_null):
+            self.possible &= {"date", "timestamp"}
+            if not (non_null == non_null.dt.normalize()).all():
+                self.possible.discard("date")
+        else:
+            self._update_text(non_null.astype(str))
+
+        if not self.too_many_distinct:
+            self.distinct.update(non_null.astype(str).unique().tolist())
+            if len(self.distinct) > self.LOW_CARDINALITY_MAX_DISTINCT:
+                self.too_many_distinct = True
+                self.distinct = set()
+
+    def _update_numeric(self, non_null: pd.Series):
+        self.possible &= {"integer", "float"}
+        self._track_range(non_null.min(), non_null.max())
+        low, high = INTEGER_TYPES[-1][2:]
+        if (
+            not (non_null % 1 == 0).all()
+            or self.min_value < low
+            or self.max_value > high
+        ):
+            self.possible.discard("integer")
+
+    def _update_text(self, text_values: pd.Series):
+        if "boolean" in self.possible:
+            if not text_values.str.lower().isin(BOOLEAN_VALUES).all():
+                self.possible.discard("boolean")
+
+        if self.possible & {"integer", "float"}:
+            # Leading zeros mean codes (zip codes, account ids), not numbers
+            if text_values.str.match(LEADING_ZERO_PATTERN).any():
+                self.possible -= {"integer", "float"}
+            elif not text_values.str.fullmatch(FLOAT_PATTERN).all():
+                self.possible -= {"integer", "float"}
+            elif "integer" in self.possible:
+                if not text_values.str.fullmatch(INTEGER_PATTERN).all():
+                    self.possible.discard("integer")
+                elif text_values.str.lstrip("+-").str.len().max() > 18:
+                    # Too long for BIGINT and too precise for a double
+                    self.possible -= {"integer", "float"}
+
+        if self.possible & {"integer", "float"}:
+            numbers = pd.to_numeric(text_values)
+            self._track_range(numbers.min(), numbers.max())
+
+        if self.possible & {"date", "timestamp"}:
+            if not text_values.str.fullmatch(TIMESTAMP_PATTERN).all():
+                self.possible -= {"date", "timestamp"}
+            elif (
+                pd.to_datetime(text_values, format="ISO8601", errors="coerce")
+                .isna()
+                .any()
+            ):
+                # Shaped like a date but not one ("2024-02-30", "9999-99-99")
+                self.possible -= {"date", "timestamp"}
+            elif not text_values.str.fullmatch(DATE_PATTERN).all():
+                self.possible.discard("date")
+
+    def _track_range(self, low, high):
+        self.min_value = low if self.min_value is None else min(self.min_value, low)
+        self.max_value = high if self.max_value is None else max(self.max_value, high)
+
+    @property
+    def inferred_type(self) -> str:
+        if self.non_null_count == 0:
+            return "text"
+        for candidate in self.CANDIDATES:
+            if candidate in self.possible:
+                return candidate
+        if (
+            not self.too_many_distinct
+            and len(self.distinct)
+            <= self.LOW_CARDINALITY_MAX_RATIO * self.non_null_count
+        ):
+            return "category"
+        return "text"
+
+    def _integer_type(self):
+        for sql_type, pandas_dtype, low, high in INTEGER_TYPES:
+            if low <= self.min_value and self.max_value <= high:
+                return sql_type, pandas_dtype
+        return INTEGER_TYPES[-1][:2]
+
+    @property
+    def sql_type(self) -> str:
+        inferred_type = self.inferred_type
+        if inferred_type == "integer":
+            return self._integer_type()[0]
+        return {
+            "boolean": "BOOLEAN",
+            "float": "DOUBLE PRECISION",
+            "date": "DATE",
+            "timestamp": "TIMESTAMP",
+        }.get(inferred_type, "TEXT")
+
+    def decision(self) -> Dict[str, Any]:
+        return {
+            "column": self.column,
+            "inferred_type": self.inferred_type,
+            "sql_type": self.sql_type,
+        }
+
+    def convert(self, values: pd.Series) -> pd.Series:
+        """Convert an in-memory column to the inferred (downcast) dtype"""
+        inferred_type = self.inferred_type
+        non_null = values.dropna()
+
+        if inferred_type == "boolean":
+            if pd.api.types.is_bool_dtype(non_null):
+                converted = non_null.astype("boolean")
+            else:
+                converted = (
+                    non_null.astype(str)
+                    .str.lower()
+                    .isin(BOOLEAN_TRUE_VALUES)
+                    .astype("boolean")
+                )
+        elif inferred_type == "integer":
+            numbers = non_null
+            if not pd.api.types.is_numeric_dtype(numbers):
+                numbers = pd.to_numeric(numbers.astype(str))
+            converted = numbers.astype(self._integer_type()[1])
+        elif inferred_type == "float":
+            converted = pd.to_numeric(non_null.astype(str)).astype("float64")
+        elif inferred_type in ("date", "timestamp"):
+            if pd.api.types.is_datetime64_any_dtype(non_null):
+                converted = non_null
+            else:
+                converted = pd.to_datetime(non_null.astype(str), format="ISO8601")
+        elif inferred_type == "category":
+            return values.astype("category")
+        else:
+            return values
+
+        return converted.reindex(values.index)
+
+    def sql_cast(self, column_sql: str) -> str:
+        """USING expression that converts the TEXT column in the database"""
+        if self.inferred_type == "boolean":
+            return (
+                f"CASE WHEN {column_sql} IS NULL THEN NULL "
+                f"ELSE lower({column_sql}) IN ('true', 'yes') END"
+            )
+        return f"{column_sql}::{self.sql_type}"
+
+
+def infer_column_types(df: pd.DataFrame):
+    """Vectorized type inference for one uploaded table.
+
+    Returns the converted DataFrame and one decision dict per column.
+    """
+    converted = {}
+    decisions = []
+    for col in df.columns:
+        inference = ColumnTypeInference(col)
+        inference.update(df[col])
+        converted[col] = inference.convert(df[col])
+        decisions.append(inference.decision())
+    return pd.DataFrame(converted, index=df.index), decisions
+
+
+# --- Bulk Loader ---
+def quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def postgres_type_for_dtype(dtype) -> str:
+    """Map a pandas dtype to the column type used in the CREATE TABLE DDL"""
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        if dtype.itemsize <= 2:
+            return "SMALLINT"
+        return "INTEGER" if dtype.itemsize == 4 else "BIGINT"
+    if pd.api.types.is_float_dtype(dtype):
+        return "DOUBLE PRECISION"
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return "TIMESTAMPTZ"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+class BulkTableLoader:
+    """Load DataFrames into the uploads schema with COPY FROM STDIN"""
+
+    NULL_MARKER = "\\N"
+
+    def __init__(
+        self,
+        engine,
+        schema: str = "uploads",
+        chunk_rows: int = None,
+        progress: "UploadProgress" = None,
+    ):
+        self.engine = engine
+        self.schema = schema
+        self.chunk_rows = chunk_rows or getattr(
+            settings, "UPLOAD_COPY_CHUNK_ROWS", 50000
+        )
+        self.progress = progress or UploadProgress()
+
+    def load(
+        self, table_name: str, df: pd.DataFrame, column_types: Dict[str, str] = None
+    ) -> int:
+        """Load a table with COPY, falling back to DataFrame.to_sql on failure.
+
+        column_types overrides the SQL type derived from a column's dtype.
+        """
+        self._rows_copied = 0
+        try:
+            return self._copy_dataframe(table_name, df, column_types or {})
+        except UploadCancelled:
+            raise
+        except Exception as e:
+            logger.warning(
+                f"COPY load failed for {table_name}, falling back to to_sql: {str(e)}"
+            )
+            with self.engine.begin() as conn:
+                df.to_sql(
+                    table_name,
+                    conn,
+                    schema=self.schema,
+                    if_exists="replace",
+                    index=False,
+                )
+            self.progress.add_rows(len(df) - self._rows_copied)
+            return len(df)
+
+    def _copy_dataframe(
+        self, table_name: str, df: pd.DataFrame, column_types: Dict[str, str]
+    ) -> int:
+        columns = [
+            (str(col), column_types.get(col) or postgres_type_for_dtype(df[col].dtype))
+            for col in df
+        ]
+        raw_conn = self.engine.raw_connection()
+        try:
+            cursor = raw_conn.cursor()
+            self._create_table(cursor, table_name, columns)
+            for start in range(0, len(df), self.chunk_rows):
+                chunk = df.iloc[start : start + self.chunk_rows]
+                self._copy_chunk(cursor, table_name, [c for c, _ in columns], chunk)
+                self._rows_copied += len(chunk)
+                self.progress.add_rows(len(chunk))
+            raw_conn.commit()
+            logger.info(f"COPY loaded {len(df)} rows into {self.schema}.{table_name}")
+            return len(df)
+        except Exception:
+            raw_conn.rollback()
+            raise
+        finally:
+            raw_conn.close()
+
+    def _create_table(self, cursor, table_name: str, columns):
+        qualified = f"{quote_identifier(self.schema)}.{quote_identifier(table_name)}"
+        column_ddl = ", ".join(
+            f"{quote_identifier(name)} {sql_type}" for name, sql_type in columns
+        )
+        cursor.execute(f"DROP TABLE IF EXISTS {qualified} CASCADE")
+        cursor.execute(f"CREATE TABLE {qualified} ({column_ddl})")
+
+    def _copy_chunk(self, cursor, table_name: str, column_names, chunk: pd.DataFrame):
+        buffer = StringIO()
+        chunk.to_csv(buffer, index=False, header=False, na_rep=self.NULL_MARKER)
+        buffer.seek(0)
+
+        copy_sql = (
+            f"COPY {quote_identifier(self.schema)}.{quote_identifier(table_name)} "
+            f"({', '.join(quote_identifier(c) for c in column_names)}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '{self.NULL_MARKER}')"
+        )
+
+        if hasattr(cursor, "copy_expert"):
+            # psycopg2
+            cursor.copy_expert(copy_sql, buffer)
+        else:
+            # psycopg 3
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+class StreamingTableWriter:
+    """Append row blocks to a single uploads table as they arrive"""
+
+    def __init__(self, loader: BulkTableLoader, table_name: str, headers: list):
+        self.loader = loader
+        self.table_name = table_name
+        self.raw_headers = list(headers)
+        self.columns = clean_column_names(self.raw_headers)
+        self.has_values = [False] * len(self.columns)
+        self.inferences = [ColumnTypeInference(col) for col in self.columns]
+        self.column_types = []
+        self.buffer = []
+        self.row_count = 0
+
+        self.raw_conn = loader.engine.raw_connection()
+        self.cursor = self.raw_conn.cursor()
+        loader._create_table(
+            self.cursor, table_name, [(col, "TEXT") for col in self.columns]
+        )
+
+    def append(self, row: list):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.loader.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        width = max(len(row) for row in self.buffer)
+        if width > len(self.columns):
+            self._widen(width)
+
+        # object dtype keeps each cell as parsed instead of re-inferring per block
+        chunk = pd.DataFrame(self.buffer, columns=self.columns[:width], dtype=object)
+        for idx, has_value in enumerate(chunk.notna().any().tolist()):
+            self.has_values[idx] = self.has_values[idx] or has_value
+            self.inferences[idx].update(chunk.iloc[:, idx])
+
+        self.loader._copy_chunk(self.cursor, self.table_name, list(chunk.columns), chunk)
+        self.row_count += len(chunk)
+        self.buffer = []
+        self.loader.progress.add_rows(len(chunk))
+
+    def close(self) -> int:
+        """Flush, drop all-empty columns and commit. Returns rows loaded."""
+        try:
+            self.flush()
+            qualified = (
+                f"{quote_identifier(self.loader.schema)}."
+                f"{quote_identifier(self.table_name)}"
+            )
+            if self.row_count == 0:
+                self.cursor.execute(f"DROP TABLE IF EXISTS {qualified}")
+            else:
+                # Same result as process_single_table's dropna(axis=1, how="all")
+                for col, has_value in zip(self.columns, self.has_values):
+                    if not has_value:
+                        self.cursor.execute(
+                            f"ALTER TABLE {qualified} DROP COLUMN {quote_identifier(col)}"
+                        )
+                self._apply_column_types(qualified)
+            self.raw_conn.commit()
+            return self.row_count
+        except Exception:
+            self.raw_conn.rollback()
+            raise
+        finally:
+            self.raw_conn.close()
+
+    def _apply_column_types(self, qualified: str):
+        """Retype the TEXT columns in one ALTER TABLE (one table rewrite)"""
+        alterations = []
+        for inference, has_value in zip(self.inferences, self.has_values):
+            if not has_value:
+                continue
+            self.column_types.append(inference.decision())
+            if inference.sql_type != "TEXT":
+                column_sql = quote_identifier(inference.column)
+                alterations.append(
+                    f"ALTER COLUMN {column_sql} TYPE {inference.sql_type} "
+                    f"USING {inference.sql_cast(column_sql)}"
+                )
+        if alterations:
+            self.cursor.execute(f"ALTER TABLE {qualified} {', '.join(alterations)}")
+
+    def abort(self):
+        try:
+            self.raw_conn.rollback()
+        finally:
+            self.raw_conn.close()
+
+    def _widen(self, width: int):
+        """Rows wider than the header get unnamed columns, as read_csv would"""
+        self.raw_headers += [None] * (width - len(self.raw_headers))
+        new_columns = clean_column_names(self.raw_headers)[len(self.columns) :]
+        qualified = (
+            f"{quote_identifier(self.loader.schema)}."
+            f"{quote_identifier(self.table_name)}"
+        )
+        for col in new_columns:
+            self.cursor.execute(
+                f"ALTER TABLE {qualified} ADD COLUMN {quote_identifier(col)} TEXT"
+            )
+        self.columns += new_columns
+        self.has_values += [False] * len(new_columns)
+        self.inferences += [ColumnTypeInference(col) for col in new_columns]
+
+
+# --- Streaming Ingestion ---
+# Same strings pandas' CSV and Excel readers treat as missing by default
+DEFAULT_NA_VALUES = {
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+}
+
+
+class PendingRows:
+    """Single-value rows held until we know whether they title a table.
+
+    Spills to a temporary file so a long run of one-value rows cannot grow
+    memory without bound.
+    """
+
+    def __init__(self, first_row: list, max_memory_bytes: int = 8 * 1024 * 1024):
+        self.first_row = first_row
+        self.count = 1
+        self.spool = tempfile.SpooledTemporaryFile(max_size=max_memory_bytes)
+        pickle.dump(first_row, self.spool)
+
+    def append(self, row: list):
+        pickle.dump(row, self.spool)
+        self.count += 1
+
+    def __iter__(self):
+        self.spool.seek(0)
+        for _ in range(self.count):
+            yield pickle.load(self.spool)
+
+    def close(self):
+        self.spool.close()
+
+
+class StreamingTableDetector:
+    """Row-at-a-time version of find_tables_in_dataframe.
+
+    Rows are pushed in with feed(); table boundaries are reported to the sink
+    (start_table / add_row / end_table) as soon as they are known, so the
+    caller never needs the whole sheet in memory.
+    """
+
+    def __init__(self, sink, sheet_name: str = "default"):
+        self.sink = sink
+        self.sheet_name = sheet_name
+        self.table_counter = 1
+        self.in_table = False
+        self.pending = None
+
+    def feed(self, row: list):
+        non_empty = [value for value in row if value is not None]
+
+        if self.pending is not None:
+            if len(non_empty) == 1:
+                self.pending.append(row)
+                return
+            if len(non_empty) > 1:
+                # The pending run was a title block followed by a header
+                self._start_titled_table(self.pending.first_row, row)
+                self.pending.close()
+                self.pending = None
+                return
+            self._resolve_pending_as_data()
+
+        if not non_empty:
+            self._end_table()
+        elif len(non_empty) == 1:
+            self.pending = PendingRows(row)
+        elif not self.in_table:
+            table_name = f"{self.sheet_name}_table_{self.table_counter}"
+            self.table_counter += 1
+            self._start_table(table_name, row)
+        else:
+            self.sink.add_row(row)
+
+    def finish(self):
+        if self.pending is not None:
+            self._resolve_pending_as_data()
+        self._end_table()
+
+    def _resolve_pending_as_data(self):
+        # No header followed, so the one-value rows are ordinary data rows.
+        # Blank-looking ones still use up a table number, as in the batch path.
+        for pending_row in self.pending:
+            if not self._title_text(pending_row):
+                self.table_counter += 1
+            if self.in_table:
+                self.sink.add_row(pending_row)
+        self.pending.close()
+        self.pending = None
+
+    @staticmethod
+    def _title_text(row: list) -> str:
+        return str(next(value for value in row if value is not None)).strip()
+
+    def _start_titled_table(self, title_row: list, header_row: list):
+        original_table_name = self._title_text(title_row)
+        if original_table_name:
+            table_name = f"{self.sheet_name}_{original_table_name}"
+        else:
+            table_name = f"{self.sheet_name}_table_{self.table_counter}"
+            self.table_counter += 1
+        self._start_table(table_name, header_row)
+
+    def _start_table(self, table_name: str, header_row: list):
+        self._end_table()
+        table_name = re.sub(r"[^\w\s]", "_", table_name)
+        table_name = re.sub(r"\s+", "_", table_name)
+        self.sink.start_table(table_name.lower(), header_row)
+        self.in_table = True
+
+    def _end_table(self):
+        if self.in_table:
+            self.sink.end_table()
+            self.in_table = False
+
+
+def unique_table_name(table_name: str, taken) -> str:
+    """table_name, or table_name_2, _3, ... if a table already has it"""
+    if table_name not in taken:
+        return table_name
+    suffix = 2
+    while f"{table_name}_{suffix}" in taken:
+        suffix += 1
+    logger.warning(
+        f"Table name {table_name} repeats; loading it as {table_name}_{suffix}"
+    )
+    return f"{table_name}_{suffix}"
+
+
+class DatabaseTableSink:
+    """Detector sink that streams each detected table into the database"""
+
+    def __init__(self, loader: BulkTableLoader):
+        self.loader = loader
+        self.writer = None
+        self.tables = {}
+
+    def start_table(self, table_name: str, header_row: list):
+        # Never replace a table loaded earlier from the same file
+        table_name = unique_table_name(table_name, self.tables)
+        self.writer = StreamingTableWriter(self.loader, table_name, header_row)
+
+    def add_row(self, row: list):
+        self.writer.append(row)
+
+    def end_table(self):
+        writer, self.writer = self.writer, None
+        row_count = writer.close()
+        if row_count:
+            self.tables[writer.table_name] = {
+                "row_count": row_count,
+                "column_types": writer.column_types,
+            }
+            self.loader.progress.table_done()
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
+
+
+def iter_uploaded_lines(uploaded_file, encoding: str = "utf-8"):
+    """Yield decoded lines from an UploadedFile without reading it whole"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    remainder = ""
+    for chunk in uploaded_file.chunks():
+        lines = (remainder + decoder.decode(chunk)).splitlines(keepends=True)
+        # Hold back a partial line (or a lone \r that may precede \n)
+        remainder = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+        yield from lines
+    remainder += decoder.decode(b"", final=True)
+    if remainder:
+        yield remainder
+
+
+def stream_csv_to_database(uploaded_file, loader: BulkTableLoader) -> Dict[str, Dict]:
+    """Detect and load the tables of a CSV upload with bounded memory.
+
+    Returns table name -> {"row_count", "column_types"} for every table loaded.
+    """
+    csv_name = os.path.splitext(uploaded_file.name)[0]
+    clean_csv_name = re.sub(r"[^\w\s]", "_", csv_name)
+    clean_csv_name = re.sub(r"\s+", "_", clean_csv_name)
+
+    sink = DatabaseTableSink(loader)
+    detector = StreamingTableDetector(sink, sheet_name=clean_csv_name)
+    try:
+        for record in csv.reader(iter_uploaded_lines(uploaded_file)):
+            if not record:
+                # read_csv skips blank lines rather than treating them as rows
+                continue
+            detector.feed(
+                [None if value in DEFAULT_NA_VALUES else value for value in record]
+            )
+        detector.finish()
+    except Exception:
+        sink.abort()
+        raise
+    finally:
+        uploaded_file.seek(0)
+
+    return sink.tables
+
+
+def normalize_excel_cell(value):
+    """Match the cell conversions pd.read_excel applies"""
+    if isinstance(value, str):
+        return None if value in DEFAULT_NA_VALUES else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def stream_xlsx_to_database(
+    uploaded_file, loader: BulkTableLoader
+) -> Dict[str, Dict]:
+    """Detect and load the tables of a large .xlsx without building DataFrames.
+
+    Rows come from openpyxl's read-only reader, so memory follows the COPY
+    block size rather than the sheet size. Returns the same summary as
+    stream_csv_to_database.
+    """
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    sink = DatabaseTableSink(loader)
+    try:
+        for worksheet in workbook.worksheets:
+            clean_sheet_name = re.sub(r"[^\w\s]", "_", worksheet.title)
+            clean_sheet_name = re.sub(r"\s+", "_", clean_sheet_name)
+
+            detector = StreamingTableDetector(sink, sheet_name=clean_sheet_name)
+            for values in worksheet.iter_rows(values_only=True):
+                detector.feed([normalize_excel_cell(value) for value in values])
+            detector.finish()
+    except Exception:
+        sink.abort()
+        raise
+    finally:
+        workbook.close()
+        uploaded_file.seek(0)
+
+    return sink.tables
+
+
+def should_stream_upload(uploaded_file) -> bool:
+    threshold = getattr(settings, "UPLOAD_STREAMING_THRESHOLD_BYTES", 0)
+    return bool(threshold) and uploaded_file.size >= threshold
+
+
+# --- Post-load Optimization ---
+def index_name_for(table_name: str, column: str, method: str) -> str:
+    """Readable index name that stays under Postgres' 63 character limit"""
+    digest = hashlib.md5(f"{table_name}.{column}.{method}".encode()).hexdigest()[:8]
+    return f"ix_{table_name[:24]}_{column[:20]}_{digest}"
+
+
+def choose_index_columns(column_types: List[Dict], stats: Dict[str, Dict], row_count: int):
+    """Pick the columns worth indexing for typical generated queries.
+
+    Date-like columns get BRIN indexes (cheap, good for range filters on
+    load-ordered data). Identifier-like columns (nearly unique) and
+    dimension columns (few distinct values relative to the row count) get
+    B-tree indexes for WHERE/GROUP BY/JOIN. Measures and booleans are skipped.
+    """
+    brin, btree = [], []
+    for decision in column_types:
+        column = decision["column"]
+        inferred_type = decision["inferred_type"]
+        column_stats = stats.get(column)
+        if column_stats is None:
+            continue
+
+        n_distinct = column_stats["n_distinct"]
+        # Negative n_distinct is a fraction of the row count
+        distinct = -n_distinct * row_count if n_distinct < 0 else n_distinct
+        if distinct < 2 or column_stats["null_frac"] > 0.9:
+            continue
+
+        if inferred_type in ("date", "timestamp"):
+            brin.append((column, "brin", "date-like column"))
+        elif inferred_type in ("integer", "text", "category"):
+            ratio = distinct / max(row_count, 1)
+            if ratio >= 0.9:
+                btree.append((ratio, column, "btree", "identifier-like column"))
+            elif distinct <= 1000 and ratio <= 0.1:
+                btree.append((ratio, column, "btree", "low-cardinality filter column"))
+
+    # Most selective B-tree candidates first
+    btree.sort(key=lambda item: -item[0])
+    return brin + [(column, method, reason) for _, column, method, reason in btree]
+
+
+def optimize_uploaded_tables(engine, loaded_tables: Dict[str, Dict], schema: str = "uploads"):
+    """ANALYZE freshly loaded tables and index likely filter/group columns.
+
+    Work stops once UPLOAD_OPTIMIZE_TIME_BUDGET_SECONDS is spent; each
+    statement also runs under a statement_timeout of the remaining budget.
+    The report is stored per table under "optimization".
+    """
+    budget = getattr(settings, "UPLOAD_OPTIMIZE_TIME_BUDGET_SECONDS", 30.0)
+    min_rows = getattr(settings, "UPLOAD_INDEX_MIN_ROWS", 10000)
+    max_indexes = getattr(settings, "UPLOAD_MAX_INDEXES_PER_TABLE", 4)
+    started = time.time()
+
+    def remaining_ms():
+        return int((budget - (time.time() - started)) * 1000)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+
+        def run_within_budget(statement):
+            if remaining_ms() <= 0:
+                return "skipped: time budget exhausted"
+            conn.execute(text(f"SET statement_timeout = {max(remaining_ms(), 1)}"))
+            try:
+                conn.execute(text(statement))
+                return "created"
+            except Exception as e:
+                logger.warning(f"Post-load optimization statement failed: {str(e)}")
+                return "timed out" if "statement timeout" in str(e) else "failed"
+
+        try:
+            for table_name, info in loaded_tables.items():
+                table_started = time.time()
+                qualified = f"{quote_identifier(schema)}.{quote_identifier(table_name)}"
+                report = {"analyzed": False, "indexes": []}
+                info["optimization"] = report
+
+                report["analyzed"] = run_within_budget(f"ANALYZE {qualified}") == "created"
+                if not report["analyzed"]:
+                    continue
+
+                if info["row_count"] < min_rows:
+                    report["skipped"] = f"fewer than {min_rows} rows"
+                    continue
+
+                stats = {
+                    row[0]: {"n_distinct": row[1], "null_frac": row[2]}
+                    for row in conn.execute(
+                        text(
+                            """
+                            SELECT attname, n_distinct, null_frac
+                            FROM pg_stats
+                            WHERE schemaname = :schema AND tablename = :table
+                            """
+                        ),
+                        {"schema": schema, "table": table_name},
+                    )
+                }
+
+                candidates = choose_index_columns(
+                    info["column_types"], stats, info["row_count"]
+                )
+                for column, method, reason in candidates[:max_indexes]:
+                    index_name = index_name_for(table_name, column, method)
+                    outcome = run_within_budget(
+                        f"CREATE INDEX IF NOT EXISTS {quote_identifier(index_name)} "
+                        f"ON {qualified} USING {method} ({quote_identifier(column)})"
+                    )
+                    report["indexes"].append(
+                        {
+                            "column": column,
+                            "method": method,
+                            "reason": reason,
+                            "name": index_name,
+                            "status": outcome,
+                        }
+                    )
+                report["elapsed_ms"] = int((time.time() - table_started) * 1000)
+        finally:
+            conn.execute(text("RESET statement_timeout"))
+
+    return {
+        "elapsed_ms": int((time.time() - started) * 1000),
+        "budget_seconds": budget,
+        "budget_exhausted": remaining_ms() <= 0,
+    }
 
-    def _generate_insights_rule_based(
-        self, df: pd.DataFrame, summary: Dict, question: str
-    ) -> str:
-        insights = []
-        insights.append(
-            f"Dataset contains {summary['row_count']:,} records across {summary['column_count']} columns"
-        )
 
-        if summary["numeric_columns"] and summary["categorical_columns"]:
-            insights.append(
-                f"Mix of {len(summary['numeric_columns'])} numeric and {len(summary['categorical_columns'])} categorical fields"
-            )
+# --- Column Profile Catalog ---
+PROFILE_TOP_VALUES = 5
+PROFILE_SAMPLE_VALUES = 3
 
-        if summary["categorical_columns"]:
-            cat_col = summary["categorical_columns"][0]
-            unique_count = summary["columns"][cat_col]["unique_count"]
-            insights.append(f"{cat_col} has {unique_count} distinct categories")
 
-        return "\n".join(
-            [f"{i + 1}. {insight}" for i, insight in enumerate(insights[:3])]
-        )
+def to_json_value(value):
+    """Make a value returned by the database safe for a JSONField"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
 
 
-VisualizationAgent = OptimizedVisualizationAgent
+def profile_uploaded_tables(engine, loaded_tables: Dict[str, Dict], schema: str = "uploads"):
+    """Build the column profile catalog for freshly loaded tables.
 
+    Null fractions and min/max come from one aggregate scan per table;
+    distinct counts and top values come from the pg_stats gathered by
+    ANALYZE, so they are approximate (and missing if ANALYZE was skipped).
+    The catalog is stored per table under "profile".
+    """
+    with engine.connect() as conn:
+        for table_name, info in loaded_tables.items():
+            info["profile"] = profile_table(conn, schema, table_name, info["column_types"])
 
-# --- SQL ReAct Agent ---
-class OptimizedSQLReActAgent:
-    """SQL ReAct Agent with uploads schema isolation"""
 
-    def __init__(self, db_uri: str, api_key: str):
-        try:
-            self.db_uri = db_uri
+def profile_table(conn, schema: str, table_name: str, column_types: List[Dict]) -> List[Dict]:
+    qualified = f"{quote_identifier(schema)}.{quote_identifier(table_name)}"
 
-            # CRITICAL: Only see uploads schema
-            self.db = SQLDatabase.from_uri(
-                db_uri,
-                schema="uploads",
-                include_tables=None,
-                sample_rows_in_table_info=3,
-            )
+    aggregates = ["count(*)"]
+    for decision in column_types:
+        column_sql = quote_identifier(decision["column"])
+        aggregates.append(f"count({column_sql})")
+        if decision["inferred_type"] == "boolean":
+            aggregates += ["NULL", "NULL"]
+        else:
+            aggregates += [f"min({column_sql})", f"max({column_sql})"]
+    totals = conn.execute(text(f"SELECT {', '.join(aggregates)} FROM {qualified}")).fetchone()
+    row_count = totals[0]
+
+    stats = {
+        row[0]: row[1:]
+        for row in conn.execute(
+            text(
+                """
+                SELECT attname, n_distinct, most_common_vals::text::text[], most_common_freqs
+                FROM pg_stats
+                WHERE schemaname = :schema AND tablename = :table
+                """
+            ),
+            {"schema": schema, "table": table_name},
+        )
+    }
+
+    sample = conn.execute(text(f"SELECT * FROM {qualified} LIMIT 20"))
+    sample_df = pd.DataFrame(sample.fetchall(), columns=list(sample.keys()))
+
+    profile = []
+    for position, decision in enumerate(column_types):
+        column = decision["column"]
+        non_null, low, high = totals[1 + position * 3 : 4 + position * 3]
+
+        approx_distinct, top_values = None, []
+        if column in stats:
+            n_distinct, common_values, common_freqs = stats[column]
+            # Negative n_distinct is a fraction of the row count
+            approx_distinct = int(round(-n_distinct * row_count if n_distinct < 0 else n_distinct))
+            top_values = [
+                {"value": value, "fraction": round(freq, 4)}
+                for value, freq in zip(common_values or [], common_freqs or [])
+            ][:PROFILE_TOP_VALUES]
+
+        samples = []
+        if column in sample_df.columns:
+            samples = [
+                to_json_value(value)
+                for value in sample_df[column].dropna().drop_duplicates().head(PROFILE_SAMPLE_VALUES)
+            ]
 
-            self.llm = ChatOpenAI(
-                model="gpt-5-mini",
-                temperature=0,
-                openai_api_key=api_key,
-                timeout=15,
-                max_retries=1,
-            )
+        profile.append(
+            {
+                "column": column,
+                "inferred_type": decision["inferred_type"],
+                "sql_type": decision["sql_type"],
+                "null_fraction": round(1 - non_null / row_count, 4) if row_count else None,
+                "approx_distinct": approx_distinct,
+                "min": to_json_value(low),
+                "max": to_json_value(high),
+                "top_values": top_values,
+                "samples": samples,
+            }
+        )
+    return profile
+
+
+def get_column_catalog(upload: UploadedFile) -> Dict[str, Dict]:
+    """Profiles of a dataset's tables, keyed by table name"""
+    if upload is None:
+        return {}
+    return {
+        table_name: {"row_count": info["row_count"], "columns": info["profile"]}
+        for table_name, info in upload.table_details.items()
+        if "profile" in info
+    }
+
+
+def describe_column_profile(column_profile: Dict) -> str:
+    """One prompt line for a profiled column"""
+    facts = [column_profile["sql_type"].lower()]
+    if column_profile["null_fraction"]:
+        facts.append(f"{column_profile['null_fraction']:.0%} null")
+    if column_profile["approx_distinct"] is not None:
+        facts.append(f"~{column_profile['approx_distinct']:,} distinct")
+    if (
+        column_profile["inferred_type"] not in ("text", "category", "boolean")
+        and column_profile["min"] is not None
+    ):
+        facts.append(f"range {column_profile['min']} to {column_profile['max']}")
+    examples = [str(top["value"]) for top in column_profile["top_values"][:3]]
+    if not examples:
+        examples = [str(value) for value in column_profile["samples"]]
+    if examples and column_profile["inferred_type"] in ("text", "category"):
+        facts.append(f"e.g. {', '.join(examples)}")
+    return f"  - {column_profile['column']} ({'; '.join(facts)})\n"
+
+
+# --- Schema Relevance Index ---
+SCHEMA_QUERY_STOPWORDS = frozenset(
+    """a about all an and any are as at be by can could did do does each for from
+    give have how i in is it list me my of on or our per please show tell than that
+    the their them there these this those to us was we were what when where which
+    who why with would you""".split()
+)
+
+
+def relevance_terms(value) -> List[str]:
+    """Lowercase word tokens with a naive plural strip ("sales" -> "sale")"""
+    terms = []
+    for token in re.findall(r"[a-z0-9]+", str(value).lower()):
+        if token in SCHEMA_QUERY_STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+def estimate_tokens(prompt_text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(prompt_text) // 4 + 1
+
+
+class SchemaIndex:
+    """Lexical/fuzzy index over a dataset's table names, column names and values.
+
+    render() lays out the prompt schema with the tables and columns most
+    relevant to a question first and stops at a token budget, instead of
+    cutting at an arbitrary 10 tables / 20 columns. Tables the question does
+    not match are only named, unless it matches none at all.
+    """
+
+    NAME_WEIGHT = 3.0
+    VALUE_WEIGHT = 1.0
+    FUZZY_THRESHOLD = 0.45
+
+    def __init__(self, schema: str):
+        self.schema = schema
+        self.tables = []
+        self.document_frequency = {}
+        self.column_count = 0
+
+    def add_table(self, table_name: str, header: str, columns):
+        """Index a table; columns are (prompt line, column name, value strings)"""
+        entries = []
+        for line, column_name, values in columns:
+            terms = {term: self.NAME_WEIGHT for term in relevance_terms(column_name)}
+            for value in values:
+                for term in relevance_terms(value):
+                    terms.setdefault(term, self.VALUE_WEIGHT)
+            for term in terms:
+                self.document_frequency[term] = self.document_frequency.get(term, 0) + 1
+            entries.append({"line": line, "terms": terms})
+        self.column_count += len(entries)
+        self.tables.append(
+            {
+                "name": table_name,
+                "header": header,
+                "name_terms": set(relevance_terms(table_name)),
+                "columns": entries,
+            }
+        )
 
-            self.toolkit = SQLDatabaseToolkit(db=self.db, llm=self.llm)
-            tools = self.toolkit.get_tools()
-            self.agent = create_react_agent(self.llm, tools)
+    @staticmethod
+    def _trigrams(term: str) -> set:
+        padded = f"  {term} "
+        return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+    def _similarity(self, query_term: str, term: str) -> float:
+        if query_term == term:
+            return 1.0
+        if min(len(query_term), len(term)) >= 4 and (
+            term.startswith(query_term) or query_term.startswith(term)
+        ):
+            return 0.8
+        query_grams, term_grams = self._trigrams(query_term), self._trigrams(term)
+        score = len(query_grams & term_grams) / len(query_grams | term_grams)
+        return score if score >= self.FUZZY_THRESHOLD else 0.0
+
+    def _query_similarities(self, query_terms) -> List[Dict[str, float]]:
+        """For each question term, the vocabulary terms it matches and how well"""
+        vocabulary = set(self.document_frequency)
+        for table in self.tables:
+            vocabulary |= table["name_terms"]
+
+        similarities = []
+        for query_term in query_terms:
+            matches = {}
+            for term in vocabulary:
+                score = self._similarity(query_term, term)
+                if score:
+                    matches[term] = score
+            similarities.append(matches)
+        return similarities
+
+    def _column_score(self, similarities, terms: Dict[str, float]) -> float:
+        score = 0.0
+        for matches in similarities:
+            best = 0.0
+            for term, weight in terms.items():
+                if term in matches:
+                    idf = np.log1p(self.column_count / self.document_frequency[term])
+                    best = max(best, matches[term] * weight * idf)
+            score += best
+        return score
+
+    def rank(self, question: str = ""):
+        """Tables (and their columns) ordered by relevance to the question"""
+        similarities = self._query_similarities(set(relevance_terms(question or "")))
+
+        ranked = []
+        for position, table in enumerate(self.tables):
+            column_scores = [
+                self._column_score(similarities, column["terms"])
+                for column in table["columns"]
+            ]
+            name_score = sum(
+                max((matches.get(term, 0.0) for term in table["name_terms"]), default=0.0)
+                for matches in similarities
+            )
+            table_score = self.NAME_WEIGHT * name_score + sum(
+                sorted(column_scores, reverse=True)[:3]
+            )
+            columns = [
+                column
+                for _, _, column in sorted(
+                    zip(column_scores, range(len(column_scores)), table["columns"]),
+                    key=lambda item: (-item[0], item[1]),
+                )
+            ]
+            ranked.append((table_score, position, table, columns))
 
-            logger.info("SQL ReAct Agent initialized (uploads schema only)")
-        except Exception as e:
-            logger.error(f"Error initializing SQL ReAct Agent: {str(e)}")
-            raise
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [(score, table, columns) for score, _, table, columns in ranked]
 
-    def query(self, question: str) -> dict:
-        try:
-            gemini_rate_limiter.wait_if_needed()
-            schema_info = self._get_schema_fast()
+    def render(
+        self, question: str = "", token_budget: int = None, unmatched_tables: int = None
+    ) -> str:
+        if not self.tables:
+            return "No uploaded data available. Please upload a file first."
+
+        token_budget = token_budget or getattr(settings, "PROMPT_SCHEMA_TOKEN_BUDGET", 2000)
+        if unmatched_tables is None:
+            unmatched_tables = getattr(settings, "PROMPT_SCHEMA_UNMATCHED_TABLES", 3)
+        schema_str = f"AVAILABLE TABLES ({self.schema} schema):\n\n"
+        used = estimate_tokens(schema_str)
+        omitted_tables = []
+
+        ranked = self.rank(question)
+        if ranked[0][0] > 0:
+            # Something matched: the rest would only pad the prompt
+            unmatched_tables = 0
+        for score, table, columns in ranked:
+            if score <= 0:
+                if unmatched_tables <= 0:
+                    omitted_tables.append(table["name"])
+                    continue
+                unmatched_tables -= 1
+            header = f"\n{table['header']}\n"
+            first_line = columns[0]["line"] if columns else ""
+            cost = estimate_tokens(header) + estimate_tokens(first_line)
+            if used + cost > token_budget and used > estimate_tokens(schema_str):
+                omitted_tables.append(table["name"])
+                continue
 
-            prompt = f"""Generate a SIMPLE PostgreSQL query to answer this question.
+            schema_str += header
+            used += estimate_tokens(header)
+            for shown, column in enumerate(columns):
+                line_cost = estimate_tokens(column["line"])
+                if shown and used + line_cost > token_budget:
+                    schema_str += f"  - ... {len(columns) - shown} more columns\n"
+                    break
+                schema_str += column["line"]
+                used += line_cost
 
-DATABASE SCHEMA (uploads schema only):
-{schema_info}
+        if omitted_tables:
+            schema_str += (
+                f"\nOther tables (columns not shown): "
+                f"{', '.join(f'{self.schema}.{name}' for name in omitted_tables)}\n"
+            )
+        return schema_str
+
+
+def build_schema_index_from_catalog(catalog: Dict[str, Dict], schema: str) -> SchemaIndex:
+    """Index a profiled dataset without touching the uploaded data"""
+    index = SchemaIndex(schema)
+    for table_name, table in catalog.items():
+        columns = []
+        for column_profile in table["columns"]:
+            values = []
+            if column_profile["inferred_type"] in ("text", "category"):
+                values = [str(top["value"]) for top in column_profile["top_values"]]
+                values += [str(value) for value in column_profile["samples"]]
+            columns.append(
+                (describe_column_profile(column_profile), column_profile["column"], values)
+            )
+        index.add_table(
+            table_name,
+            f"Table: {schema}.{table_name} ({table['row_count']:,} rows)",
+            columns,
+        )
+    return index
 
-CRITICAL RULES:
-1. Return ONLY the SQL query, no explanations
-2. ALL table names MUST use 'uploads.' prefix (e.g., uploads.sales_data)
-3. Use double quotes for column names with spaces
-4. ALWAYS add LIMIT 100
-5. Keep it SIMPLE
 
-QUESTION: {question}
+# --- Dataset Schemas ---
+# Schema-qualified references to any dataset schema, e.g. upload_<hex>.sales
+DATASET_REFERENCE_PATTERN = re.compile(r'"?\b(uploads|upload_[0-9a-f]{32})"?\s*\.')
 
-Generate query:"""
 
-            response = self.llm.invoke(prompt)
-            sql_query = response.content.strip()
-            sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
+def dataset_schema_name(upload_id) -> str:
+    """Each upload's tables live in their own schema"""
+    return f"upload_{uuid.UUID(str(upload_id)).hex}"
 
-            if not sql_query or "SELECT" not in sql_query.upper():
-                return {
-                    "success": False,
-                    "error": "Could not generate a valid SQL query.",
-                    "results": pd.DataFrame(),
-                    "query": "",
-                    "explanation": "",
-                }
 
-            # Security check
-            if self._is_query_unsafe(sql_query):
-                return {
-                    "success": False,
-                    "error": "Cannot query system tables. Only uploaded data can be queried.",
-                    "results": pd.DataFrame(),
-                    "query": sql_query,
-                    "explanation": "",
-                }
+def references_other_dataset(query: str, schema: str) -> bool:
+    return any(
+        reference != schema
+        for reference in DATASET_REFERENCE_PATTERN.findall(query.lower())
+    )
 
-            results = self._execute_query(sql_query)
 
-            if results is None:
-                gemini_rate_limiter.wait_if_needed()
-                corrected_query = self._fix_query_fast(sql_query, question, schema_info)
-                if corrected_query and not self._is_query_unsafe(corrected_query):
-                    results = self._execute_query(corrected_query)
-                    if results is not None:
-                        sql_query = corrected_query
+def create_dataset_schema(engine, schema: str):
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {quote_identifier(schema)}"))
+        conn.commit()
 
-                if results is None:
-                    return {
-                        "success": False,
-                        "error": "Query execution failed. Please rephrase your question.",
-                        "results": pd.DataFrame(),
-                        "query": sql_query,
-                        "explanation": "",
-                    }
 
-            if results.empty:
-                return {
-                    "success": True,
-                    "results": pd.DataFrame(),
-                    "query": sql_query,
-                    "explanation": "No results found for your query.",
-                    "message": "No data matches your criteria.",
-                }
+def drop_dataset_schema(engine, schema: str):
+    """Drop a dataset schema, giving up rather than queueing behind its readers"""
+    lock_timeout = getattr(settings, "UPLOAD_SCHEMA_DROP_LOCK_TIMEOUT_MS", 2000)
+    with engine.connect() as conn:
+        conn.execute(text(f"SET LOCAL lock_timeout = {int(lock_timeout)}"))
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {quote_identifier(schema)} CASCADE"))
+        conn.commit()
+    # A loaded schema never changes, so this is the only time its cache
+    # entries go stale
+    schema_description_cache.invalidate(schema)
+    question_sql_cache.invalidate_schema(schema)
 
-            return {
-                "success": True,
-                "results": results,
-                "query": sql_query,
-                "explanation": f"Query returned {len(results)} records.",
-            }
-        except Exception as e:
-            logger.error(f"Error in SQL query: {str(e)}")
-            return {
-                "success": False,
-                "error": f"Error: {str(e)}",
-                "results": pd.DataFrame(),
-                "query": "",
-                "explanation": "",
-            }
 
-    def _is_query_unsafe(self, query: str) -> bool:
-        """Check if query tries to access forbidden tables/schemas"""
-        query_lower = query.lower()
-        forbidden = [
-            "public.",
-            "information_schema.",
-            "chat_history",
-            "uploaded_files",
-            "user_preferences",
-        ]
-        return any(forbidden_item in query_lower for forbidden_item in forbidden)
+def resolve_session_dataset(session_id: str = None, upload_id=None):
+    """Dataset a request should analyze.
 
-    def _execute_query(self, query: str) -> pd.DataFrame:
-        try:
-            engine = create_engine(self.db_uri)
-            with engine.connect() as conn:
-                result = conn.execute(text(query))
-                df = pd.DataFrame(result.fetchall(), columns=result.keys())
-                return df
-        except Exception as e:
-            logger.error(f"Error executing query: {str(e)}")
-            return None
-        finally:
-            if "engine" in locals():
-                engine.dispose()
-
-    def _get_schema_fast(self) -> str:
-        try:
-            engine = create_engine(self.db_uri)
-            with engine.connect() as conn:
-                tables_query = """
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'uploads'
-                    LIMIT 10
-                """
-                tables_result = conn.execute(text(tables_query))
-                tables = [row[0] for row in tables_result]
-
-                if not tables:
-                    return "No uploaded data available. Please upload a file first."
-
-                schema_str = "AVAILABLE TABLES (uploads schema):\n\n"
-                for table in tables:
-                    columns_query = f"""
-                        SELECT column_name, data_type 
-                        FROM information_schema.columns 
-                        WHERE table_schema = 'uploads'
-                        AND table_name = '{table}'
-                        LIMIT 20
-                    """
-                    columns_result = conn.execute(text(columns_query))
-                    columns = [(row[0], row[1]) for row in columns_result]
-
-                    schema_str += f"\nTable: uploads.{table}\n"
-                    for col_name, col_type in columns:
-                        schema_str += f"  - {col_name} ({col_type})\n"
-
-                return schema_str
-        except Exception as e:
-            logger.error(f"Schema fetch error: {str(e)}")
-            return "Schema unavailable"
-        finally:
-            if "engine" in locals():
-                engine.dispose()
+    An explicit upload_id wins, then the dataset the session is bound to,
+    then the most recent completed upload.
+    """
+    datasets = UploadedFile.objects.filter(
+        is_active=True, status=UploadedFile.STATUS_COMPLETED
+    )
 
-    def _fix_query_fast(self, failed_query: str, question: str, schema: str) -> str:
+    if upload_id:
         try:
-            prompt = f"""Fix this failed query. Make it SIMPLER.
-
-SCHEMA (uploads schema):
-{schema}
+            upload = datasets.filter(id=uuid.UUID(str(upload_id))).first()
+        except ValueError:
+            upload = None
+        if upload is not None:
+            return upload
+
+    if session_id:
+        binding = (
+            SessionDataset.objects.select_related("upload")
+            .filter(session_id=session_id, upload__is_active=True)
+            .first()
+        )
+        if binding is not None:
+            return binding.upload
 
-FAILED QUERY:
-{failed_query}
+    return datasets.order_by("-uploaded_at").first()
 
-QUESTION: {question}
 
-RULES:
-1. ALL tables MUST use 'uploads.' prefix
-2. Keep it SIMPLE
-3. Add LIMIT 100
+def bind_session_dataset(session_id: str, upload: UploadedFile):
+    """Point a session at a dataset; also marks the dataset as recently used"""
+    if session_id:
+        SessionDataset.objects.update_or_create(
+            session_id=session_id, defaults={"upload": upload}
+        )
 
-Return ONLY the fixed query:"""
 
-            response = self.llm.invoke(prompt)
-            fixed_query = response.content.strip()
-            fixed_query = fixed_query.replace("```sql", "").replace("```", "").strip()
-            return fixed_query if "SELECT" in fixed_query.upper() else None
+def collect_abandoned_datasets(engine) -> Dict[str, int]:
+    """Drop dataset schemas nobody has used for UPLOAD_DATASET_TTL_HOURS.
+
+    The newest dataset is always kept as the default for new sessions.
+    Schemas whose job crashed or failed (no active or running UploadedFile)
+    are dropped as well. Schemas still being read are skipped until next time.
+    """
+    cutoff = timezone.now() - timedelta(
+        hours=getattr(settings, "UPLOAD_DATASET_TTL_HOURS", 24)
+    )
+    datasets = UploadedFile.objects.filter(
+        is_active=True, status=UploadedFile.STATUS_COMPLETED
+    )
+    latest = datasets.order_by("-uploaded_at").first()
+    recently_used = SessionDataset.objects.filter(last_used_at__gte=cutoff).values(
+        "upload_id"
+    )
+    stale = datasets.filter(uploaded_at__lt=cutoff).exclude(id__in=recently_used)
+    if latest is not None:
+        stale = stale.exclude(id=latest.id)
+
+    collected = {"datasets": 0, "orphans": 0}
+    for upload in stale:
+        try:
+            drop_dataset_schema(engine, upload.dataset_schema)
         except Exception as e:
-            logger.error(f"Query fix error: {str(e)}")
-            return None
+            logger.warning(f"Could not drop dataset schema {upload.dataset_schema}: {str(e)}")
+            continue
+        UploadedFile.objects.filter(id=upload.id).update(is_active=False)
+        SessionDataset.objects.filter(upload_id=upload.id).delete()
+        agent_cache.invalidate_dataset(upload.id)
+        collected["datasets"] += 1
+
+    with engine.connect() as conn:
+        result = conn.execute(
+            text(
+                r"""
+                SELECT schema_name
+                FROM information_schema.schemata
+                WHERE schema_name LIKE 'upload\_%'
+                """
+            )
+        )
+        live_schemas = {row[0] for row in result}
 
+    in_use = UploadedFile.objects.filter(
+        Q(is_active=True)
+        | Q(status__in=[UploadedFile.STATUS_QUEUED, UploadedFile.STATUS_RUNNING])
+    ).values_list("id", flat=True)
+    for schema in live_schemas - {dataset_schema_name(upload_id) for upload_id in in_use}:
+        try:
+            drop_dataset_schema(engine, schema)
+            collected["orphans"] += 1
+        except Exception as e:
+            logger.warning(f"Could not drop orphaned schema {schema}: {str(e)}")
+    return collected
 
-# --- Utility Functions ---
-def get_api_key():
-    try:
-        return settings.OPENAI_API_KEY  # Changed from GOOGLE_API_KEY
-    except AttributeError:
-        from dotenv import load_dotenv
 
-        load_dotenv()
-        api_key = os.getenv("OPENAI_API_KEY")  # Changed from GOOGLE_API_KEY
-        if not api_key:
-            raise Exception("OpenAI API key not found")  # Updated message
-        return api_key
+# --- Schema Description Cache ---
+def load_schema_index(conn, schema: str) -> SchemaIndex:
+    """Index a dataset without a profile catalog, in one catalog query"""
+    result = conn.execute(
+        text(
+            """
+            SELECT c.table_name, c.column_name, c.data_type
+            FROM information_schema.columns c
+            WHERE c.table_schema = :schema
+            ORDER BY c.table_name, c.ordinal_position
+            """
+        ),
+        {"schema": schema},
+    )
+
+    tables = {}
+    for table, col_name, col_type in result:
+        tables.setdefault(table, []).append(
+            (f"  - {col_name} ({col_type})\n", col_name, [])
+        )
 
+    index = SchemaIndex(schema)
+    for table, columns in tables.items():
+        index.add_table(table, f"Table: {schema}.{table}", columns)
+    return index
+
+
+class SchemaDescriptionCache:
+    """Schema indexes per dataset schema.
+
+    Each upload loads its own schema once and never writes it again, so an
+    entry stays valid until drop_dataset_schema invalidates it.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, schema: str):
+        with self.lock:
+            index = self.entries.get(schema)
+            if index is not None:
+                self.entries.move_to_end(schema)
+                self.hits += 1
+                return index
+            self.misses += 1
+            return None
 
-def generate_result_explanation(results_df, user_question, llm):
-    try:
-        row_count = len(results_df)
-        if row_count == 0:
-            return "No results found. The query returned no data."
+    def put(self, schema: str, index: SchemaIndex):
+        with self.lock:
+            self.entries[schema] = index
+            self.entries.move_to_end(schema)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
 
-        data_summary = f"Query returned {row_count} records with {len(results_df.columns)} columns.\n\n"
-        data_summary += "Columns:\n"
-        for column in results_df.columns:
-            col_data = results_df[column]
-            if pd.api.types.is_numeric_dtype(col_data) and not col_data.isna().all():
-                data_summary += f"- {column}: numeric, range {col_data.min():.2f} to {col_data.max():.2f}\n"
+    def invalidate(self, schema: str):
+        with self.lock:
+            self.entries.pop(schema, None)
 
-        data_summary += f"\nSample data:\n{results_df.head(3).to_string()}\n"
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
 
-        if llm:
-            try:
-                gemini_rate_limiter.wait_if_needed()
-                prompt = f"""Analyze these query results and provide a clear explanation in 2-3 sentences.
 
-USER QUESTION: {user_question}
+schema_description_cache = SchemaDescriptionCache()
 
-DATA SUMMARY:
-{data_summary}
 
-Provide natural language explanation:"""
+def describe_dataset_schema(
+    db_uri: str, schema: str, dataset: UploadedFile, question: str = ""
+) -> str:
+    """Schema text for the agents' prompts, pruned to what the question needs.
 
-                response = llm.invoke(prompt)
-                explanation = response.content.strip().replace("```", "").strip()
-                return explanation
-            except Exception:
-                pass
+    The index behind it is cached until the dataset is dropped.
+    """
+    index = schema_description_cache.get(schema)
+    if index is None:
+        catalog = get_column_catalog(dataset)
+        if catalog:
+            index = build_schema_index_from_catalog(catalog, schema)
+        else:
+            # Introspection is a read like any other
+            read_engine = get_engine(replica_router.read_url(dataset, db_uri))
+            with read_engine.connect() as conn:
+                index = load_schema_index(conn, schema)
+        schema_description_cache.put(schema, index)
+    return index.render(question)
+
+
+# --- Question SQL Cache ---
+QUESTION_TOKEN_PATTERN = re.compile(
+    r"""'[^']*'|"[^"]*"|!=|<>|<=|>=|[%<>=]|(?<![\w.])-?\d+(?:\.\d+)?|[^\W_]+"""
+)
+
+
+def normalize_question(question: str) -> str:
+    """Fold case, spacing and punctuation.
+
+    Numbers (with their sign), comparison operators and quoted literals are
+    kept as written, since they change the SQL.
+    """
+    tokens = QUESTION_TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", question))
+    return " ".join(
+        token if token[0] in "'\"" else token.lower() for token in tokens
+    )
+
+
+def conversation_fingerprint(messages) -> str:
+    """Hash of the conversation the planner sees; empty for a fresh session.
+
+    Only questions asked with no history are shared between sessions. Any
+    earlier turn ("only the north region") may change what a later,
+    self-contained looking question means.
+    """
+    context = [
+        normalize_question(message.content)
+        for message in messages
+        if message.type in ("human", "system")
+    ]
+    if not context:
+        return ""
+    return hashlib.sha256("\n".join(context).encode()).hexdigest()
+
+
+class QuestionSQLCache:
+    """Generated SQL keyed by dataset schema, normalized question and a
+    fingerprint of the conversation so far.
+
+    An LRU dict in front of the question_sql_cache table: a hit in either
+    tier skips the planning LLM call. A dataset's entries are deleted when
+    its schema is dropped; no other dataset's are touched.
+    """
 
-        return f"Query returned {row_count} record{'s' if row_count > 1 else ''}."
-    except Exception as e:
-        logger.error(f"Error generating explanation: {str(e)}")
-        return f"Query returned {len(results_df)} records."
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def lookup(self, schema: str, question: str, messages):
+        """Return ``(ticket, sql)``; sql is None on a miss.
+
+        Pass the ticket to store() or discard(); it is None when caching is
+        disabled.
+        """
+        if not getattr(settings, "QUESTION_CACHE_ENABLED", True):
+            return None, None
+
+        normalized = normalize_question(question)
+        key = hashlib.sha256(
+            "\x1f".join(
+                [schema, normalized, conversation_fingerprint(messages)]
+            ).encode()
+        ).hexdigest()
+        ticket = {"key": key, "schema": schema, "question": normalized}
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return ticket, entry[1]
 
+        try:
+            sql_query = (
+                CachedQuestionSQL.objects.filter(cache_key=key)
+                .values_list("sql_query", flat=True)
+                .first()
+            )
+            if sql_query is not None:
+                CachedQuestionSQL.objects.filter(cache_key=key).update(
+                    hits=F("hits") + 1
+                )
+        except Exception as e:
+            logger.warning(f"Question cache lookup failed: {str(e)}")
+            sql_query = None
+
+        with self.lock:
+            if sql_query is None:
+                self.misses += 1
+                return ticket, None
+            self.db_hits += 1
+        self._remember(key, schema, sql_query)
+        return ticket, sql_query
+
+    def store(self, ticket, sql_query: str):
+        if ticket is None:
+            return
+        self._remember(ticket["key"], ticket["schema"], sql_query)
+        try:
+            CachedQuestionSQL.objects.update_or_create(
+                cache_key=ticket["key"],
+                defaults={
+                    "schema_name": ticket["schema"],
+                    "question": ticket["question"],
+                    "sql_query": sql_query,
+                },
+            )
+        except Exception as e:
+            logger.warning(f"Question cache store failed: {str(e)}")
+        with self.lock:
+            self.stores += 1
+
+    def discard(self, ticket):
+        """Forget SQL that no longer runs"""
+        if ticket is None:
+            return
+        with self.lock:
+            self.entries.pop(ticket["key"], None)
+        try:
+            CachedQuestionSQL.objects.filter(cache_key=ticket["key"]).delete()
+        except Exception as e:
+            logger.warning(f"Question cache discard failed: {str(e)}")
 
-def clean_column_names(headers):
-    cleaned_headers = []
-    seen_headers = {}
+    def invalidate_schema(self, schema: str):
+        """Forget a dropped dataset's SQL in this process and the shared table"""
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry[0] == schema]:
+                del self.entries[key]
+        try:
+            CachedQuestionSQL.objects.filter(schema_name=schema).delete()
+        except Exception as e:
+            logger.warning(f"Question cache invalidation failed: {str(e)}")
+
+    def _remember(self, key: str, schema: str, sql_query: str):
+        with self.lock:
+            self.entries[key] = (schema, sql_query)
+            self.entries.move_to_end(key)
+            while len(self.entries) > getattr(settings, "QUESTION_CACHE_MAX_ENTRIES", 1024):
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "size": len(self.entries),
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_ratio": round((self.memory_hits + self.db_hits) / lookups, 4)
+                if lookups
+                else None,
+            }
 
-    for header in headers:
-        if pd.isna(header) or str(header).strip() == "":
-            header = "unnamed_column"
-        else:
-            header = str(header).strip().lower()
-            header = re.sub(r"[^\w\s]", "_", header)
-            header = re.sub(r"\s+", "_", header)
 
-        base_header = header
-        counter = 1
-        while header in seen_headers:
-            header = f"{base_header}_{counter}"
-            counter += 1
+question_sql_cache = QuestionSQLCache()
 
-        seen_headers[header] = True
-        cleaned_headers.append(header)
 
-    return cleaned_headers
+# --- Upload Deduplication ---
+def spool_upload(uploaded_file):
+    """Copy an upload to the job directory, hashing it in the same pass.
 
+    Returns (path, SHA-256 hex digest).
+    """
+    job_dir = getattr(settings, "UPLOAD_JOB_DIR", tempfile.gettempdir())
+    os.makedirs(job_dir, exist_ok=True)
 
-def restructure_excel_sheet(uploaded_file):
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(
+        dir=job_dir, suffix=os.path.splitext(uploaded_file.name)[1]
+    )
     try:
-        file_bytes = uploaded_file.read()
-        excel_bytes = io.BytesIO(file_bytes)
-        cleaned_dfs = {}
-
-        if uploaded_file.name.endswith((".xlsx", ".xls")):
-            excel_file = pd.ExcelFile(excel_bytes)
-            sheets = excel_file.sheet_names
+        with os.fdopen(fd, "wb") as spooled:
+            for chunk in uploaded_file.chunks():
+                digest.update(chunk)
+                spooled.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        uploaded_file.seek(0)
+    return path, digest.hexdigest()
+
+
+def find_materialized_upload(engine, uploaded_file, content_hash: str):
+    """Return the active UploadedFile for this content if its tables still exist"""
+    candidates = UploadedFile.objects.filter(
+        content_hash=content_hash,
+        is_active=True,
+        status=UploadedFile.STATUS_COMPLETED,
+    )
+    if uploaded_file.name.endswith(".csv"):
+        # CSV table names are derived from the file name
+        candidates = candidates.filter(filename=uploaded_file.name)
+
+    existing = candidates.first()
+    if existing is None or not existing.tables_created:
+        return None
 
-            for sheet in sheets:
-                df = pd.read_excel(excel_bytes, sheet_name=sheet, header=None)
-                if df.empty:
-                    continue
+    with engine.connect() as conn:
+        result = conn.execute(
+            text(
+                """
+                SELECT table_name
+                FROM information_schema.tables
+                WHERE table_schema = :schema
+                """
+            ),
+            {"schema": existing.dataset_schema},
+        )
+        live_tables = {row[0] for row in result}
+
+    return existing if set(existing.tables_created) <= live_tables else None
+
+
+def upload_summary(upload: UploadedFile) -> Dict[str, Any]:
+    return {
+        "upload_id": str(upload.id),
+        "filename": upload.filename,
+        "dataset_schema": upload.dataset_schema,
+        "status": upload.status,
+        "phase": upload.phase,
+        "rows_loaded": upload.rows_loaded,
+        "tables_done": upload.tables_done,
+        "tables": upload.tables_created,
+        "column_types": {
+            table_name: info["column_types"]
+            for table_name, info in upload.table_details.items()
+        },
+        "optimization": {
+            table_name: info.get("optimization")
+            for table_name, info in upload.table_details.items()
+        },
+        "error": upload.error,
+    }
+
+
+# --- Upload Jobs ---
+class UploadCancelled(Exception):
+    """Raised inside an ingestion job once cancellation has been requested"""
+
+
+class UploadProgress:
+    """Progress hooks called by the ingestion pipeline. No-ops by default."""
+
+    def set_phase(self, phase: str):
+        pass
+
+    def add_rows(self, count: int):
+        pass
+
+    def table_done(self):
+        pass
+
+    def check_cancelled(self):
+        pass
+
+
+class JobProgress(UploadProgress):
+    """Persist a job's progress on its UploadedFile row and watch for cancel.
+
+    Row counts are flushed at most every min_interval seconds so large
+    uploads do not turn into a stream of UPDATEs.
+    """
+
+    def __init__(self, upload_id, min_interval: float = 1.0):
+        self.upload_id = upload_id
+        self.min_interval = min_interval
+        self.phase = ""
+        self.rows_loaded = 0
+        self.tables_done = 0
+        self.last_flush = 0.0
+
+    def set_phase(self, phase: str):
+        self.phase = phase
+        self.flush(force=True)
+
+    def add_rows(self, count: int):
+        self.rows_loaded += count
+        self.flush()
+
+    def table_done(self):
+        self.tables_done += 1
+        self.flush(force=True)
+
+    def flush(self, force: bool = False):
+        now = time.time()
+        if not force and now - self.last_flush < self.min_interval:
+            return
+        self.last_flush = now
+        UploadedFile.objects.filter(id=self.upload_id).update(
+            phase=self.phase,
+            rows_loaded=self.rows_loaded,
+            tables_done=self.tables_done,
+            updated_at=timezone.now(),
+        )
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if UploadedFile.objects.filter(
+            id=self.upload_id, cancel_requested=True
+        ).exists():
+            raise UploadCancelled()
+
+
+def ingest_upload(
+    engine, uploaded_file, progress: UploadProgress, schema: str
+) -> Dict[str, Dict]:
+    """Parse an upload and load its tables into the dataset's own schema.
+
+    Returns table name -> {"row_count", "column_types"}.
+    """
+    create_dataset_schema(engine, schema)
+    loader = BulkTableLoader(engine, schema=schema, progress=progress)
+
+    # Large files are parsed and loaded chunk by chunk
+    stream_to_database = None
+    if should_stream_upload(uploaded_file):
+        if uploaded_file.name.endswith(".csv"):
+            stream_to_database = stream_csv_to_database
+        elif uploaded_file.name.endswith(".xlsx"):
+            stream_to_database = stream_xlsx_to_database
+
+    if stream_to_database is not None:
+        progress.set_phase("loading")
+        loaded_tables = stream_to_database(uploaded_file, loader)
+    else:
+        progress.set_phase("parsing")
+        cleaned_dfs = restructure_excel_sheet(uploaded_file, progress) or {}
+
+        # Save to DB with inferred, downcast column types
+        progress.set_phase("loading")
+        loaded_tables = {}
+        for table_name, df in cleaned_dfs.items():
+            typed_df, column_types = infer_column_types(df)
+            loader.load(
+                table_name,
+                typed_df,
+                {d["column"]: d["sql_type"] for d in column_types},
+            )
+            loaded_tables[table_name] = {
+                "row_count": len(typed_df),
+                "column_types": column_types,
+            }
+            progress.table_done()
 
-                clean_sheet_name = re.sub(r"[^\w\s]", "_", sheet)
-                clean_sheet_name = re.sub(r"\s+", "_", clean_sheet_name)
+    if loaded_tables:
+        progress.set_phase("optimizing")
+        summary = optimize_uploaded_tables(engine, loaded_tables, schema)
+        logger.info(f"Post-load optimization finished: {summary}")
 
-                table_sections = find_tables_in_dataframe(
-                    df, sheet_name=clean_sheet_name
-                )
+        progress.set_phase("profiling")
+        profile_uploaded_tables(engine, loaded_tables, schema)
+    return loaded_tables
 
-                for table_info in table_sections:
-                    processed_df = process_single_table(df, table_info)
-                    if processed_df is not None and not processed_df.empty:
-                        table_name = table_info["name"].lower()
-                        cleaned_dfs[table_name] = processed_df
 
-        elif uploaded_file.name.endswith(".csv"):
-            df = pd.read_csv(io.StringIO(file_bytes.decode("utf-8")), header=None)
-            if not df.empty:
-                csv_name = os.path.splitext(uploaded_file.name)[0]
-                clean_csv_name = re.sub(r"[^\w\s]", "_", csv_name)
-                clean_csv_name = re.sub(r"\s+", "_", clean_csv_name)
+def run_upload_job(upload_id, path: str, filename: str, session_id: str = None):
+    """Ingest a spooled upload and record the outcome on its UploadedFile"""
+    progress = JobProgress(upload_id)
+    schema = dataset_schema_name(upload_id)
+    engine = get_engine()
+    try:
+        if not UploadedFile.objects.filter(
+            id=upload_id, status=UploadedFile.STATUS_QUEUED, cancel_requested=False
+        ).update(status=UploadedFile.STATUS_RUNNING):
+            UploadedFile.objects.filter(id=upload_id).update(
+                status=UploadedFile.STATUS_CANCELLED, phase=""
+            )
+            return
 
-                table_sections = find_tables_in_dataframe(df, sheet_name=clean_csv_name)
+        try:
+            with open(path, "rb") as spooled:
+                loaded_tables = ingest_upload(
+                    engine, File(spooled, name=filename), progress, schema
+                )
+            if not loaded_tables:
+                raise ValueError("No valid data found in file")
+        except Exception:
+            # Never leave a half-loaded dataset behind
+            try:
+                drop_dataset_schema(engine, schema)
+            except Exception as e:
+                logger.warning(f"Could not drop dataset schema {schema}: {str(e)}")
+            raise
 
-                for table_info in table_sections:
-                    processed_df = process_single_table(df, table_info)
-                    if processed_df is not None and not processed_df.empty:
-                        table_name = table_info["name"].lower()
-                        cleaned_dfs[table_name] = processed_df
+        UploadedFile.objects.filter(id=upload_id).update(
+            status=UploadedFile.STATUS_COMPLETED,
+            phase="",
+            written_lsn=upload_written_lsn(engine),
+            tables_created=list(loaded_tables.keys()),
+            row_count=sum(info["row_count"] for info in loaded_tables.values()),
+            column_count=sum(
+                len(info["column_types"]) for info in loaded_tables.values()
+            ),
+            rows_loaded=sum(info["row_count"] for info in loaded_tables.values()),
+            tables_done=len(loaded_tables),
+            table_details=loaded_tables,
+            is_active=True,
+        )
+        if session_id:
+            bind_session_dataset(session_id, UploadedFile.objects.get(id=upload_id))
+            agent_cache.invalidate_session(session_id)
 
-        return cleaned_dfs if cleaned_dfs else None
+        try:
+            collected = collect_abandoned_datasets(engine)
+            logger.info(f"Dataset garbage collection: {collected}")
+        except Exception as e:
+            logger.warning(f"Dataset garbage collection failed: {str(e)}")
+    except UploadCancelled:
+        logger.info(f"Upload job {upload_id} cancelled")
+        UploadedFile.objects.filter(id=upload_id).update(
+            status=UploadedFile.STATUS_CANCELLED, phase=""
+        )
     except Exception as e:
-        logger.error(f"Error processing file: {str(e)}")
-        return None
+        logger.error(f"Upload job {upload_id} failed: {str(e)}")
+        UploadedFile.objects.filter(id=upload_id).update(
+            status=UploadedFile.STATUS_FAILED, phase="", error=str(e)
+        )
     finally:
-        uploaded_file.seek(0)
-
-
-def find_tables_in_dataframe(df, sheet_name="default"):
-    tables = []
-    current_table = None
-    i = 0
-    table_counter = 1
-
-    while i < len(df):
-        row = df.iloc[i]
-
-        if row.isna().all():
-            if current_table is not None:
-                tables.append(current_table)
-                current_table = None
-            i += 1
-            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        db_connection.close()
 
-        if is_table_name_row(row):
-            original_table_name = str(row.dropna().iloc[0]).strip()
-            if original_table_name and isinstance(original_table_name, str):
-                table_name = f"{sheet_name}_{original_table_name}"
-            else:
-                table_name = f"{sheet_name}_table_{table_counter}"
-                table_counter += 1
 
-            table_name = re.sub(r"[^\w\s]", "_", table_name)
-            table_name = re.sub(r"\s+", "_", table_name)
+class UploadJobRunner:
+    """Local thread pool that runs ingestion jobs outside the request.
 
-            header_idx = None
-            data_start_idx = None
+    Jobs only exist in the process that accepted them, so the runner keeps
+    updated_at fresh on the jobs it owns. A queued or running job whose
+    heartbeat stopped (restart, recycled worker) is marked failed by
+    reap_stale(), and its half-loaded schema is then garbage collected.
+    """
 
-            for j in range(i + 1, len(df)):
-                next_row = df.iloc[j]
-                if next_row.isna().all():
-                    break
-                if header_idx is None and is_header_row(next_row):
-                    header_idx = j
-                    data_start_idx = j + 1
-                    break
+    REAP_INTERVAL = 60
 
-            if header_idx is not None:
-                if current_table is not None:
-                    tables.append(current_table)
+    def __init__(self):
+        self.executor = None
+        self.heartbeat = None
+        self.owned = set()
+        self.lock = threading.Lock()
+        self.last_reap = 0.0
+
+    def submit(self, upload_id, path: str, filename: str, session_id: str = None):
+        self.reap_stale()
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "UPLOAD_JOB_WORKERS", 1),
+                    thread_name_prefix="upload-job",
+                )
+            self._own(upload_id)
+        return self.executor.submit(self._run, upload_id, path, filename, session_id)
+
+    def run(self, upload_id, path: str, filename: str, session_id: str = None):
+        """Run a job in the calling thread (UPLOAD_ASYNC=false)"""
+        self.reap_stale()
+        with self.lock:
+            self._own(upload_id)
+        self._run(upload_id, path, filename, session_id)
+
+    def _own(self, upload_id):
+        self.owned.add(upload_id)
+        if self.heartbeat is None:
+            self.heartbeat = threading.Thread(
+                target=self._beat, name="upload-job-heartbeat", daemon=True
+            )
+            self.heartbeat.start()
 
-                current_table = {
-                    "name": table_name,
-                    "start": header_idx,
-                    "data_start": data_start_idx,
-                    "header_row": header_idx,
-                    "end": None,
-                }
-                i = data_start_idx
+    def _run(self, upload_id, path: str, filename: str, session_id: str = None):
+        try:
+            run_upload_job(upload_id, path, filename, session_id)
+        finally:
+            with self.lock:
+                self.owned.discard(upload_id)
+
+    def _beat(self):
+        while True:
+            time.sleep(getattr(settings, "UPLOAD_JOB_HEARTBEAT_SECONDS", 30))
+            with self.lock:
+                owned = list(self.owned)
+            if not owned:
                 continue
+            try:
+                UploadedFile.objects.filter(id__in=owned).update(
+                    updated_at=timezone.now()
+                )
+            except Exception as e:
+                logger.warning(f"Upload job heartbeat failed: {str(e)}")
+            finally:
+                db_connection.close()
 
-        if current_table is None and is_header_row(row):
-            table_name = f"{sheet_name}_table_{table_counter}"
-            table_name = re.sub(r"[^\w\s]", "_", table_name)
-            table_name = re.sub(r"\s+", "_", table_name)
-
-            current_table = {
-                "name": table_name,
-                "start": i,
-                "data_start": i + 1,
-                "header_row": i,
-                "end": None,
-            }
-            table_counter += 1
-            i += 1
-            continue
+    def reap_stale(self) -> int:
+        """Fail queued or running jobs no live process is working on"""
+        now = time.time()
+        if now - self.last_reap < self.REAP_INTERVAL:
+            return 0
+        self.last_reap = now
+        cutoff = timezone.now() - timedelta(
+            seconds=getattr(settings, "UPLOAD_JOB_STALE_SECONDS", 300)
+        )
+        with self.lock:
+            owned = list(self.owned)
+        try:
+            reaped = (
+                UploadedFile.objects.filter(
+                    status__in=[UploadedFile.STATUS_QUEUED, UploadedFile.STATUS_RUNNING],
+                    updated_at__lt=cutoff,
+                )
+                .exclude(id__in=owned)
+                .update(
+                    status=UploadedFile.STATUS_FAILED,
+                    phase="",
+                    error="The upload was interrupted. Please upload the file again.",
+                    updated_at=timezone.now(),
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Could not reap stale upload jobs: {str(e)}")
+            return 0
+        if reaped:
+            logger.warning(f"Marked {reaped} interrupted upload jobs failed")
+        return reaped
 
-        if current_table is not None:
-            current_table["end"] = i + 1
+    def reset_after_fork(self):
+        # The pool and heartbeat threads stay behind in the parent
+        self.executor = None
+        self.heartbeat = None
+        self.owned = set()
+        self.lock = threading.Lock()
 
-        i += 1
 
-    if current_table is not None:
-        tables.append(current_table)
+upload_job_runner = UploadJobRunner()
+os.register_at_fork(after_in_child=upload_job_runner.reset_after_fork)
 
-    return tables
 
+# --- Agent Cache ---
+class AgentCache:
+    """LRU cache of ConversationalSQLAgent instances with a TTL.
 
-def is_table_name_row(row):
-    non_empty_values = row.dropna()
-    return len(non_empty_values) == 1
+    Keyed by session and dataset, so a follow-up question reuses the agent
+    while a session switching to a new upload gets a fresh one. Memory is
+    bounded by AGENT_CACHE_MAX_ENTRIES; least recently used agents go first.
+    """
 
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, session_id: str, dataset: UploadedFile, factory):
+        key = (session_id, str(dataset.id) if dataset is not None else None)
+        ttl = getattr(settings, "AGENT_CACHE_TTL_SECONDS", 1800)
+        now = time.time()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[1] < ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Build outside the lock; a racing duplicate is harmless
+        agent = factory()
+        with self.lock:
+            self.entries[key] = (agent, now)
+            self.entries.move_to_end(key)
+            while len(self.entries) > getattr(settings, "AGENT_CACHE_MAX_ENTRIES", 256):
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return agent
+
+    def invalidate_session(self, session_id: str):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == session_id]:
+                del self.entries[key]
+
+    def invalidate_dataset(self, upload_id):
+        with self.lock:
+            for key in [key for key in self.entries if key[1] == str(upload_id)]:
+                del self.entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
 
-def is_header_row(row):
-    non_empty_values = row.dropna()
-    return len(non_empty_values) > 1
 
+agent_cache = AgentCache()
 
-def process_single_table(df, table_info):
-    try:
-        headers = df.iloc[table_info["header_row"]].tolist()
-        cleaned_headers = clean_column_names(headers)
 
-        start_idx = table_info["data_start"]
-        end_idx = table_info["end"]
-        data_df = df.iloc[start_idx:end_idx].copy()
+# --- Result Store ---
+class ResultStore:
+    """Query results kept server-side and served by result id.
 
-        result_df = pd.DataFrame(data_df.values, columns=cleaned_headers)
-        result_df = result_df.dropna(how="all").dropna(axis=1, how="all")
+    Responses carry the first page and a handle, so later pages, CSV export
+    and visualization read the stored frame instead of the client posting
+    the rows back. Every result is written through to RESULT_STORE_DIR, so
+    any worker sharing the directory can serve it; the most recently used
+    frames are also kept in memory up to RESULT_STORE_MAX_MEMORY_BYTES.
+    Everything expires after RESULT_STORE_TTL_SECONDS.
+    """
 
-        return result_df if not result_df.empty else None
-    except Exception as e:
-        logger.error(f"Error processing table: {str(e)}")
-        return None
+    DISK_SWEEP_INTERVAL = 60
 
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.last_disk_sweep = 0.0
+        self.hits = 0
+        self.disk_reads = 0
+        self.misses = 0
+        self.evictions = 0
 
-def sanitize_dataframe_for_json(df):
-    if df is None or df.empty:
-        return df
-    df = df.replace([np.nan, np.inf, -np.inf], None)
-    for col in df.columns:
-        if df[col].dtype in ["float64", "float32", "float16"]:
-            df[col] = df[col].apply(
-                lambda x: None
-                if (x is not None and (np.isnan(x) or np.isinf(x)))
-                else x
+    @staticmethod
+    def _path(result_id: str) -> str:
+        return os.path.join(settings.RESULT_STORE_DIR, f"{result_id}.pkl")
+
+    def put(self, df: pd.DataFrame, **meta) -> str:
+        result_id = str(uuid.uuid4())
+        entry = {
+            "df": df,
+            "meta": meta,
+            "bytes": int(df.memory_usage(index=True, deep=True).sum()),
+            "expires_at": time.time()
+            + getattr(settings, "RESULT_STORE_TTL_SECONDS", 1800),
+        }
+        os.makedirs(settings.RESULT_STORE_DIR, exist_ok=True)
+        path = self._path(result_id)
+        with open(f"{path}.tmp", "wb") as f:
+            pickle.dump(
+                {key: entry[key] for key in ("df", "meta", "expires_at")},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
             )
-    return df
+        os.replace(f"{path}.tmp", path)
+
+        with self.lock:
+            self._expire()
+            self.entries[result_id] = entry
+            self.memory_bytes += entry["bytes"]
+            self._evict_over_budget()
+        self._sweep_disk()
+        return result_id
+
+    def get(self, result_id: str, session_id: str = None):
+        """Return ``(df, meta)`` for a live result, or None.
+
+        A result published for a session is only served to that session.
+        """
+        result_id = str(result_id)
+        with self.lock:
+            entry = self.entries.get(result_id)
+            if entry is not None and entry["expires_at"] <= time.time():
+                self._remove(result_id)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(result_id)
+                self.hits += 1
+                stored = entry
+
+        if entry is None:
+            # Evicted here or stored by another worker; served from disk
+            # without promoting it back into memory
+            try:
+                with open(self._path(result_id), "rb") as f:
+                    stored = pickle.load(f)
+            except FileNotFoundError:
+                with self.lock:
+                    self.misses += 1
+                return None
+            if stored["expires_at"] <= time.time():
+                self._delete_file(result_id)
+                with self.lock:
+                    self.misses += 1
+                return None
+            with self.lock:
+                self.disk_reads += 1
+
+        owner = stored["meta"].get("session_id")
+        if owner and str(owner) != str(session_id or ""):
+            return None
+        return stored["df"], stored["meta"]
+
+    def _evict_over_budget(self):
+        budget = getattr(settings, "RESULT_STORE_MAX_MEMORY_BYTES", 128 * 1024 * 1024)
+        while self.entries and self.memory_bytes > budget:
+            _, entry = self.entries.popitem(last=False)
+            self.memory_bytes -= entry["bytes"]
+            self.evictions += 1
+
+    def _expire(self):
+        now = time.time()
+        for result_id in [
+            result_id
+            for result_id, entry in self.entries.items()
+            if entry["expires_at"] <= now
+        ]:
+            self._remove(result_id)
+
+    def _remove(self, result_id: str):
+        entry = self.entries.pop(result_id)
+        self.memory_bytes -= entry["bytes"]
+        self._delete_file(result_id)
+
+    def _delete_file(self, result_id: str):
+        try:
+            os.remove(self._path(result_id))
+        except FileNotFoundError:
+            pass
+
+    def _sweep_disk(self):
+        """Remove expired result files, including those of other workers"""
+        now = time.time()
+        if now - self.last_disk_sweep < self.DISK_SWEEP_INTERVAL:
+            return
+        self.last_disk_sweep = now
+        cutoff = now - getattr(settings, "RESULT_STORE_TTL_SECONDS", 1800)
+        try:
+            with os.scandir(settings.RESULT_STORE_DIR) as stored:
+                for item in stored:
+                    if item.stat().st_mtime < cutoff:
+                        os.remove(item.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Result store sweep failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "in_memory": len(self.entries),
+                "memory_bytes": self.memory_bytes,
+                "hits": self.hits,
+                "disk_reads": self.disk_reads,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
 
 
-def clear_uploaded_data_tables(engine):
-    """Clear ONLY tables in uploads schema"""
-    try:
-        with engine.connect() as conn:
-            # Create uploads schema if doesn't exist
-            conn.execute(text("CREATE SCHEMA IF NOT EXISTS uploads;"))
-            conn.execute(text("SET session_replication_role = 'replica';"))
-
-            # Get tables ONLY from uploads schema
-            table_names_query = """
-                SELECT table_name 
-                FROM information_schema.tables 
-                WHERE table_schema = 'uploads' 
-                AND table_type = 'BASE TABLE';
-            """
-            result = conn.execute(text(table_names_query))
-            tables = [row[0] for row in result]
+result_store = ResultStore()
 
-            # Drop each table in uploads schema
-            for table in tables:
-                conn.execute(text(f'DROP TABLE IF EXISTS uploads."{table}" CASCADE;'))
 
-            conn.execute(text("SET session_replication_role = 'origin';"))
-            conn.commit()
+def result_page(df: pd.DataFrame, offset: int = 0, limit: int = None) -> Dict[str, Any]:
+    limit = min(
+        limit or getattr(settings, "RESULT_PAGE_SIZE", 100),
+        getattr(settings, "RESULT_PAGE_MAX_SIZE", 1000),
+    )
+    page = df.iloc[offset : offset + limit]
+    end = offset + len(page)
+    return {
+        "results": sanitize_dataframe_for_json(page).to_dict(orient="records")
+        if not page.empty
+        else [],
+        "offset": offset,
+        "limit": limit,
+        "row_count": len(df),
+        "next_offset": end if end < len(df) else None,
+    }
 
-            logger.info(f"Cleared {len(tables)} table(s) from uploads schema")
-    except Exception as e:
-        logger.error(f"Error clearing uploads schema: {str(e)}")
-        raise
+
+def publish_result(df: pd.DataFrame, session_id: str = None, query: str = "") -> Dict[str, Any]:
+    """Store a query result and return its handle with the first page"""
+    limits = result_limits(df)
+    result_id = result_store.put(df, session_id=session_id, query=query, **limits)
+    return {
+        "result_id": result_id,
+        "session_id": session_id,
+        **result_page(df),
+        **limits,
+    }
 
 
 # --- API Views ---
@@ -1400,42 +5081,76 @@ class DataAnalysisAPIView(APIView):
     def handle_file_upload(self, request):
         try:
             uploaded_file = request.FILES["file"]
+            session_id = request.data.get("session_id")
+            path, content_hash = spool_upload(uploaded_file)
 
-            # Create uploads schema and clear old data
-            engine = create_engine(self.db_uri)
-            try:
-                clear_uploaded_data_tables(engine)
-
-                # Process file
-                cleaned_dfs = restructure_excel_sheet(uploaded_file)
-
-                if not cleaned_dfs:
-                    return Response(
-                        {"error": "No valid data found in file"},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Save to DB
-                with engine.connect() as conn:
-                    for table_name, df in cleaned_dfs.items():
-                        df.to_sql(
-                            table_name,
-                            conn,
-                            schema="uploads",
-                            if_exists="replace",
-                            index=False,
-                        )
+            # Same content already loaded: nothing to parse or load
+            existing = find_materialized_upload(
+                get_engine(self.db_uri), uploaded_file, content_hash
+            )
 
+            if existing is not None:
+                os.remove(path)
+                bind_session_dataset(session_id, existing)
+                agent_cache.invalidate_session(session_id)
+                logger.info(f"Upload {existing.id} already materialized, skipping")
                 return Response(
                     {
                         "success": True,
                         "message": "File processed successfully",
-                        "tables": list(cleaned_dfs.keys()),
+                        "deduplicated": True,
+                        **upload_summary(existing),
                     }
                 )
 
-            finally:
-                engine.dispose()
+            upload_id = uuid.uuid4()
+            upload = UploadedFile.objects.create(
+                id=upload_id,
+                schema_name=dataset_schema_name(upload_id),
+                filename=uploaded_file.name,
+                file_size=uploaded_file.size,
+                file_type=os.path.splitext(uploaded_file.name)[1].lstrip(".").lower(),
+                content_hash=content_hash,
+                status=UploadedFile.STATUS_QUEUED,
+                phase="queued",
+                is_active=False,
+            )
+
+            if getattr(settings, "UPLOAD_ASYNC", True):
+                upload_job_runner.submit(
+                    upload.id, path, uploaded_file.name, session_id
+                )
+                return Response(
+                    {
+                        "success": True,
+                        "message": "File accepted for processing",
+                        "deduplicated": False,
+                        **upload_summary(upload),
+                    },
+                    status=status.HTTP_202_ACCEPTED,
+                )
+
+            upload_job_runner.run(upload.id, path, uploaded_file.name, session_id)
+            upload.refresh_from_db()
+
+            if upload.status != UploadedFile.STATUS_COMPLETED:
+                if upload.error == "No valid data found in file":
+                    return Response(
+                        {"error": upload.error}, status=status.HTTP_400_BAD_REQUEST
+                    )
+                return Response(
+                    {"error": f"Upload failed: {upload.error}"},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                )
+
+            return Response(
+                {
+                    "success": True,
+                    "message": "File processed successfully",
+                    "deduplicated": False,
+                    **upload_summary(upload),
+                }
+            )
 
         except Exception as e:
             logger.error(f"Upload error: {str(e)}")
@@ -1458,24 +5173,16 @@ class DataAnalysisAPIView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            # Check if uploads schema has tables
-            engine = create_engine(self.db_uri)
-            try:
-                with engine.connect() as conn:
-                    tables_query = """
-                        SELECT COUNT(*) FROM information_schema.tables 
-                        WHERE table_schema = 'uploads'
-                    """
-                    result = conn.execute(text(tables_query))
-                    table_count = result.scalar()
-
-                    if table_count == 0:
-                        return Response(
-                            {"error": "No data available. Please upload a file first."},
-                            status=status.HTTP_400_BAD_REQUEST,
-                        )
-            finally:
-                engine.dispose()
+            # Resolve the dataset this session analyzes
+            dataset = resolve_session_dataset(
+                session_id, request.data.get("upload_id")
+            )
+            if dataset is None:
+                return Response(
+                    {"error": "No data available. Please upload a file first."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            bind_session_dataset(session_id, dataset)
 
             # Ensure Chat Session exists
             try:
@@ -1488,8 +5195,13 @@ class DataAnalysisAPIView(APIView):
                 logger.error(f"Error creating session: {e}")
 
             # Create agent
-            gemini_rate_limiter.wait_if_needed()
-            conv_agent = ConversationalSQLAgent(self.db_uri, self.api_key, session_id)
+            conv_agent = agent_cache.get_or_create(
+                session_id,
+                dataset,
+                lambda: ConversationalSQLAgent(
+                    self.db_uri, self.api_key, session_id, dataset
+                ),
+            )
 
             if stream_response:
 
@@ -1509,6 +5221,8 @@ class DataAnalysisAPIView(APIView):
             # Normal execution
             try:
                 result = conv_agent.query_with_conversation(user_question)
+            except RateLimited as e:
+                return rate_limited_response(e)
             except Exception as agent_error:
                 logger.error(f"Agent error: {str(agent_error)}")
                 return Response(
@@ -1541,14 +5255,13 @@ class DataAnalysisAPIView(APIView):
 
             if result["success"]:
                 if result.get("results") is not None and not result["results"].empty:
-                    sanitized_results = sanitize_dataframe_for_json(result["results"])
-                    results_dict = sanitized_results.to_dict(orient="records")
-
                     response_data = {
                         "success": True,
                         "query": result.get("query", ""),
                         "explanation": result.get("explanation", ""),
-                        "results": results_dict,
+                        **publish_result(
+                            result["results"], session_id, result.get("query", "")
+                        ),
                     }
                 else:
                     response_data = {
@@ -1593,9 +5306,318 @@ class DataAnalysisAPIView(APIView):
             )
 
 
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAnalysisQueryView(View):
+    """Question endpoint for ASGI deployments.
+
+    Takes the same body as a question to DataAnalysisAPIView and answers
+    the same way, as server-sent events when ``stream`` is set. LLM calls,
+    the generated query and chat memory are awaited rather than blocking a
+    thread, so one worker holds many questions in flight. It works under
+    WSGI too, without that gain.
+    """
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body."}, status=400)
+
+        user_question = data.get("query")
+        session_id = data.get("session_id", "default")
+        if not user_question:
+            return JsonResponse({"error": "Please provide a question."}, status=400)
+
+        # WSGI runs each async call on a fresh event loop; ASGI keeps one
+        loop_scoped = not isinstance(request, ASGIRequest)
+
+        try:
+            dataset = await run_blocking(resolve_session_dataset)(
+                session_id, data.get("upload_id")
+            )
+            if dataset is None:
+                return JsonResponse(
+                    {"error": "No data available. Please upload a file first."},
+                    status=400,
+                )
+            await run_blocking(bind_session_dataset)(session_id, dataset)
+
+            try:
+                await run_blocking(ChatSession.objects.get_or_create)(
+                    session_id=session_id, defaults={"title": user_question[:100]}
+                )
+            except Exception as e:
+                logger.error(f"Error creating session: {e}")
+
+            conv_agent = await run_blocking(agent_cache.get_or_create)(
+                session_id,
+                dataset,
+                lambda: ConversationalSQLAgent(
+                    settings.DATABASE_URL, get_api_key(), session_id, dataset
+                ),
+            )
+            events = conv_agent.astream_query_with_conversation(user_question)
+
+            if data.get("stream", False):
+
+                async def event_stream():
+                    try:
+                        async for event in events:
+                            yield f"data: {json.dumps(event)}\n\n"
+                    finally:
+                        if loop_scoped:
+                            await close_loop_resources()
+
+                response = StreamingHttpResponse(
+                    event_stream(), content_type="text/event-stream"
+                )
+                response["Cache-Control"] = "no-cache"
+                response["X-Accel-Buffering"] = "no"
+                return response
+
+            try:
+                outcome = None
+                async for event in events:
+                    if event["type"] in ("complete", "error"):
+                        outcome = event
+            finally:
+                if loop_scoped:
+                    await close_loop_resources()
+
+            if outcome is not None and outcome["type"] == "complete":
+                return JsonResponse(outcome["data"])
+            if outcome is not None and "retry_after" in outcome:
+                return rate_limited_response(
+                    RateLimited(outcome["retry_after"]), JsonResponse
+                )
+            return JsonResponse(
+                {
+                    "error": outcome["error"]
+                    if outcome is not None
+                    else "Unable to process your query."
+                },
+                status=400,
+            )
+
+        except Exception as e:
+            logger.error(f"Async analysis query handler error: {str(e)}")
+            return JsonResponse({"error": f"Error: {str(e)}"}, status=500)
+
+
+class UploadStatusAPIView(APIView):
+    """API to poll an upload's ingestion job"""
+
+    def get(self, request, upload_id):
+        try:
+            # A job lost to a restart is reported failed instead of polled forever
+            upload_job_runner.reap_stale()
+            upload = UploadedFile.objects.get(id=upload_id)
+            return Response({"success": True, **upload_summary(upload)})
+        except UploadedFile.DoesNotExist:
+            return Response(
+                {"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        except Exception as e:
+            logger.error(f"Error fetching upload status: {str(e)}")
+            return Response(
+                {"error": f"Error: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class UploadCancelAPIView(APIView):
+    """API to cancel a queued or running ingestion job"""
+
+    def post(self, request, upload_id):
+        try:
+            updated = UploadedFile.objects.filter(
+                id=upload_id,
+                status__in=[UploadedFile.STATUS_QUEUED, UploadedFile.STATUS_RUNNING],
+            ).update(cancel_requested=True)
+
+            upload = UploadedFile.objects.get(id=upload_id)
+            if not updated:
+                return Response(
+                    {
+                        "error": f"Upload is already {upload.status}",
+                        **upload_summary(upload),
+                    },
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return Response(
+                {"success": True, "cancel_requested": True, **upload_summary(upload)}
+            )
+        except UploadedFile.DoesNotExist:
+            return Response(
+                {"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        except Exception as e:
+            logger.error(f"Error cancelling upload: {str(e)}")
+            return Response(
+                {"error": f"Error: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class UploadProfileAPIView(APIView):
+    """API to read an upload's column profile catalog"""
+
+    def get(self, request, upload_id):
+        try:
+            upload = UploadedFile.objects.get(id=upload_id)
+            return Response(
+                {
+                    "success": True,
+                    "upload_id": str(upload.id),
+                    "status": upload.status,
+                    "tables": {
+                        table_name: {
+                            "row_count": info["row_count"],
+                            "columns": info.get("profile", []),
+                        }
+                        for table_name, info in upload.table_details.items()
+                    },
+                }
+            )
+        except UploadedFile.DoesNotExist:
+            return Response(
+                {"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        except Exception as e:
+            logger.error(f"Error fetching upload profile: {str(e)}")
+            return Response(
+                {"error": f"Error: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
+class CacheStatsAPIView(APIView):
+    """API exposing in-process cache effectiveness"""
+
+    # Internal sizing and host details: staff only
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {
+                "success": True,
+                "agents": agent_cache.stats(),
+                "schema_descriptions": schema_description_cache.stats(),
+                "results": result_store.stats(),
+                "questions": question_sql_cache.stats(),
+            }
+        )
+
+
+class LLMSchedulerStatsAPIView(APIView):
+    """API exposing LLM call queueing, shedding and wait times"""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"success": True, **llm_scheduler.stats()})
+
+
+class DatabasePoolStatsAPIView(APIView):
+    """API exposing connection pool usage for sizing"""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {
+                "success": True,
+                "engines": engine_registry.stats(),
+                "chat_memory": chat_memory_pool.stats(),
+                "replicas": replica_router.stats(),
+                "django": {
+                    "conn_max_age": settings.DATABASES["default"].get("CONN_MAX_AGE", 0),
+                    "conn_health_checks": settings.DATABASES["default"].get(
+                        "CONN_HEALTH_CHECKS", False
+                    ),
+                },
+            }
+        )
+
+
+class ResultPageAPIView(APIView):
+    """API to page through a stored query result"""
+
+    def get(self, request, result_id):
+        try:
+            offset = int(request.query_params.get("offset", 0))
+            limit = int(
+                request.query_params.get(
+                    "limit", getattr(settings, "RESULT_PAGE_SIZE", 100)
+                )
+            )
+        except ValueError:
+            return Response(
+                {"error": "offset and limit must be integers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if offset < 0 or limit < 1:
+            return Response(
+                {"error": "offset must be >= 0 and limit >= 1"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        stored = result_store.get(result_id, request.query_params.get("session_id"))
+        if stored is None:
+            return Response(
+                {"error": "Result not found or expired"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        df, meta = stored
+        return Response(
+            {
+                "success": True,
+                "result_id": str(result_id),
+                **result_page(df, offset, limit),
+                "truncated": meta.get("truncated", False),
+                "total_rows": meta.get("total_rows", len(df)),
+            }
+        )
+
+
+class ResultExportAPIView(APIView):
+    """API to download a stored query result as CSV"""
+
+    EXPORT_CHUNK_ROWS = 5000
+
+    def get(self, request, result_id, session_id=None):
+        stored = result_store.get(
+            result_id, session_id or request.query_params.get("session_id")
+        )
+        if stored is None:
+            return Response(
+                {"error": "Result not found or expired"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        df = stored[0]
+
+        def csv_chunks():
+            yield df.head(0).to_csv(index=False)
+            for start in range(0, len(df), self.EXPORT_CHUNK_ROWS):
+                yield df.iloc[start : start + self.EXPORT_CHUNK_ROWS].to_csv(
+                    index=False, header=False
+                )
+
+        filename = f"query_results_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        response = StreamingHttpResponse(csv_chunks(), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
 class SaveResultsAPIView(APIView):
     def post(self, request):
         try:
+            result_id = request.data.get("result_id")
+            if result_id:
+                return ResultExportAPIView().get(
+                    request, result_id, request.data.get("session_id")
+                )
+
             results_data = request.data.get("results", [])
             if not results_data:
                 return Response(
@@ -1639,6 +5661,17 @@ class DataVisualizationAPIView(APIView):
         try:
             results_data = request.data.get("results", [])
             question = request.data.get("question", "")
+            result_id = kwargs.get("result_id") or request.data.get("result_id")
+
+            if result_id:
+                stored = result_store.get(result_id, request.data.get("session_id"))
+                if stored is None:
+                    return Response(
+                        {"error": "Result not found or expired"},
+                        status=status.HTTP_404_NOT_FOUND,
+                    )
+                # Same rows the client used to post back: the first 500, JSON-safe
+                results_data = result_page(stored[0], 0, 500)["results"]
 
             if not results_data:
                 return Response(
@@ -5,13 +5,18 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Serve with an ASGI server, e.g. ``uvicorn crud.asgi:application``. The
+async question endpoint (api/analysis/query/) then keeps one event loop and
+its connection pools for the life of the worker.
 """
 
-import os 
-from django.core.asgi import get_asgi_application 
-from whitenoise import WhiteNoise
+import os
+from django.core.asgi import get_asgi_application
+
+settings_module = 'crud.deployment' if 'WEBSITE_HOSTNAME' in os.environ else 'crud.settings'
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
 
+# WhiteNoise wraps WSGI apps only; static files stay with the WSGI deployment
 application = get_asgi_application()
-application = WhiteNoise(application)
\ No newline at end of file
@@ -78,6 +78,9 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', 'root'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Keep ORM connections open between requests
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -149,6 +152,100 @@ WSGI_APPLICATION = 'crud.wsgi.application'
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 DATABASE_URL = f"postgresql://{os.getenv('DB_USER', 'postgres')}:{os.getenv('DB_PASSWORD', 'root')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'data_analysis')}"
 
+# Optional read replicas (comma-separated URLs) for read-only analysis queries
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+# How long a replica's replay position is trusted, and how long a failed one is skipped
+REPLICA_CHECK_INTERVAL_SECONDS = float(os.getenv('REPLICA_CHECK_INTERVAL_SECONDS', '5'))
+REPLICA_RETRY_SECONDS = float(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+
+# Shared SQLAlchemy connection pool (per process)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+# psycopg pool backing chat memory
+CHAT_MEMORY_POOL_MIN_SIZE = int(os.getenv('CHAT_MEMORY_POOL_MIN_SIZE', '1'))
+CHAT_MEMORY_POOL_MAX_SIZE = int(os.getenv('CHAT_MEMORY_POOL_MAX_SIZE', '10'))
+CHAT_MEMORY_POOL_TIMEOUT = float(os.getenv('CHAT_MEMORY_POOL_TIMEOUT', '10'))
+# Chat memory sent to the LLM: the last N turns verbatim plus a rolling
+# summary of older ones, folded in batches of M turns
+CHAT_MEMORY_WINDOW_TURNS = int(os.getenv('CHAT_MEMORY_WINDOW_TURNS', '6'))
+CHAT_MEMORY_SUMMARY_BATCH_TURNS = int(os.getenv('CHAT_MEMORY_SUMMARY_BATCH_TURNS', '4'))
+CHAT_MEMORY_SUMMARY_MAX_WORDS = int(os.getenv('CHAT_MEMORY_SUMMARY_MAX_WORDS', '200'))
+# How long a fold's claim on a session holds before another fold may take over
+CHAT_MEMORY_FOLD_LEASE_SECONDS = float(os.getenv('CHAT_MEMORY_FOLD_LEASE_SECONDS', '300'))
+
+# Caps on rows fetched for a generated query (server-side cursor, fetched in batches)
+QUERY_MAX_ROWS = int(os.getenv('QUERY_MAX_ROWS', '5000'))
+QUERY_MAX_BYTES = int(os.getenv('QUERY_MAX_BYTES', str(32 * 1024 * 1024)))
+QUERY_FETCH_BATCH_ROWS = int(os.getenv('QUERY_FETCH_BATCH_ROWS', '1000'))
+# Time allowed for counting the full result of a truncated query
+QUERY_COUNT_TIMEOUT_MS = int(os.getenv('QUERY_COUNT_TIMEOUT_MS', '2000'))
+# Guard for generated queries: EXPLAIN cost/row thresholds and a statement timeout
+QUERY_MAX_PLAN_COST = float(os.getenv('QUERY_MAX_PLAN_COST', '10000000'))
+QUERY_MAX_PLAN_ROWS = int(os.getenv('QUERY_MAX_PLAN_ROWS', '1000000'))
+QUERY_STATEMENT_TIMEOUT_MS = int(os.getenv('QUERY_STATEMENT_TIMEOUT_MS', '30000'))
+
+# Approximate token budget for the schema section of SQL generation prompts
+PROMPT_SCHEMA_TOKEN_BUDGET = int(os.getenv('PROMPT_SCHEMA_TOKEN_BUDGET', '2000'))
+# Tables described when the question matches none (the rest are only named)
+PROMPT_SCHEMA_UNMATCHED_TABLES = int(os.getenv('PROMPT_SCHEMA_UNMATCHED_TABLES', '3'))
+
+# LLM call rate limit: a token bucket shared by all workers
+# (backend: postgres, file for one host, or memory for one process)
+LLM_RATE_LIMIT_BACKEND = os.getenv('LLM_RATE_LIMIT_BACKEND', 'postgres')
+LLM_RATE_LIMIT_PER_MINUTE = float(os.getenv('LLM_RATE_LIMIT_PER_MINUTE', '8'))
+LLM_RATE_LIMIT_BURST = float(os.getenv('LLM_RATE_LIMIT_BURST', '8'))
+# How long a request may wait for a slot before it gets a retry-after response
+LLM_RATE_LIMIT_WAIT_SECONDS = float(os.getenv('LLM_RATE_LIMIT_WAIT_SECONDS', '0'))
+LLM_RATE_LIMIT_DIR = os.path.join(MEDIA_ROOT, 'llm_rate_limit')
+# LLM call scheduler: concurrent calls, queue bounds and how long an async call may queue
+LLM_MAX_CONCURRENT_CALLS = int(os.getenv('LLM_MAX_CONCURRENT_CALLS', '4'))
+LLM_QUEUE_MAX_DEPTH = int(os.getenv('LLM_QUEUE_MAX_DEPTH', '32'))
+LLM_QUEUE_MAX_PER_SESSION = int(os.getenv('LLM_QUEUE_MAX_PER_SESSION', '4'))
+LLM_QUEUE_WAIT_SECONDS = float(os.getenv('LLM_QUEUE_WAIT_SECONDS', '20'))
+# Sync (WSGI) calls get a 429 at once unless allowed to queue this long
+LLM_QUEUE_SYNC_WAIT_SECONDS = float(os.getenv('LLM_QUEUE_SYNC_WAIT_SECONDS', '0'))
+# Slots one session may hold at once when calls are admitted without queueing
+LLM_MAX_ACTIVE_PER_SESSION = int(os.getenv('LLM_MAX_ACTIVE_PER_SESSION', '2'))
+
+# Question -> SQL cache (per process, backed by the question_sql_cache table)
+QUESTION_CACHE_ENABLED = os.getenv('QUESTION_CACHE_ENABLED', 'true').lower() == 'true'
+QUESTION_CACHE_MAX_ENTRIES = int(os.getenv('QUESTION_CACHE_MAX_ENTRIES', '1024'))
+
+# Per-process cache of conversational agents, keyed by session and dataset
+AGENT_CACHE_MAX_ENTRIES = int(os.getenv('AGENT_CACHE_MAX_ENTRIES', '256'))
+AGENT_CACHE_TTL_SECONDS = int(os.getenv('AGENT_CACHE_TTL_SECONDS', '1800'))
+
+# Upload ingestion
+UPLOAD_COPY_CHUNK_ROWS = int(os.getenv('UPLOAD_COPY_CHUNK_ROWS', '50000'))
+# Files at least this large are parsed and loaded in bounded-memory streaming mode
+UPLOAD_STREAMING_THRESHOLD_BYTES = int(os.getenv('UPLOAD_STREAMING_THRESHOLD_BYTES', str(100 * 1024 * 1024)))
+# Process pool size for parsing the sheets of a workbook in parallel (1 disables)
+UPLOAD_SHEET_WORKERS = int(os.getenv('UPLOAD_SHEET_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Uploads are ingested by a background job runner; set UPLOAD_ASYNC=false to ingest inside the request
+UPLOAD_ASYNC = os.getenv('UPLOAD_ASYNC', 'true').lower() == 'true'
+UPLOAD_JOB_WORKERS = int(os.getenv('UPLOAD_JOB_WORKERS', '2'))
+UPLOAD_JOB_DIR = os.path.join(MEDIA_ROOT, 'upload_jobs')
+# Running jobs refresh updated_at this often; queued/running jobs silent for
+# UPLOAD_JOB_STALE_SECONDS (restart, recycled worker) are marked failed
+UPLOAD_JOB_HEARTBEAT_SECONDS = int(os.getenv('UPLOAD_JOB_HEARTBEAT_SECONDS', '30'))
+UPLOAD_JOB_STALE_SECONDS = int(os.getenv('UPLOAD_JOB_STALE_SECONDS', '300'))
+
+# Server-side query results, served by result id in pages
+RESULT_STORE_DIR = os.path.join(MEDIA_ROOT, 'result_store')
+RESULT_STORE_MAX_MEMORY_BYTES = int(os.getenv('RESULT_STORE_MAX_MEMORY_BYTES', str(128 * 1024 * 1024)))
+RESULT_STORE_TTL_SECONDS = int(os.getenv('RESULT_STORE_TTL_SECONDS', '1800'))
+RESULT_PAGE_SIZE = int(os.getenv('RESULT_PAGE_SIZE', '100'))
+RESULT_PAGE_MAX_SIZE = int(os.getenv('RESULT_PAGE_MAX_SIZE', '1000'))
+# Post-load ANALYZE and indexing of uploaded tables
+UPLOAD_OPTIMIZE_TIME_BUDGET_SECONDS = float(os.getenv('UPLOAD_OPTIMIZE_TIME_BUDGET_SECONDS', '30'))
+UPLOAD_INDEX_MIN_ROWS = int(os.getenv('UPLOAD_INDEX_MIN_ROWS', '10000'))
+UPLOAD_MAX_INDEXES_PER_TABLE = int(os.getenv('UPLOAD_MAX_INDEXES_PER_TABLE', '4'))
+# Per-upload dataset schemas and their garbage collection
+UPLOAD_DATASET_TTL_HOURS = float(os.getenv('UPLOAD_DATASET_TTL_HOURS', '24'))
+UPLOAD_SCHEMA_DROP_LOCK_TIMEOUT_MS = int(os.getenv('UPLOAD_SCHEMA_DROP_LOCK_TIMEOUT_MS', '2000'))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
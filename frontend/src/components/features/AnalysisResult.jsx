@@ -4,11 +4,13 @@ import {
   FileSpreadsheet,
   TrendingUp,
   Activity,
+  Download,
 } from 'lucide-react';
-import { useMemo } from 'react';
+import { useEffect, useMemo, useState } from 'react';
 import PropTypes from 'prop-types';
-import { Card, LoadingSpinner } from '../common';
+import { Button, Card, LoadingSpinner } from '../common';
 import { DataVisualization, ResultsTable, AdvancedCharts, InsightsPanel } from '../features';
+import { getResultPage, getResultExportUrl } from '../../services/api';
 
 export const AnalysisResult = ({ result, visualizations, loadingViz }) => {
   const analysisData = useMemo(() => {
@@ -38,6 +40,34 @@ export const AnalysisResult = ({ result, visualizations, loadingViz }) => {
     };
   }, [result]);
 
+  // Further pages of the stored result, fetched on demand
+  const [moreRows, setMoreRows] = useState([]);
+  const [nextOffset, setNextOffset] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  useEffect(() => {
+    setMoreRows([]);
+    setNextOffset(result?.next_offset ?? null);
+  }, [result]);
+
+  const tableRows = useMemo(
+    () => [...(result?.results || []), ...moreRows],
+    [result, moreRows]
+  );
+
+  const loadMoreRows = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await getResultPage(result.result_id, nextOffset, undefined, result.session_id);
+      setMoreRows((prev) => [...prev, ...page.results]);
+      setNextOffset(page.next_offset);
+    } catch (e) {
+      console.error('Load more error:', e);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (!result) return null;
 
   return (
@@ -112,14 +142,40 @@ export const AnalysisResult = ({ result, visualizations, loadingViz }) => {
                   <FileSpreadsheet className="w-4 h-4 text-pink-400" />
                   <h3 className="text-sm font-medium text-gray-200">Raw Data</h3>
               </div>
-              <div className="flex gap-4 text-xs text-gray-500">
-                  <span>{analysisData.rowCount} rows</span>
+              <div className="flex items-center gap-4 text-xs text-gray-500">
+                  <span>
+                    {tableRows.length < (result.row_count ?? tableRows.length)
+                      ? `${tableRows.length} of ${result.row_count} rows`
+                      : `${tableRows.length} rows`}
+                    {result.truncated &&
+                      ` (capped, ${result.total_rows ?? 'more'} in total)`}
+                  </span>
                   <span>{analysisData.columnCount} columns</span>
+                  {result.result_id && (
+                    <a
+                      href={getResultExportUrl(result.result_id, result.session_id)}
+                      className="flex items-center gap-1 hover:text-gray-300"
+                    >
+                      <Download className="w-3 h-3" /> CSV
+                    </a>
+                  )}
               </div>
             </div>
             <div className="max-h-[400px] overflow-auto">
-              <ResultsTable data={result.results} />
+              <ResultsTable data={tableRows} />
             </div>
+            {result.result_id && nextOffset != null && (
+              <div className="p-3 border-t border-gray-800 flex justify-center">
+                <Button
+                  variant="ghost"
+                  size="sm"
+                  onClick={loadMoreRows}
+                  disabled={loadingMore}
+                >
+                  {loadingMore ? 'Loading...' : 'Load more rows'}
+                </Button>
+              </div>
+            )}
           </Card>
         )}
       </div>
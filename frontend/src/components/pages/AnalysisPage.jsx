@@ -118,6 +118,8 @@ export const AnalysisPage = ({ selectedQuestion = '', urlSessionId = null, onBac
   };
 
   const [isFileUploaded, setIsFileUploaded] = useState(false);
+  // Dataset the questions in this chat run against
+  const [uploadId, setUploadId] = useState(null);
 
   const handleFileUpload = async (uploadFileParam) => {
     const fileToUpload = uploadFileParam || file;
@@ -129,9 +131,10 @@ export const AnalysisPage = ({ selectedQuestion = '', urlSessionId = null, onBac
     setIsFileUploaded(false);
 
     try {
-      await uploadFile(fileToUpload, sessionIdState, (progress) => {
+      const uploaded = await uploadFile(fileToUpload, sessionIdState, (progress) => {
         setUploadProgress(progress);
       });
+      setUploadId(uploaded?.upload_id || null);
 
       setIsFileUploaded(true);
       setTimeout(() => {
@@ -239,7 +242,7 @@ export const AnalysisPage = ({ selectedQuestion = '', urlSessionId = null, onBac
                if (data.results && data.results.length > 0) {
                     setLoadingViz(true);
                     try {
-                        const vizData = await generateVisualizations(data.results, queryText);
+                        const vizData = await generateVisualizations(data.results, queryText, uploadId, data.result_id, currentSessionId);
                         setChatItems(prev => prev.map(item => 
                             item.id === aiItemId 
                                 ? { ...item, visualizations: vizData } 
@@ -259,7 +262,7 @@ export const AnalysisPage = ({ selectedQuestion = '', urlSessionId = null, onBac
                setLoading(false);
                abortControllerRef.current = null;
           }
-      }, controller.signal); // Pass signal
+      }, controller.signal, uploadId); // Pass signal
 
     } catch (error) {
       console.error('Analysis error:', error);
@@ -1,5 +1,10 @@
 export const API_CONFIG = {
   BASE_URL: import.meta.env.VITE_API_URL || "http://localhost:8000",
+  // Questions go to the async endpoint when the backend is served over ASGI
+  ANALYSIS_PATH:
+    import.meta.env.VITE_ASYNC_ANALYSIS === "true"
+      ? "/api/analysis/query/"
+      : "/api/analysis/",
   TIMEOUT: 30000,
 };
 
@@ -30,6 +30,11 @@ export const uploadFile = async (file, sessionId, onProgress) => {
         }
       },
     });
+
+    // Large uploads are ingested in the background - wait for the job to finish
+    if (response.status === 202 && response.data.upload_id) {
+      return await waitForUpload(response.data.upload_id);
+    }
     return response.data;
   } catch (error) {
     console.error('Upload error:', error);
@@ -37,11 +42,55 @@ export const uploadFile = async (file, sessionId, onProgress) => {
   }
 };
 
-export const executeAnalysis = async (query, sessionId) => {
+export const getUploadStatus = async (uploadId) => {
+  try {
+    const response = await api.get(`/api/uploads/${uploadId}/`);
+    return response.data;
+  } catch (error) {
+    console.error('Get upload status error:', error);
+    throw error;
+  }
+};
+
+export const cancelUpload = async (uploadId) => {
+  try {
+    const response = await api.post(`/api/uploads/${uploadId}/cancel/`);
+    return response.data;
+  } catch (error) {
+    console.error('Cancel upload error:', error);
+    throw error;
+  }
+};
+
+export const getUploadProfile = async (uploadId) => {
   try {
-    const response = await api.post('/api/analysis/', {
+    const response = await api.get(`/api/uploads/${uploadId}/profile/`);
+    return response.data;
+  } catch (error) {
+    console.error('Get upload profile error:', error);
+    throw error;
+  }
+};
+
+const waitForUpload = async (uploadId, intervalMs = 1000) => {
+  while (true) {
+    const job = await getUploadStatus(uploadId);
+    if (job.status === 'completed') {
+      return job;
+    }
+    if (job.status === 'failed' || job.status === 'cancelled') {
+      throw new Error(job.error || `Upload ${job.status}`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
+
+export const executeAnalysis = async (query, sessionId, uploadId) => {
+  try {
+    const response = await api.post(API_CONFIG.ANALYSIS_PATH, {
       query: query,
       session_id: sessionId,
+      upload_id: uploadId,
     });
     return response.data;
   } catch (error) {
@@ -50,14 +99,25 @@ export const executeAnalysis = async (query, sessionId) => {
   }
 };
 
-export const generateVisualizations = async (results, question) => {
+export const generateVisualizations = async (results, question, uploadId, resultId, sessionId) => {
   try {
+    // A stored result is visualized by handle instead of posting its rows back
+    if (resultId) {
+      const response = await api.post(`/api/results/${resultId}/visualize/`, {
+        question: question,
+        upload_id: uploadId,
+        session_id: sessionId,
+      });
+      return response.data;
+    }
+
     // Limit data sent to backend - only send first 1000 rows for visualization
     const limitedResults = results.length > 1000 ? results.slice(0, 1000) : results;
     
     const response = await api.post('/api/visualize/', {
       results: limitedResults,
       question: question,
+      upload_id: uploadId,
     });
     return response.data;
   } catch (error) {
@@ -66,6 +126,23 @@ export const generateVisualizations = async (results, question) => {
   }
 };
 
+export const getResultPage = async (resultId, offset = 0, limit, sessionId) => {
+  try {
+    const response = await api.get(`/api/results/${resultId}/`, {
+      params: { offset, limit, session_id: sessionId },
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Get result page error:', error);
+    throw error;
+  }
+};
+
+// Results are served only to the session that asked for them
+export const getResultExportUrl = (resultId, sessionId) =>
+  `${API_CONFIG.BASE_URL}/api/results/${resultId}/export/` +
+  (sessionId ? `?session_id=${encodeURIComponent(sessionId)}` : '');
+
 export const saveResults = async (results) => {
   try {
     const response = await api.post('/api/save-results/', {
@@ -106,16 +183,16 @@ export const getChatHistory = async (sessionId) => {
 };
 
 // Stream Analysis
-export const streamAnalysis = async (query, sessionId, callbacks, signal) => {
+export const streamAnalysis = async (query, sessionId, callbacks, signal, uploadId) => {
     const { onToken, onStatus, onComplete, onError } = callbacks;
     
     try {
-        const response = await fetch(`${API_CONFIG.BASE_URL}/api/analysis/`, {
+        const response = await fetch(`${API_CONFIG.BASE_URL}${API_CONFIG.ANALYSIS_PATH}`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ query, session_id: sessionId, stream: true }),
+            body: JSON.stringify({ query, session_id: sessionId, upload_id: uploadId, stream: true }),
             signal: signal 
         });
 